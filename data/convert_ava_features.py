@@ -0,0 +1,47 @@
+import os
+import glob
+import pickle  #nosec
+import argparse
+from gravit.utils.parallel import run_and_report
+from gravit.utils.feature_store import get_columns, save_columns, get_columns_path
+
+
+def convert_features(data_file):
+    """
+    Convert the feature pickle of a single video into its columnar file
+    """
+
+    with open(data_file, 'rb') as f:
+        data = pickle.load(f)  #nosec
+
+    columns = get_columns(data)
+    save_columns(columns, get_columns_path(data_file))
+
+    return len(columns['global_id'])
+
+
+if __name__ == "__main__":
+    """
+    Convert the AVA feature pickles (data/features/<features>/<train|val>/<video_id>.pkl) into columnar files
+    (<video_id>.npz next to each pickle), which are then read by the graph generation and the evaluation formatting
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root_data',     type=str,   help='Root directory to the data', default='./data')
+    parser.add_argument('--features',      type=str,   help='Name of the features', required=True)
+    parser.add_argument('--num_workers',   type=int,   help='Number of processes for the conversion', default=20)
+    parser.add_argument('--force',         help='Convert every video even if it is up to date', action="store_true")
+
+    args = parser.parse_args()
+
+    for sp in ['train', 'val']:
+        list_data_files = sorted(glob.glob(os.path.join(args.root_data, f'features/{args.features}/{sp}/*.pkl')))
+        num_files = len(list_data_files)
+        if not args.force:
+            list_data_files = [data_file for data_file in list_data_files
+                               if not os.path.exists(get_columns_path(data_file)) or os.path.getmtime(get_columns_path(data_file)) < os.path.getmtime(data_file)]
+        print(f'Number of videos to convert for {sp}: {len(list_data_files)} out of {num_files}')
+
+        num_entities = run_and_report(convert_features, list_data_files, num_workers=args.num_workers)
+
+        print(f'Conversion for {sp} is finished (number of entities: {sum(num_entities)})')
@@ -0,0 +1,65 @@
+import os
+import glob
+import argparse
+import numpy as np
+from functools import partial
+from gravit.utils.data_loader import load_features
+from gravit.utils.parallel import run_and_report
+
+
+def convert_features(data_file, path_output, dtype):
+    """
+    Save the features of a single video with another dtype
+    Returns the size of the converted file
+    """
+
+    feature = load_features(data_file)
+    converted = feature.astype(dtype)
+    if not np.all(np.isfinite(converted[np.isfinite(feature)])):
+        raise ValueError(f'The features of {data_file} are out of the range of {np.dtype(dtype).name}')
+
+    os.makedirs(os.path.dirname(path_output), exist_ok=True)
+    path_tmp = f'{path_output}.tmp{os.getpid()}'
+    with open(path_tmp, 'wb') as f:
+        np.save(f, converted)
+    os.replace(path_tmp, path_output)
+
+    return os.path.getsize(path_output)
+
+
+if __name__ == "__main__":
+    """
+    Convert the features of data/features/<features> (and of their exo views in data/features/<features>-exo)
+    to another dtype, e.g. float16 to halve their size on the disk and in the page cache
+    The converted features are saved as data/features/<features>-<dtype> (and <features>-<dtype>-exo), which are
+    then used by setting "features_dataset" in the config (or --features); they are converted back to float32
+    in memory when the graphs are built
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root_data',     type=str,   help='Root directory to the data', default='./data')
+    parser.add_argument('--features',      type=str,   help='Name of the features', required=True)
+    parser.add_argument('--dtype',         type=str,   help='dtype of the converted features', default='float16')
+    parser.add_argument('--num_workers',   type=int,   help='Number of processes for the conversion', default=20)
+    parser.add_argument('--force',         help='Convert every video even if it is up to date', action="store_true")
+
+    args = parser.parse_args()
+
+    dtype = np.dtype(args.dtype)
+    for suffix in ['', '-exo']:
+        path_features = os.path.join(args.root_data, f'features/{args.features}{suffix}')
+        if not os.path.isdir(path_features):
+            continue
+
+        path_output = os.path.join(args.root_data, f'features/{args.features}-{dtype.name}{suffix}')
+        list_data_files = sorted(glob.glob(os.path.join(path_features, '**/*.npy'), recursive=True))
+        job_kwargs = {data_file: {'path_output': os.path.join(path_output, os.path.relpath(data_file, path_features))} for data_file in list_data_files}
+        num_files = len(list_data_files)
+        if not args.force:
+            list_data_files = [data_file for data_file in list_data_files if not os.path.exists(job_kwargs[data_file]['path_output'])
+                               or os.path.getmtime(job_kwargs[data_file]['path_output']) < os.path.getmtime(data_file)]
+        print(f'Number of videos to convert in {path_features}: {len(list_data_files)} out of {num_files}')
+
+        sizes = run_and_report(partial(convert_features, dtype=dtype), list_data_files, num_workers=args.num_workers, job_kwargs=job_kwargs)
+
+        print(f'Conversion to {path_output} is finished ({sum(sizes) / 2**20:.1f} MB)')
@@ -0,0 +1,81 @@
+import os
+import glob
+import torch
+import shutil
+import argparse
+from torch_geometric.data import Data
+from gravit.utils.graph_shards import GraphShardWriter
+from gravit.datasets.dataset_context_reasoning import get_graph_files
+
+
+def convert_graphs(path_graphs, path_shard):
+    """
+    Pack all the graphs of a subset (directory of .pt files or split manifest of the graph store) into a shard directory
+    """
+
+    list_graph_files = get_graph_files(path_graphs)
+
+    # Write to a temporary directory first so that an interrupted conversion never leaves a partial shard
+    path_tmp = f'{path_shard}.tmp{os.getpid()}'
+    writer = GraphShardWriter(path_tmp)
+    for graph_file in list_graph_files:
+        data = torch.load(graph_file)
+        if not isinstance(data, Data):
+            shutil.rmtree(path_tmp)
+            raise ValueError(f'{graph_file} is a {type(data).__name__}, only homogeneous graphs (Data) can be packed into a shard')
+        writer.append(os.path.splitext(os.path.basename(graph_file))[0], data)
+    writer.close()
+
+    if os.path.isdir(path_shard):
+        shutil.rmtree(path_shard)
+    os.replace(path_tmp, path_shard)
+
+    return len(list_graph_files)
+
+
+def is_up_to_date(path_graphs, path_shard):
+    """
+    Check whether the shard is newer than every graph of the subset
+    """
+
+    path_index = os.path.join(path_shard, 'index.json')
+    if not os.path.exists(path_index):
+        return False
+
+    mtime_shard = os.path.getmtime(path_index)
+    list_files = get_graph_files(path_graphs) + [path for path in (path_graphs, f'{path_graphs}.txt') if os.path.exists(path)]
+    return all(os.path.getmtime(f) <= mtime_shard for f in list_files)
+
+
+if __name__ == "__main__":
+    """
+    Convert the graphs of data/graphs/<graph_name> (one .pt file per video) into packed shards:
+    every directory holding .pt files (e.g. split1/train) or split manifest of the graph store (e.g. split1/train.txt)
+    gets a sibling shard directory (e.g. split1/train.shard)
+    Train with the shards by setting "graph_format: shard" in the configuration
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root_data',     type=str,   help='Root directory to the data', default='./data')
+    parser.add_argument('--graph_name',    type=str,   help='Name of the graphs to convert', required=True)
+    parser.add_argument('--force',         help='Rebuild the shards even if they are up to date', action="store_true")
+
+    args = parser.parse_args()
+
+    path_graphs_root = os.path.join(args.root_data, f'graphs/{args.graph_name}')
+    # The graph store itself is only packed through the split manifests that refer to it
+    list_dirs = {os.path.dirname(f) for f in glob.glob(os.path.join(path_graphs_root, '**/*.pt'), recursive=True)}
+    list_dirs.discard(os.path.join(path_graphs_root, 'store'))
+    list_dirs = sorted(list_dirs | {os.path.splitext(f)[0] for f in glob.glob(os.path.join(path_graphs_root, '*/*.txt'))})
+    if not list_dirs:
+        raise ValueError(f'No graphs found under {path_graphs_root}')
+
+    for path_graphs in list_dirs:
+        path_shard = f'{os.path.normpath(path_graphs)}.shard'
+        if not args.force and is_up_to_date(path_graphs, path_shard):
+            print(f'{path_shard} is up to date')
+            continue
+
+        num_graphs = convert_graphs(path_graphs, path_shard)
+        size = sum(os.path.getsize(f) for f in glob.glob(os.path.join(path_shard, '*')))
+        print(f'Packed {num_graphs} graphs from {path_graphs} into {path_shard} ({size / 2**20:.1f} MB)')
@@ -1,26 +1,19 @@
 import os
-import glob
 import torch
 import argparse
 import numpy as np
 from functools import partial
-from multiprocessing import Pool
 from torch_geometric.data import Data
 from gravit.utils.data_loader import *
+from gravit.utils.graph_builder import get_video_edges, get_frame_aligned_edges
 from gravit.utils.parser import get_args, get_cfg
+from gravit.utils.parallel import run_and_report
+from gravit.utils.manifest import GraphManifest
+from gravit.utils.graph_metadata import save_graph, update_graph_metadata
+from gravit.utils.catalog import DatasetCatalog
 from torch_geometric.data import HeteroData
 
-def compute_similarity_metric(node_i, node_j, metric):
-    if metric == 'cosine':
-        return np.dot(node_i, node_j) / (np.linalg.norm(node_i) * np.linalg.norm(node_j))
-    elif metric == 'gaussian':
-        sigma = 2
-        return np.exp(-np.linalg.norm(node_i - node_j) ** 2 / (2 * (sigma ** 2)))
-    elif metric == 'inner_product':
-        return np.dot(node_i, node_j)
-
-
-def generate_heterogeneous_temporal_graph(data_file, args, path_graphs, actions, train_ids, all_ids, list_multiview_data_files=[]):
+def generate_heterogeneous_temporal_graph(data_file, args, path_graphs, actions, train_ids, global_ids, list_multiview_data_files=[]):
     """
     Generate heterogeneous temporal graphs of a single video
     """
@@ -33,7 +26,7 @@ def generate_heterogeneous_temporal_graph(data_file, args, path_graphs, actions,
     feature = load_features(data_file)
     list_feature_multiview = []
     for multiview_data_file in list_multiview_data_files:
-        feature_multiview = np.load(multiview_data_file)
+        feature_multiview = load_features(multiview_data_file)
         assert feature.shape == feature_multiview.shape, f'feature.shape: {feature.shape}, feature_multiview.shape: {feature_multiview.shape}'
         list_feature_multiview.append(feature_multiview)
 
@@ -68,8 +61,7 @@ def generate_heterogeneous_temporal_graph(data_file, args, path_graphs, actions,
         batch_idx_path = os.path.join(args.root_data, 'annotations', args.dataset, 'batch_idx')
         untrimmed_batch_idxs = load_batch_indices(batch_idx_path, take_name)
         batch_idx_designation = [i for i in untrimmed_batch_idxs if i != -1]
-        label = get_segment_labels_by_batch_idxs(label, batch_idx_designation=batch_idx_designation)
-        label = [mode(label[i]) for i in range(len(label))]
+        label = reduce_segments(batch_idx_designation, label=label)[1].tolist()
 
 
 
@@ -77,73 +69,14 @@ def generate_heterogeneous_temporal_graph(data_file, args, path_graphs, actions,
     # print(f'take_name: {take_name} | Num Frames: {num_frame} | Num Labels: {len(label)}')
 
     # # Get a list of the edge information: these are for edge_index and edge_attr
-    counter_similarity_edges_added = 0
-    node_source = []
-    node_target = []
-    edge_attr = []
+    num_view = len(list_feature_multiview)+1
+    node_source, node_target, edge_attr, counter_similarity_edges_added = get_video_edges(feature, args.tauf, skip_factor=skip, num_view=num_view,
+        similarity_metric=args.similarity_metric, similarity_threshold=args.similarity_threshold, similarity_topk=args.similarity_topk, add_exo_edges=False, path_cache=args.path_templates)
 
-    hetero_node_source = []
-    hetero_node_target = []
-    hetero_edge_attr = []
+    # add edges between heterogenous nodes (text to ego) in the same frame
+    hetero_node_source, hetero_node_target = get_frame_aligned_edges([num_frame if args.add_text else 0])
+    hetero_edge_attr = np.full(len(hetero_node_source), -1, dtype=np.float32)
 
-    num_view = len(list_feature_multiview)+1
-    for i in range(num_frame):
-        for j in range(num_frame):
-            # Frame difference between the i-th and j-th nodes
-            frame_diff = i - j
-
-            # The edge ij connects the i-th node and j-th node
-            # Positive edge_attr indicates that the edge ij is backward (negative: forward)
-            if abs(frame_diff) <= args.tauf:
-                node_source.append(i)
-                node_target.append(j)
-                edge_attr.append(np.sign(frame_diff))
-
-                # add edges between the same view in different frames
-                for k in range(1, num_view):
-                    node_source.append(i+num_frame*k)
-                    node_target.append(j+num_frame*k)
-                    edge_attr.append(np.sign(frame_diff))
-
-                # add edges between different views in the same frame
-                if frame_diff == 0:
-                    for k in range(1, num_view):
-                        node_source.append(i)
-                        node_target.append(j+num_frame*k)
-                        edge_attr.append(-2)
-
-                # add edges between heterogenous nodes (text to ego) in the same frame
-                if frame_diff == 0:
-                    if args.add_text:
-                        hetero_node_source.append(i)
-                        hetero_node_target.append(j)
-                        hetero_edge_attr.append(-1)
-                        
-
-            # Make additional connections between non-adjacent nodes
-            # This can help reduce over-segmentation of predictions in some cases
-            elif skip:
-                if (frame_diff % skip == 0) and (abs(frame_diff) <= skip*args.tauf):
-                    node_source.append(i)
-                    node_target.append(j)
-                    edge_attr.append(np.sign(frame_diff))
-
-                    for k in range(num_view):
-                        node_source.append(i+num_frame)
-                        node_target.append(j+num_frame)
-                        edge_attr.append(np.sign(frame_diff))
-
-            # Add similarity-based connections
-            # print(args.similarity_metric)
-            if args.similarity_metric is not None and i != j:
-                similarity = compute_similarity_metric(feature[i], feature[j], metric=args.similarity_metric)
-                if similarity > args.similarity_threshold:
-                    # print(f'Adding similarity edge between {i} and {j} with similarity {similarity}')
-                    node_source.append(i)
-                    node_target.append(j)
-                    edge_attr.append(np.sign(frame_diff))  # try 0
-                    counter_similarity_edges_added += 1
-    
     if args.similarity_metric is not None:
         print(f'{counter_similarity_edges_added} similarity edges | {len(node_source) - counter_similarity_edges_added} | ' + "{:.1f}%".format(counter_similarity_edges_added / len(node_source) * 100) + " % of Total edges")
 
@@ -153,30 +86,37 @@ def generate_heterogeneous_temporal_graph(data_file, args, path_graphs, actions,
     # edge_attr: information about whether the edge is spatial (0) or temporal (positive: backward, negative: forward)
     # y: labels
 
+    # Every view is written directly into the node features
+    x = assemble_features([feature] + list_feature_multiview)
     if num_view > 1:
-        feature_multiview = np.concatenate(list_feature_multiview)
-        feature = np.concatenate((np.array(feature, dtype=np.float32), feature_multiview))
         label = label*num_view
      
     
     graphs = HeteroData()
 
+    # The relations with the same edges share the same tensors, which are then saved only once
+    # (SharedEdgeLoader also batches them only once)
+    edge_index = torch.from_numpy(np.stack((node_source, node_target)))
+    edge_attr = torch.tensor(edge_attr)
+    hetero_edge_index = torch.from_numpy(np.stack((hetero_node_source, hetero_node_target)))
+    hetero_edge_attr = torch.from_numpy(hetero_edge_attr)
+
     # define node types and their feature matrix [num_nodes, num_features]
-    graphs['omnivore'].x = torch.tensor(np.array(feature, dtype=np.float32), dtype=torch.float32)
-    graphs['omnivore', 'to', 'omnivore'].edge_index = torch.tensor(np.array([node_source, node_target], dtype=np.int32), dtype=torch.long)
-    graphs['omnivore', 'to', 'omnivore'].edge_attr = torch.tensor(edge_attr, dtype=torch.float32)
-    g = all_ids.index(take_name)
+    graphs['omnivore'].x = torch.from_numpy(x)
+    graphs['omnivore', 'to', 'omnivore'].edge_index = edge_index
+    graphs['omnivore', 'to', 'omnivore'].edge_attr = edge_attr
+    g = global_ids[take_name]
     graphs['omnivore'].g = torch.tensor([g], dtype=torch.long)
 
     graphs['text'].x = torch.tensor(np.array(text_feature, dtype=np.float32), dtype=torch.float32)
-    graphs['omnivore', 'to', 'text'].edge_index = torch.tensor(np.array([hetero_node_source, hetero_node_target], dtype=np.int32), dtype=torch.long)
-    graphs['omnivore', 'to', 'text'].edge_attr = torch.tensor(hetero_edge_attr, dtype=torch.float32)
+    graphs['omnivore', 'to', 'text'].edge_index = hetero_edge_index
+    graphs['omnivore', 'to', 'text'].edge_attr = hetero_edge_attr
 
-    graphs['text', 'to', 'omnivore'].edge_index = torch.tensor(np.array([hetero_node_source, hetero_node_target], dtype=np.int32), dtype=torch.long)
-    graphs['text', 'to', 'omnivore'].edge_attr = torch.tensor(hetero_edge_attr, dtype=torch.float32)
+    graphs['text', 'to', 'omnivore'].edge_index = hetero_edge_index
+    graphs['text', 'to', 'omnivore'].edge_attr = hetero_edge_attr
 
-    graphs['text', 'to', 'text'].edge_index = torch.tensor(np.array([node_source, node_target], dtype=np.int32), dtype=torch.long)
-    graphs['text', 'to', 'text'].edge_attr = torch.tensor(edge_attr, dtype=torch.float32)
+    graphs['text', 'to', 'text'].edge_index = edge_index
+    graphs['text', 'to', 'text'].edge_attr = edge_attr
 
 
     # labels for omnivore nodes 
@@ -187,9 +127,30 @@ def generate_heterogeneous_temporal_graph(data_file, args, path_graphs, actions,
 
 
     if take_name in train_ids:
-        torch.save(graphs, os.path.join(path_graphs, 'train', f'{take_name}.pt'))
+        path_graph = os.path.join(path_graphs, 'train', f'{take_name}.pt')
     else:
-        torch.save(graphs, os.path.join(path_graphs, 'val', f'{take_name}.pt'))
+        path_graph = os.path.join(path_graphs, 'val', f'{take_name}.pt')
+
+    return save_graph(graphs, path_graph)
+
+
+def get_input_files(data_file, args, list_multiview_data_files=[]):
+    """
+    Get the list of the files that the graph of a single video is generated from
+    """
+
+    take_name = os.path.splitext(os.path.basename(data_file))[0]
+    list_input_files = [data_file, os.path.join(args.root_data, f'annotations/{args.dataset}/mapping.txt')] + list(list_multiview_data_files)
+
+    if args.add_text:
+        list_input_files.append(os.path.join(args.text_dir, take_name + '.npy'))
+
+    # Labels and batch indices may be named after the take without its view suffix
+    for video_id in (take_name, take_name.rsplit('_', 1)[0]):
+        list_input_files.append(os.path.join(args.root_data, f'annotations/{args.dataset}/groundTruth/{video_id}.txt'))
+        list_input_files.append(os.path.join(args.root_data, 'annotations', args.dataset, 'batch_idx', f'{video_id}.txt'))
+
+    return list_input_files
 
 
 if __name__ == "__main__":
@@ -211,6 +172,9 @@ if __name__ == "__main__":
     parser.add_argument('--add_multiview',   help='Whether to add multiview features', action="store_true")
     parser.add_argument('--add_text',   help='Whether to add text features', action="store_true")
     parser.add_argument('--crop',   type=bool,   help='Crop action_start and action_end', default=False)
+    parser.add_argument('--num_workers',   type=int,   help='Number of processes for the graph generation', default=20)
+    parser.add_argument('--force',         help='Regenerate every graph even if it is up to date', action="store_true")
+    parser.add_argument('--path_templates', type=str,  help='Directory to cache the edge templates on disk (default: templates only cached in memory)')
     
     args = parser.parse_args()
 
@@ -234,9 +198,19 @@ if __name__ == "__main__":
         args.similarity_metric = None
     if cfg['similarity_threshold'] is not None:
         args.similarity_threshold = cfg['similarity_threshold']
+    args.similarity_topk = cfg.get('similarity_topk')
+    if args.similarity_topk == 'None':
+        args.similarity_topk = None
 
-    print(f'Tauf: {args.tauf} | Skip Factor: {args.skip_factor} | Similarity Metric: {args.similarity_metric} | Similarity Threshold: {args.similarity_threshold}')
+    print(f'Tauf: {args.tauf} | Skip Factor: {args.skip_factor} | Similarity Metric: {args.similarity_metric} | Similarity Threshold: {args.similarity_threshold} | Similarity Top-k: {args.similarity_topk}')
     print(f'Features: {args.features} | Dataset: {args.dataset}')
+
+    # Only the graphs whose input files or graph parameters changed are regenerated
+    graph_params = {k: getattr(args, k, None) for k in ('tauf', 'skip_factor', 'similarity_metric', 'similarity_threshold', 'similarity_topk', 'sample_rate', 'add_multiview', 'add_text')}
+    graph_params['load_segmentwise'] = cfg['load_segmentwise']
+    graph_params['text_dataset'] = cfg.get('text_dataset')
+    manifest = GraphManifest(os.path.join(args.root_data, f'graphs/{cfg["graph_name"]}'), graph_params)
+
     # Build a mapping from action classes to action ids
     actions = {}
     with open(os.path.join(args.root_data, f'annotations/{args.dataset}/mapping.txt')) as f:
@@ -244,20 +218,19 @@ if __name__ == "__main__":
             aid, cls = line.strip().split(' ')
             actions[cls] = int(aid)
 
-    # Get a list of all video ids
-    all_ids = sorted([os.path.splitext(v)[0] for v in os.listdir(os.path.join(args.root_data, f'annotations/{args.dataset}/groundTruth'))])
+    # Index of the video ids, splits and feature files
+    catalog = DatasetCatalog(args.root_data, args.dataset)
+    global_ids = catalog.get_global_ids()
  
     # Iterate over different splits
     print ('This process might take a few minutes')
 
-    list_splits = sorted(os.listdir(os.path.join(args.root_data, f'features/{args.features}')))
+    list_splits = catalog.get_splits(args.features)
 
     for split in list_splits:
         # Get a list of training video ids
-        print(f'Reading splits at {os.path.join(args.root_data, f"annotations/{args.dataset}/splits/train.{split}.bundle")}')
-        with open(os.path.join(args.root_data, f'annotations/{args.dataset}/splits/train.{split}.bundle')) as f:
-            train_ids = [os.path.splitext(line.strip())[0] for line in f]
-            print(f'Number of training videos: {len(train_ids)}')
+        train_ids = set(catalog.get_train_ids(split))
+        print(f'Number of training videos: {len(train_ids)}')
 
         # path_graphs = os.path.join(args.root_data, f'graphs/{args.features}_{args.tauf}_{args.skip_factor}/{split}')
         path_graphs = os.path.join(args.root_data, f'graphs/{cfg["graph_name"]}/{split}')
@@ -265,16 +238,16 @@ if __name__ == "__main__":
         os.makedirs(os.path.join(path_graphs, 'train'), exist_ok=True)
         os.makedirs(os.path.join(path_graphs, 'val'), exist_ok=True)
 
-        list_data_files = sorted(glob.glob(os.path.join(args.root_data, f'features/{args.features}/{split}/*/*.npy')))
+        list_data_files = catalog.get_feature_files(args.features, split)
         multiview_data_files = {}
         if args.add_multiview:
-            for multiview_data in sorted(glob.glob(os.path.join(args.root_data, f'features/{args.features}-exo/{split}/*/*.npy'))):
+            for multiview_data in catalog.get_feature_files(f'{args.features}-exo', split):
                 vid = '_'.join(os.path.basename(multiview_data).split('_')[:-1])
                 data_sp = 'train'
                 if vid not in train_ids:
                     data_sp = 'val'
-                matching_data_file = os.path.join(args.root_data, f'features/{args.features}/{split}/{data_sp}/{vid}_0.npy')
-                assert matching_data_file in list_data_files, f'check {matching_data_file}'
+                matching_data_file = catalog.get_feature_file(args.features, split, data_sp, f'{vid}_0.npy')
+                assert matching_data_file is not None, f'check {os.path.join(args.root_data, f"features/{args.features}/{split}/{data_sp}/{vid}_0.npy")}'
                 if matching_data_file not in multiview_data_files:
                     multiview_data_files[matching_data_file] = []
                 multiview_data_files[matching_data_file].append(multiview_data)
@@ -286,10 +259,23 @@ if __name__ == "__main__":
             args.text_dir = None
 
 
-        #with Pool(processes=35) as pool:
-        #    pool.map(partial(generate_temporal_graph, args=args, path_graphs=path_graphs, actions=actions, train_ids=train_ids, all_ids=all_ids), list_data_files)
-        for data_file in list_data_files:
-            generate_heterogeneous_temporal_graph(data_file, args=args, path_graphs=path_graphs, actions=actions, train_ids=train_ids, all_ids=all_ids, list_multiview_data_files=multiview_data_files[data_file] if data_file in multiview_data_files else '')
+        # Skip the videos whose graphs are up to date
+        path_bundle = os.path.join(args.root_data, f'annotations/{args.dataset}/splits/train.{split}.bundle')
+        signatures = {data_file: manifest.get_signature(get_input_files(data_file, args, multiview_data_files.get(data_file, [])) + [path_bundle]) for data_file in list_data_files}
+        if not args.force:
+            list_data_files = [data_file for data_file in list_data_files if manifest.is_stale(data_file, signatures[data_file])]
+        print(f'Number of graphs to (re)generate: {len(list_data_files)} out of {len(signatures)}')
+
+        # Process the videos in parallel from the longest to the shortest
+        job_kwargs = {data_file: {'list_multiview_data_files': multiview_data_files.get(data_file, [])} for data_file in list_data_files}
+        try:
+            list_graph_metadata = run_and_report(partial(generate_heterogeneous_temporal_graph, args=args, path_graphs=path_graphs, actions=actions, train_ids=train_ids, global_ids=global_ids),
+                                                 list_data_files, num_workers=args.num_workers, job_kwargs=job_kwargs,
+                                                 callback=lambda data_file, graph_metadata: manifest.update(data_file, signatures[data_file], list(graph_metadata)))
+        finally:
+            # The manifest is only saved periodically during the generation
+            manifest.save()
+        update_graph_metadata(list_graph_metadata)
 
 
         print (f'Graph generation for {split} is finished')
@@ -1,12 +1,14 @@
 import os
 import glob
 import torch
-import pickle  #nosec
 import argparse
 import numpy as np
 from functools import partial
-from multiprocessing import Pool
 from torch_geometric.data import Data
+from gravit.utils.parallel import run_and_report
+from gravit.utils.compact_edges import compact_edges
+from gravit.utils.feature_store import load_columns
+from gravit.utils.graph_metadata import save_graph, update_graph_metadata
 
 
 def _get_time_windows(list_fts, time_span):
@@ -24,74 +26,90 @@ def _get_time_windows(list_fts, time_span):
 
     twd_all = []
 
-    start = end = 0
-    while end < len(list_fts):
-        while end < len(list_fts) and list_fts[end] < list_fts[start] + time_span:
-            end += 1
-
+    # Each window ends at the first timestamp that is not smaller than its first timestamp + "time_span"
+    array_fts = np.asarray(list_fts, dtype=np.float64)
+    start = 0
+    while start < len(list_fts):
+        end = int(np.searchsorted(array_fts, array_fts[start] + time_span, side='left'))
         twd_all.append(list_fts[start:end])
         start = end
 
     return twd_all
 
 
+def _get_window_edges(timestamp, person_id, tau, ec_mode):
+    """
+    Get the edges of a time window given the timestamps (in non-decreasing order) and person_ids of its nodes
+    The nodes i and j are connected if they are in the same frame, or if their time difference is not greater than "tau"
+    (and for csi, if they have the same identity)
+    The edges are ordered by i, then by j, and edge_attr is the sign of the time difference (0: spatial)
+    """
+
+    timestamp = np.asarray(timestamp, dtype=np.float64)
+    num_node = len(timestamp)
+
+    # Candidate neighbors of each node are the nodes within a time difference of "tau" (slightly widened against rounding)
+    margin = max(tau, 0) * (1 + 1e-9) + 1e-9
+    start = np.searchsorted(timestamp, timestamp - margin, side='left')
+    end = np.searchsorted(timestamp, timestamp + margin, side='right')
+    num_neighbor = end - start
+
+    node_source = np.repeat(np.arange(num_node), num_neighbor)
+    offset = np.arange(num_neighbor.sum()) - np.repeat(np.cumsum(num_neighbor) - num_neighbor, num_neighbor)
+    node_target = np.repeat(start, num_neighbor) + offset
+
+    # If the edge connection mode is csi, nodes having the same identity are connected across the frames
+    # If the edge connection mode is cdi, temporally-distant nodes with different identities are also connected
+    time_diff = timestamp[node_source] - timestamp[node_target]
+    id_condition = np.ones(len(node_source), dtype=bool)
+    if ec_mode == 'csi':
+        person_id = np.asarray(person_id)
+        id_condition = person_id[node_source] == person_id[node_target]
+
+    mask = (time_diff == 0) | ((np.abs(time_diff) <= tau) & id_condition)
+
+    return node_source[mask], node_target[mask], np.sign(time_diff[mask])
+
+
 def generate_graph(data_file, args, path_graphs, sp):
     """
     Generate graphs of a single video
     Time span of each graph is not greater than "time_span"
+    Returns the metadata of the saved graphs by path (see gravit.utils.graph_metadata.save_graph)
     """
 
     video_id = os.path.splitext(os.path.basename(data_file))[0]
-    with open(data_file, 'rb') as f:
-        data = pickle.load(f)  #nosec
+    columns = load_columns(data_file)
 
     # Get a list of frame_timestamps
-    list_fts = sorted([float(frame_timestamp) for frame_timestamp in data.keys()])
+    list_fts = columns['frame_timestamp'].tolist()
 
     # Get the time windows where the time span of each window is not greater than "time_span"
     twd_all = _get_time_windows(list_fts, args.time_span)
 
     # Iterate over every time window
     num_graph = 0
+    graph_metadata = {}
     for twd in twd_all:
         # Skip the training graphs without any temporal edges
         if sp == 'train' and len(twd) == 1:
             continue
 
-        # Get lists of the timestamps, features, coordinates, labels, person_ids, and global_ids for a given time window
-        timestamp, feature, coord, label, person_id, global_id = [], [], [], [], [], []
-        for fts in twd:
-            for entity in data[f'{fts:g}']:
-                timestamp.append(fts)
-                feature.append(entity['feature'])
-                x1, y1, x2, y2 = [float(c) for c in entity['person_box'].split(',')]
-                coord.append(np.array([(x1+x2)/2, (y1+y2)/2, x2-x1, y2-y1], dtype=np.float32))
-                label.append(entity['label'])
-                person_id.append(entity['person_id'])
-                global_id.append(entity['global_id'])
-
-        # Get a list of the edge information: these are for edge_index and edge_attr
-        node_source = []
-        node_target = []
-        edge_attr = []
-        for i in range(len(timestamp)):
-            for j in range(len(timestamp)):
-                # Time difference between the i-th and j-th nodes
-                time_diff = timestamp[i] - timestamp[j]
-
-                # If the edge connection mode is csi, nodes having the same identity are connected across the frames
-                # If the edge connection mode is cdi, temporally-distant nodes with different identities are also connected
-                if args.ec_mode == 'csi':
-                    id_condition = person_id[i] == person_id[j]
-                elif args.ec_mode == 'cdi':
-                    id_condition = True
-
-                # The edge ij connects the i-th node and j-th node
-                # Positive edge_attr indicates that the edge ij is backward (negative: forward)
-                if time_diff == 0 or (abs(time_diff) <= args.tau and id_condition):
-                    node_source.append(i)
-                    node_target.append(j)
-                    edge_attr.append(np.sign(time_diff))
+        # Get the timestamps, features, coordinates, labels, person_ids, and global_ids for a given time window
+        # The entities are ordered by timestamp, so the nodes of the window are a contiguous range
+        start = np.searchsorted(columns['timestamp'], twd[0], side='left')
+        end = np.searchsorted(columns['timestamp'], twd[-1], side='right')
+        timestamp = columns['timestamp'][start:end]
+        feature = columns['feature'][start:end]
+        x1, y1, x2, y2 = columns['box'][start:end].T
+        coord = np.stack(((x1+x2)/2, (y1+y2)/2, x2-x1, y2-y1), axis=1)
+        label = columns['label'][start:end]
+        person_id = columns['person_id'][start:end]
+        global_id = columns['global_id'][start:end]
+
+        # Get the edge information: these are for edge_index and edge_attr
+        # Positive edge_attr indicates that the edge ij is backward (negative: forward)
+        node_source, node_target, edge_attr = _get_window_edges(timestamp, person_id, args.tau, args.ec_mode)
 
         # x: features
         # c: coordinates of person_box
@@ -101,15 +119,17 @@ def generate_graph(data_file, args, path_graphs, sp):
         # y: labels
         graphs = Data(x = torch.tensor(np.array(feature, dtype=np.float32), dtype=torch.float32),
                       c = torch.tensor(np.array(coord, dtype=np.float32), dtype=torch.float32),
-                      g = torch.tensor(global_id, dtype=torch.long),
-                      edge_index = torch.tensor(np.array([node_source, node_target], dtype=np.int64), dtype=torch.long),
-                      edge_attr = torch.tensor(edge_attr, dtype=torch.float32),
+                      g = torch.from_numpy(global_id.astype(np.int64)),
+                      edge_index = torch.from_numpy(np.stack((node_source, node_target)).astype(np.int64)),
+                      edge_attr = torch.from_numpy(edge_attr.astype(np.float32)),
                       y = torch.tensor(np.array(label, dtype=np.float32), dtype=torch.float32))
+        if args.compact_edges:
+            graphs = compact_edges(graphs)
 
         num_graph += 1
-        torch.save(graphs, os.path.join(path_graphs, f'{video_id}_{num_graph:04d}.pt'))
+        graph_metadata.update(save_graph(graphs, os.path.join(path_graphs, f'{video_id}_{num_graph:04d}.pt')))
 
-    return num_graph
+    return graph_metadata
 
 
 if __name__ == "__main__":
@@ -128,6 +148,8 @@ if __name__ == "__main__":
     parser.add_argument('--ec_mode',       type=str,   help='Edge connection mode (csi | cdi)', required=True)
     parser.add_argument('--time_span',     type=float, help='Maximum time span for each graph in seconds', required=True)
     parser.add_argument('--tau',           type=float, help='Maximum time difference between neighboring nodes in seconds', required=True)
+    parser.add_argument('--num_workers',   type=int,   help='Number of processes for the graph generation', default=20)
+    parser.add_argument('--compact_edges', help='Store the edges as int32 CSR with int8 edge types', action="store_true")
 
     args = parser.parse_args()
 
@@ -139,7 +161,8 @@ if __name__ == "__main__":
 
         list_data_files = sorted(glob.glob(os.path.join(args.root_data, f'features/{args.features}/{sp}/*.pkl')))
 
-        with Pool(processes=20) as pool:
-            num_graph = pool.map(partial(generate_graph, args=args, path_graphs=path_graphs, sp=sp), list_data_files)
+        # Process the videos in parallel from the longest to the shortest
+        list_graph_metadata = run_and_report(partial(generate_graph, args=args, path_graphs=path_graphs, sp=sp), list_data_files, num_workers=args.num_workers)
+        update_graph_metadata(list_graph_metadata)
 
-        print (f'Graph generation for {sp} is finished (number of graphs: {sum(num_graph)})')
+        print (f'Graph generation for {sp} is finished (number of graphs: {sum(len(graph_metadata) for graph_metadata in list_graph_metadata)})')
@@ -5,43 +5,114 @@ import h5py
 import argparse
 import numpy as np
 from functools import partial
-from multiprocessing import Pool
 from torch_geometric.data import Data
 from gravit.utils.data_loader import *
+from gravit.utils.graph_builder import get_video_edges, get_view_hub_features, get_window_size, get_temporal_windows, get_max_frame_offset, VIEW_HUB_LABEL
+from gravit.utils.temporal_crop import mask_halo_labels
+from gravit.utils.compact_edges import compact_edges
 from gravit.utils.parser import get_args, get_cfg
+from gravit.utils.parallel import run_and_report
+from gravit.utils.manifest import GraphManifest
+from gravit.utils.graph_metadata import save_graph, update_graph_metadata
+from gravit.utils.catalog import DatasetCatalog
 
 
-def compute_similarity_metric(node_i, node_j, metric):
-    if metric == 'cosine':
-        return np.dot(node_i, node_j) / (np.linalg.norm(node_i) * np.linalg.norm(node_j))
-    elif metric == 'gaussian':
-        sigma = 2
-        return np.exp(-np.linalg.norm(node_i - node_j) ** 2 / (2 * (sigma ** 2)))
-    elif metric == 'inner_product':
-        return np.dot(node_i, node_j)
+def get_take_name(data_file, args):
+    """
+    Get the name of the take of a feature file, as named in the annotations (with or without its view suffix)
+    """
+
+    take_name = os.path.splitext(os.path.basename(data_file))[0]
+    if not os.path.exists(os.path.join(args.root_data, f'annotations/{args.dataset}/groundTruth/{take_name}.txt')):
+        take_name = take_name.rsplit('_', 1)[0]
+
+    return take_name
+
+
+def get_temporal_graph(list_feature, label, batch_idx_designation, g, args):
+    """
+    Build the temporal graph of the frames whose features are "list_feature" (one array per view, the ego view first)
+    """
+
+    feature = list_feature[0]
+    list_feature_multiview = list_feature[1:]
+    num_frame = feature.shape[0]
+
+    # # Get a list of the edge information: these are for edge_index and edge_attr
+    num_view = len(list_feature_multiview)+1
+    node_source, node_target, edge_attr, counter_similarity_edges_added = get_video_edges(feature, args.tauf, skip_factor=args.skip_factor, num_view=num_view,
+        similarity_metric=args.similarity_metric, similarity_threshold=args.similarity_threshold, similarity_topk=args.similarity_topk, path_cache=args.path_templates,
+        view_hub=args.view_hub)
+
+    if args.similarity_metric is not None:
+        print(f'{counter_similarity_edges_added} similarity edges | {len(node_source) - counter_similarity_edges_added} | ' + "{:.1f}%".format(counter_similarity_edges_added / len(node_source) * 100) + " % of Total edges")
+
+    # x: features
+    # g: global_id
+    # edge_index: information on how the graph nodes are connected
+    # edge_attr: information about whether the edge is spatial (0) or temporal (positive: backward, negative: forward)
+    # y: labels
+    view_idx = []
+
+    # Every view is written directly into the node features, after which the view hubs (if any) are placed
+    num_hub = num_frame if args.view_hub and num_view > 1 else 0
+    x = assemble_features([feature] + list_feature_multiview, num_rows=num_view*num_frame + num_hub)
+
+    if num_view > 1:
+        label_view = label
+        label = label*num_view
+        batch_idx_view = batch_idx_designation
+        batch_idx_designation = batch_idx_designation*num_view
+
+        view_idx = []
+        for i in range(num_view):
+            view_idx += [i]*num_frame
+
+        # View hub nodes come after all the views, with the mean features of the views and a label ignored by the loss
+        if args.view_hub:
+            x[num_view*num_frame:] = get_view_hub_features([x[i*num_frame:(i+1)*num_frame] for i in range(num_view)])
+            label = label + [VIEW_HUB_LABEL]*len(label_view)
+            if isinstance(batch_idx_view, list):
+                batch_idx_designation = batch_idx_designation + batch_idx_view
+            view_idx += [num_view]*num_frame
+
+    print(f'Number of nodes: {len(x)} | Number of edges: {len(node_source)} ')
+
+
+    graphs = Data(x = torch.from_numpy(x),
+                  g = g,
+                  edge_index = torch.from_numpy(np.stack((node_source, node_target))),
+                  edge_attr = torch.tensor(edge_attr),
+                  y = torch.tensor(np.array(label, dtype=np.int16)[::args.sample_rate], dtype=torch.long),
+                  batch_idxs = torch.tensor(np.array(batch_idx_designation, dtype=np.int16), dtype=torch.long),
+                  view_idxs = torch.tensor(np.array(view_idx, dtype=np.int16), dtype=torch.long)) # added segments for subgraph selection using node indices
+    if args.compact_edges:
+        graphs = compact_edges(graphs)
 
+    return graphs
 
-def generate_temporal_graph(data_file, args, path_graphs, actions, train_ids, all_ids, list_multiview_data_files=[], split='train'):
+
+def generate_temporal_graph(data_file, args, path_graphs, actions, train_ids, global_ids, list_multiview_data_files=[], split='train', path_graph=None):
     """
     Generate temporal graphs of a single video
+    The graph is saved under "path_graphs" in the train/val/test directory of the video, or at "path_graph" if given
+    With a node or edge budget (window_nodes, window_edges), the video is instead cut into windows saved as <path_graph without .pt>_w<k>.pt
+    Returns the metadata of the saved graphs by path (see gravit.utils.graph_metadata.save_graph)
     """
 
-    skip = args.skip_factor
     batch_idx_designation = 0
-    take_name = os.path.splitext(os.path.basename(data_file))[0]
 
     # # Load the features and labels
     feature = load_features(data_file)
     list_feature_multiview = []
     for multiview_data_file in list_multiview_data_files:
-        feature_multiview = np.load(multiview_data_file)
+        feature_multiview = load_features(multiview_data_file)
         assert feature.shape == feature_multiview.shape, f'feature.shape: {feature.shape}, feature_multiview.shape: {feature_multiview.shape}'
         list_feature_multiview.append(feature_multiview)
         # print(f'Loaded multiview feature from {multiview_data_file}')
     
     
-    if not os.path.exists(os.path.join(args.root_data, f'annotations/{args.dataset}/groundTruth/{take_name}.txt')):
-        take_name = take_name.rsplit('_', 1)[0]
+    take_name = get_take_name(data_file, args)
 
     #  load pre-averaged segmentwise features
     if cfg['load_segmentwise']:
@@ -62,133 +133,209 @@ def generate_temporal_graph(data_file, args, path_graphs, actions, train_ids, al
         batch_idx_path = os.path.join(args.root_data, 'annotations', args.dataset, 'batch_idx')
         untrimmed_batch_idxs = load_batch_indices(batch_idx_path, take_name)
         batch_idx_designation = [i for i in untrimmed_batch_idxs if i != -1]
-        label = get_segment_labels_by_batch_idxs(label, batch_idx_designation=batch_idx_designation)
-        label = [mode(label[i]) for i in range(len(label))]
+        label = reduce_segments(batch_idx_designation, label=label)[1].tolist()
 
 
 
+    if path_graph is None:
+        if split == 'test':
+            path_graph = os.path.join(path_graphs, 'test', f'{take_name}.pt')
+        elif take_name in train_ids:
+            path_graph = os.path.join(path_graphs, 'train', f'{take_name}.pt')
+        else:
+            path_graph = os.path.join(path_graphs, 'val', f'{take_name}.pt')
+
+    list_feature = [feature] + list_feature_multiview
+    window_size = get_video_window_size(len(list_feature), args)
+    if window_size is None:
+        graphs = get_temporal_graph(list_feature, label, batch_idx_designation, global_ids[take_name], args)
+        graph_metadata = save_graph(graphs, path_graph)
+        remove_stale_graphs(path_graph, [path_graph])
+        return graph_metadata
+
+    # Windows of core frames with halos covering the longest temporal edges, each saved as a graph of its own
+    # window: (start, end, core_start, core_end, num_frame) of the window in the frames of the video
+    # The labels of the halo nodes are ignored by the losses: the halos are only context for the core nodes
     num_frame = feature.shape[0]
+    windows = get_temporal_windows(num_frame, window_size, get_max_frame_offset(args.tauf, args.skip_factor))
+    list_paths = get_window_paths(path_graph, len(windows))
+    graph_metadata = {}
+    for (start, end, core_start, core_end), path_window in zip(windows, list_paths):
+        graphs = get_temporal_graph([f[start:end] for f in list_feature], label[start:end], batch_idx_designation, global_ids[take_name], args)
+        graphs.window = torch.tensor([[start, end, core_start, core_end, num_frame]])
+        mask_halo_labels(graphs, core_start - start, core_end - start)
+        graph_metadata.update(save_graph(graphs, path_window))
+    remove_stale_graphs(path_graph, list_paths)
 
-    # # Get a list of the edge information: these are for edge_index and edge_attr
-    counter_similarity_edges_added = 0
-    node_source = []
-    node_target = []
-    edge_attr = []
+    return graph_metadata
 
-    num_view = len(list_feature_multiview)+1
-    for i in range(num_frame):
-        for j in range(num_frame):
-            # Frame difference between the i-th and j-th nodes
-            frame_diff = i - j
-
-            # The edge ij connects the i-th node and j-th node
-            # Positive edge_attr indicates that the edge ij is backward (negative: forward)
-            if abs(frame_diff) <= args.tauf:
-                node_source.append(i)
-                node_target.append(j)
-                edge_attr.append(np.sign(frame_diff))
-
-                # temporal conection between same view nodes
-                for k in range(1, num_view):
-                    node_source.append(i+num_frame*k)
-                    node_target.append(j+num_frame*k)
-                    edge_attr.append(np.sign(frame_diff))
-
-                # connections between exo and ego nodes
-                if frame_diff == 0:
-                    for k in range(1, num_view):
-                        node_source.append(i)
-                        node_target.append(j+num_frame*k)
-                        edge_attr.append(-2)
-
-                        # node_source.append(i)
-                        # node_target.append(j+num_frame*k)
-                        # edge_attr.append(1)
-
-                        # node_source.append(i)
-                        # node_target.append(j+num_frame*k)
-                        # edge_attr.append(0)
-
-                    # add connections between all exo nodes too
-                    for k in range(1, num_view):
-                        for l in range(1, num_view):
-                            # if k == l:
-                            node_source.append(i+num_frame*k)
-                            node_target.append(j+num_frame*l)
-                            edge_attr.append(-2)
-
-                            # node_source.append(i+num_frame*k)
-                            # node_target.append(j+num_frame*l)
-                            # edge_attr.append(1)
-
-                            # # add undirected connections between all exo nodes
-                            # node_source.append(i+num_frame*k)
-                            # node_target.append(j+num_frame*l)
-                            # edge_attr.append(0)
-
-            # Make additional connections between non-adjacent nodes
-            # This can help reduce over-segmentation of predictions in some cases
-            elif skip:
-                if (frame_diff % skip == 0) and (abs(frame_diff) <= skip * args.tauf):
-                    node_source.append(i)
-                    node_target.append(j)
-                    edge_attr.append(np.sign(frame_diff))
-
-                    for k in range(num_view):
-                        node_source.append(i+num_frame)
-                        node_target.append(j+num_frame)
-                        edge_attr.append(np.sign(frame_diff))
-
-            # Add similarity-based connections
-            # print(args.similarity_metric)
-            if args.similarity_metric is not None and i != j:
-                similarity = compute_similarity_metric(feature[i], feature[j], metric=args.similarity_metric)
-                if similarity > args.similarity_threshold:
-                    # print(f'Adding similarity edge between {i} and {j} with similarity {similarity}')
-                    node_source.append(i)
-                    node_target.append(j)
-                    edge_attr.append(np.sign(frame_diff))  # try 0
-                    counter_similarity_edges_added += 1
-    
-    if args.similarity_metric is not None:
-        print(f'{counter_similarity_edges_added} similarity edges | {len(node_source) - counter_similarity_edges_added} | ' + "{:.1f}%".format(counter_similarity_edges_added / len(node_source) * 100) + " % of Total edges")
 
-    # x: features
-    # g: global_id
-    # edge_index: information on how the graph nodes are connected
-    # edge_attr: information about whether the edge is spatial (0) or temporal (positive: backward, negative: forward)
-    # y: labels
-    view_idx = []
+def get_window_paths(path_graph, num_windows):
+    """
+    Get the paths of the window graphs of a video whose whole graph would be saved at "path_graph"
+    """
 
-    if num_view > 1:
-        feature_multiview = np.concatenate(list_feature_multiview)
-        feature = np.concatenate((np.array(feature, dtype=np.float32), feature_multiview))
-        label = label*num_view
-        batch_idx_designation = batch_idx_designation*num_view
+    stem = os.path.splitext(path_graph)[0]
+    return [f'{stem}_w{k:04d}.pt' for k in range(num_windows)]
 
-        view_idx = []
-        for i in range(num_view):
-            view_idx += [i]*num_frame
 
-    print(f'Number of nodes: {len(feature)} | Number of edges: {len(node_source)} ')
+def get_video_window_size(num_view, args):
+    """
+    Get the number of core frames of the windows of a video with "num_view" views that fit the node and edge budgets,
+    or None if the videos are not cut into windows
+    """
 
+    if args.window_nodes is None and args.window_edges is None:
+        return None
 
-    graphs = Data(x = torch.tensor(np.array(feature, dtype=np.float32), dtype=torch.float32),
-                  g = all_ids.index(take_name),
-                  edge_index = torch.tensor(np.array([node_source, node_target], dtype=np.int32), dtype=torch.long),
-                  edge_attr = torch.tensor(edge_attr, dtype=torch.float32),
-                  y = torch.tensor(np.array(label, dtype=np.int16)[::args.sample_rate], dtype=torch.long),
-                  batch_idxs = torch.tensor(np.array(batch_idx_designation, dtype=np.int16), dtype=torch.long),
-                  view_idxs = torch.tensor(np.array(view_idx, dtype=np.int16), dtype=torch.long)) # added segments for subgraph selection using node indices
-    
-    
-    if split == 'test':
-        torch.save(graphs, os.path.join(path_graphs, 'test', f'{take_name}.pt'))
-        return
-    if take_name in train_ids:
-        torch.save(graphs, os.path.join(path_graphs, 'train', f'{take_name}.pt'))
+    return get_window_size(args.tauf, args.skip_factor, num_view, view_hub=args.view_hub, max_nodes=args.window_nodes, max_edges=args.window_edges)
+
+
+def get_graph_paths(path_graph, num_frame, num_view, args):
+    """
+    Get the paths of the graphs of a video with "num_frame" frames: its whole graph, or its window graphs
+    """
+
+    window_size = get_video_window_size(num_view, args)
+    if window_size is None:
+        return [path_graph]
+
+    return get_window_paths(path_graph, len(get_temporal_windows(num_frame, window_size, get_max_frame_offset(args.tauf, args.skip_factor))))
+
+
+def remove_stale_graphs(path_graph, list_paths):
+    """
+    Remove the graphs of a video left by a previous run (its whole graph or windows) that are not in "list_paths"
+    """
+
+    stem = os.path.splitext(path_graph)[0]
+    for path in [path_graph] + glob.glob(f'{glob.escape(stem)}_w[0-9][0-9][0-9][0-9].pt'):
+        if path not in list_paths and os.path.exists(path):
+            os.remove(path)
+
+
+def get_input_files(data_file, args, list_multiview_data_files=[]):
+    """
+    Get the list of the files that the graph of a single video is generated from
+    """
+
+    take_name = os.path.splitext(os.path.basename(data_file))[0]
+    list_input_files = [data_file, os.path.join(args.root_data, f'annotations/{args.dataset}/mapping.txt')] + list(list_multiview_data_files)
+    # Labels and batch indices may be named after the take without its view suffix
+    for video_id in (take_name, take_name.rsplit('_', 1)[0]):
+        list_input_files.append(os.path.join(args.root_data, f'annotations/{args.dataset}/groundTruth/{video_id}.txt'))
+        list_input_files.append(os.path.join(args.root_data, 'annotations', args.dataset, 'batch_idx', f'{video_id}.txt'))
+
+    return list_input_files
+
+
+def get_split_data_files(split, args, catalog):
+    """
+    Get the training video ids of a split, its list of feature files and the exo feature files of each of them
+    """
+
+    if split != 'test':
+        train_ids = set(catalog.get_train_ids(split))
+        print(f'Number of training videos: {len(train_ids)}')
     else:
-        torch.save(graphs, os.path.join(path_graphs, 'val', f'{take_name}.pt'))
+        train_ids = set()
+
+    list_data_files = catalog.get_feature_files(args.features, split)
+    multiview_data_files = {}
+    if args.add_multiview:
+        for multiview_data in catalog.get_feature_files(f'{args.features}-exo', split):
+            vid = '_'.join(os.path.basename(multiview_data).split('_')[:-1])
+            data_sp = 'train'
+            if vid not in train_ids:
+                data_sp = 'val'
+            if split == 'test':
+                data_sp = 'test'
+            matching_data_file = catalog.get_feature_file(args.features, split, data_sp, f'{vid}_0.npy')
+            assert matching_data_file is not None, f'check {os.path.join(args.root_data, f"features/{args.features}/{split}/{data_sp}/{vid}_0.npy")}'
+            if matching_data_file not in multiview_data_files:
+                multiview_data_files[matching_data_file] = []
+            multiview_data_files[matching_data_file].append(multiview_data)
+
+    return train_ids, list_data_files, multiview_data_files
+
+
+def get_store_name(path, args):
+    """
+    Get the name of an input file that does not depend on the split directory it is found in
+    (features/<features>/<split>/<sp>/<file> -> <features>/<file>)
+    """
+
+    parts = os.path.relpath(path, args.root_data).split(os.sep)
+    if parts[0] == 'features':
+        return '/'.join((parts[1], parts[-1]))
+
+    return '/'.join(parts)
+
+
+def save_split_manifest(path_manifest, list_graph_files):
+    """
+    Save the list of the graphs of a split (one path per line, relative to the manifest)
+    """
+
+    path_tmp = f'{path_manifest}.tmp{os.getpid()}'
+    with open(path_tmp, 'w') as f:
+        for graph_file in list_graph_files:
+            f.write(os.path.relpath(graph_file, os.path.dirname(path_manifest)) + '\n')
+    os.replace(path_tmp, path_manifest)
+
+
+def generate_graph_store(func, list_splits, path_graphs_root, manifest, catalog, args):
+    """
+    Generate the graphs of all the splits into a single content-addressed store (<graph_name>/store/<signature>.pt):
+    a video whose input files have the same content in several splits is built only once
+    Each split gets a manifest per subset (<graph_name>/<split>/<train|val>.txt) listing the graphs of its members
+    (all the windows of a member with a node or edge budget)
+    """
+
+    path_store = os.path.join(path_graphs_root, 'store')
+    os.makedirs(path_store, exist_ok=True)
+
+    jobs = {}
+    outputs = {}
+    members = {}
+    for split in list_splits:
+        train_ids, list_data_files, multiview_data_files = get_split_data_files(split, args, catalog)
+        for data_file in list_data_files:
+            list_input_files = get_input_files(data_file, args, multiview_data_files.get(data_file, []))
+            signature = manifest.get_signature(list_input_files, names=[get_store_name(f, args) for f in list_input_files])
+            take_name = get_take_name(data_file, args)
+            sp = 'train' if take_name in train_ids else 'val'
+            members.setdefault((split, sp), []).append((take_name, signature))
+            if signature not in jobs:
+                jobs[signature] = (data_file, {'list_multiview_data_files': multiview_data_files.get(data_file, []), 'split': split,
+                                               'path_graph': os.path.join(path_store, f'{signature}.pt')})
+                num_frame = catalog.get_feature_length(args.features, split, os.path.basename(os.path.dirname(data_file)), os.path.basename(data_file))
+                outputs[signature] = get_graph_paths(jobs[signature][1]['path_graph'], num_frame, len(multiview_data_files.get(data_file, [])) + 1, args)
+
+    # The graphs are named after their signature, so only the missing ones have to be generated
+    signatures = {data_file: signature for signature, (data_file, _) in jobs.items()}
+    job_kwargs = {data_file: kwargs for data_file, kwargs in jobs.values()}
+    list_data_files = [data_file for data_file in job_kwargs if args.force or not all(os.path.exists(path) for path in outputs[signatures[data_file]])]
+    print(f'Number of graphs to (re)generate: {len(list_data_files)} out of {len(jobs)} distinct videos in {len(list_splits)} splits')
+    try:
+        list_graph_metadata = run_and_report(partial(func, path_graphs=path_store, train_ids=set()), list_data_files, num_workers=args.num_workers, job_kwargs=job_kwargs,
+                                             callback=lambda data_file, graph_metadata: manifest.update(data_file, signatures[data_file], list(graph_metadata)))
+    finally:
+        # The manifest is only saved periodically during the generation
+        manifest.save()
+    update_graph_metadata(list_graph_metadata)
+
+    for (split, sp), list_members in members.items():
+        os.makedirs(os.path.join(path_graphs_root, split), exist_ok=True)
+        save_split_manifest(os.path.join(path_graphs_root, split, f'{sp}.txt'), [path for _, signature in sorted(list_members) for path in outputs[signature]])
+
+    # Remove the graphs of previous inputs that no split refers to anymore
+    all_outputs = {path for list_paths in outputs.values() for path in list_paths}
+    for path_graph in glob.glob(os.path.join(path_store, '*.pt')):
+        if path_graph not in all_outputs:
+            os.remove(path_graph)
+
+    print(f'Graph store is finished ({len(jobs)} graphs for {sum(len(m) for m in members.values())} split members)')
 
 
 if __name__ == "__main__":
@@ -208,7 +355,15 @@ if __name__ == "__main__":
     parser.add_argument('--skip_factor',   type=int,   help='Make additional connections between non-adjacent nodes', default=1000)
     parser.add_argument('--sample_rate',   type=int,   help='Downsampling rate for the input', default=1)
     parser.add_argument('--add_multiview',   help='Whether to add multiview features', action="store_true")
+    parser.add_argument('--view_hub',      help='Connect the views through a hub node per frame instead of exo-exo edges', action="store_true")
     parser.add_argument('--crop',   type=bool,   help='Crop action_start and action_end', default=False)
+    parser.add_argument('--num_workers',   type=int,   help='Number of processes for the graph generation', default=20)
+    parser.add_argument('--force',         help='Regenerate every graph even if it is up to date', action="store_true")
+    parser.add_argument('--compact_edges', help='Store the edges as int32 CSR with int8 edge types', action="store_true")
+    parser.add_argument('--graph_store',   help='Build each video once in a store shared by all the splits', action="store_true")
+    parser.add_argument('--path_templates', type=str,  help='Directory to cache the edge templates on disk (default: templates only cached in memory)')
+    parser.add_argument('--window_nodes',  type=int,   help='Cut the videos into windows of at most this number of nodes (halos of the longest temporal edges included)')
+    parser.add_argument('--window_edges',  type=int,   help='Cut the videos into windows of at most this number of temporal and cross-view edges')
     
     args = parser.parse_args()
 
@@ -231,9 +386,33 @@ if __name__ == "__main__":
         args.similarity_metric = None
     if cfg['similarity_threshold'] is not None:
         args.similarity_threshold = cfg['similarity_threshold']
+    args.similarity_topk = cfg.get('similarity_topk')
+    if args.similarity_topk == 'None':
+        args.similarity_topk = None
 
-    print(f'Tauf: {args.tauf} | Skip Factor: {args.skip_factor} | Similarity Metric: {args.similarity_metric} | Similarity Threshold: {args.similarity_threshold}')
+    print(f'Tauf: {args.tauf} | Skip Factor: {args.skip_factor} | Similarity Metric: {args.similarity_metric} | Similarity Threshold: {args.similarity_threshold} | Similarity Top-k: {args.similarity_topk}')
     print(f'Features: {args.features} | Dataset: {args.dataset}')
+    args.compact_edges = args.compact_edges or cfg.get('compact_edges', False)
+    args.graph_store = args.graph_store or cfg.get('graph_store', False)
+    args.view_hub = args.view_hub or cfg.get('view_hub', False)
+    if args.window_nodes is None:
+        args.window_nodes = cfg.get('window_nodes')
+    if args.window_edges is None:
+        args.window_edges = cfg.get('window_edges')
+    if (args.window_nodes is not None or args.window_edges is not None) and not cfg['load_segmentwise']:
+        raise ValueError('Windows are only supported for graphs with a node per segment (load_segmentwise)')
+
+    # Only the graphs whose input files or graph parameters changed are regenerated
+    graph_params = {k: getattr(args, k, None) for k in ('tauf', 'skip_factor', 'similarity_metric', 'similarity_threshold', 'similarity_topk', 'sample_rate', 'add_multiview', 'compact_edges')}
+    graph_params['load_segmentwise'] = cfg['load_segmentwise']
+    # Only recorded when set, so that the existing graphs without view hubs stay up to date
+    if args.view_hub:
+        graph_params['view_hub'] = True
+    for k in ('window_nodes', 'window_edges'):
+        if getattr(args, k) is not None:
+            graph_params[k] = getattr(args, k)
+    manifest = GraphManifest(os.path.join(args.root_data, f'graphs/{cfg["graph_name"]}'), graph_params)
+
     # Build a mapping from action classes to action ids
     actions = {}
     with open(os.path.join(args.root_data, f'annotations/{args.dataset}/mapping.txt')) as f:
@@ -241,57 +420,49 @@ if __name__ == "__main__":
             aid, cls = line.strip().split(' ')
             actions[cls] = int(aid)
 
-    # Get a list of all video ids
-    all_ids = sorted([os.path.splitext(v)[0] for v in os.listdir(os.path.join(args.root_data, f'annotations/{args.dataset}/groundTruth'))])
+    # Index of the video ids, splits and feature files
+    catalog = DatasetCatalog(args.root_data, args.dataset)
  
     # Iterate over different splits
     print ('This process might take a few minutes')
 
-    list_splits = sorted(os.listdir(os.path.join(args.root_data, f'features/{args.features}')))
-
-    for split in list_splits:
-        if split == 'test':
-            continue
-        # Get a list of training video ids
-        if split != 'test':
-            print(f'Reading splits at {os.path.join(args.root_data, f"annotations/{args.dataset}/splits/train.{split}.bundle")}')
-            with open(os.path.join(args.root_data, f'annotations/{args.dataset}/splits/train.{split}.bundle')) as f:
-                train_ids = [os.path.splitext(line.strip())[0] for line in f]
-                print(f'Number of training videos: {len(train_ids)}')
-        else:
-            train_ids = []
+    list_splits = [split for split in catalog.get_splits(args.features) if split != 'test']
+    path_graphs_root = os.path.join(args.root_data, f'graphs/{cfg["graph_name"]}')
+    func = partial(generate_temporal_graph, args=args, actions=actions, global_ids=catalog.get_global_ids())
 
+    if args.graph_store:
+        # Build the graph of each distinct video once, and list the members of every split
+        generate_graph_store(func, list_splits, path_graphs_root, manifest, catalog, args)
+    else:
+        for split in list_splits:
+            train_ids, list_data_files, multiview_data_files = get_split_data_files(split, args, catalog)
 
-        # path_graphs = os.path.join(args.root_data, f'graphs/{args.features}_{args.tauf}_{args.skip_factor}/{split}')
-        path_graphs = os.path.join(args.root_data, f'graphs/{cfg["graph_name"]}/{split}')
-        
-        if split == 'test':
-            os.makedirs(os.path.join(path_graphs, 'test'), exist_ok=True)
-        else:
+            # path_graphs = os.path.join(args.root_data, f'graphs/{args.features}_{args.tauf}_{args.skip_factor}/{split}')
+            path_graphs = os.path.join(path_graphs_root, split)
             os.makedirs(os.path.join(path_graphs, 'train'), exist_ok=True)
             os.makedirs(os.path.join(path_graphs, 'val'), exist_ok=True)
-        
-
-        list_data_files = sorted(glob.glob(os.path.join(args.root_data, f'features/{args.features}/{split}/*/*.npy')))
-        multiview_data_files = {}
-        if args.add_multiview:
-            for multiview_data in sorted(glob.glob(os.path.join(args.root_data, f'features/{args.features}-exo/{split}/*/*.npy'))):
-                vid = '_'.join(os.path.basename(multiview_data).split('_')[:-1])
-                data_sp = 'train'
-                if vid not in train_ids:
-                    data_sp = 'val'
-                if 'split' == 'test':
-                    data_sp = 'test'
-                matching_data_file = os.path.join(args.root_data, f'features/{args.features}/{split}/{data_sp}/{vid}_0.npy')
-                assert matching_data_file in list_data_files, f'check {matching_data_file}'
-                if matching_data_file not in multiview_data_files:
-                    multiview_data_files[matching_data_file] = []
-                multiview_data_files[matching_data_file].append(multiview_data)
-
-        #with Pool(processes=35) as pool:
-        #    pool.map(partial(generate_temporal_graph, args=args, path_graphs=path_graphs, actions=actions, train_ids=train_ids, all_ids=all_ids), list_data_files)
-        for data_file in list_data_files:
-            generate_temporal_graph(data_file, args=args, path_graphs=path_graphs, actions=actions, train_ids=train_ids, all_ids=all_ids, 
-                list_multiview_data_files=multiview_data_files[data_file] if data_file in multiview_data_files else '', split=split)
-
-        print (f'Graph generation for {split} is finished')
+            # Split manifests of a previous graph store run would take precedence over the directories
+            for sp in ['train', 'val']:
+                if os.path.exists(os.path.join(path_graphs, f'{sp}.txt')):
+                    os.remove(os.path.join(path_graphs, f'{sp}.txt'))
+
+            # Skip the videos whose graphs are up to date
+            path_bundle = os.path.join(args.root_data, f'annotations/{args.dataset}/splits/train.{split}.bundle')
+            signatures = {data_file: manifest.get_signature(get_input_files(data_file, args, multiview_data_files.get(data_file, [])) + [path_bundle]) for data_file in list_data_files}
+            if not args.force:
+                list_data_files = [data_file for data_file in list_data_files if manifest.is_stale(data_file, signatures[data_file])]
+            print(f'Number of graphs to (re)generate: {len(list_data_files)} out of {len(signatures)}')
+
+            # Process the videos in parallel from the longest to the shortest
+            job_kwargs = {data_file: {'list_multiview_data_files': multiview_data_files.get(data_file, []), 'split': split} for data_file in list_data_files}
+            try:
+                list_graph_metadata = run_and_report(partial(func, path_graphs=path_graphs, train_ids=train_ids),
+                                                     list_data_files, num_workers=args.num_workers, job_kwargs=job_kwargs,
+                                                     callback=lambda data_file, graph_metadata: manifest.update(data_file, signatures[data_file], list(graph_metadata)))
+            finally:
+                # The manifest is only saved periodically during the generation
+                manifest.save()
+            # Sizes, views and labels of the new graphs, read by GraphDataset.get_metadata without loading the graphs
+            update_graph_metadata(list_graph_metadata)
+
+            print (f'Graph generation for {split} is finished')
@@ -1,2 +1,4 @@
-from .dataset_context_reasoning import GraphDataset, TestGraphDataset
+from .dataset_context_reasoning import GraphDataset, CachedGraphDataset, TemporalCropDataset, TestGraphDataset, OnlineGraphDataset, ShardGraphDataset, get_graph_dataset, get_crop_dataset
 from .datasets_naive import EgoExoOmnivoreDataset
+from .sampler import NodeBudgetBatchSampler, get_batch_sampler
+from .loader import SharedEdgeLoader, DevicePrefetcher, collate_shared_edges, get_loader_kwargs, get_device_loader
@@ -1,7 +1,31 @@
 import os
+import copy
 import glob
 import torch
-from torch_geometric.data import Dataset
+import numpy as np
+from collections import OrderedDict
+from torch_geometric.data import Dataset, Data
+from gravit.utils.data_loader import load_features, assemble_features, load_labels, load_batch_indices, reduce_segments
+from gravit.utils.graph_builder import get_video_edges, get_view_hub_features, VIEW_HUB_LABEL
+from gravit.utils.graph_shards import GraphShard
+from gravit.utils.compact_edges import compact_edges
+from gravit.utils.catalog import DatasetCatalog
+from gravit.utils.graph_metadata import get_graph_nbytes, load_graph_metadata
+from gravit.utils.temporal_crop import get_node_frames, crop_temporal_graph
+
+def get_graph_files(path_graphs):
+    """
+    Get the list of the graph files of a subset: the graphs listed in the split manifest "<path_graphs>.txt"
+    written by the graph store (paths relative to the manifest), or the .pt files in the directory "path_graphs"
+    """
+
+    path_manifest = f'{os.path.normpath(path_graphs)}.txt'
+    if os.path.exists(path_manifest):
+        with open(path_manifest) as f:
+            return [os.path.join(os.path.dirname(path_manifest), line.strip()) for line in f if line.strip()]
+
+    return sorted(glob.glob(os.path.join(path_graphs, '*.pt')))
+
 
 class GraphDataset(Dataset):
     """
@@ -10,7 +34,8 @@ class GraphDataset(Dataset):
 
     def __init__(self, path_graphs):
         super(GraphDataset, self).__init__()
-        self.all_graphs = sorted(glob.glob(os.path.join(path_graphs, '*.pt')))
+        self.all_graphs = get_graph_files(path_graphs)
+        self.metadata = None
         print('Length of dataset: ', len(self.all_graphs))
 
     def len(self):
@@ -20,6 +45,140 @@ class GraphDataset(Dataset):
         data = torch.load(self.all_graphs[idx])
         return data
 
+    def get_metadata(self):
+        """
+        Get the metadata of every graph (see gravit.utils.graph_metadata) without loading the graphs,
+        once the metadata tables of their directories are built
+        """
+
+        if self.metadata is None:
+            self.metadata = load_graph_metadata(self.all_graphs)
+
+        return self.metadata
+
+    def get_graph_sizes(self, key='num_nodes'):
+        return np.array([metadata[key] for metadata in self.get_metadata()], dtype=np.int64)
+
+
+class CachedGraphDataset(GraphDataset):
+    """
+    Graph dataset that keeps the loaded graphs in memory, up to "max_bytes" of tensors,
+    evicting the least recently used graphs when the budget is exceeded
+    This cache is private to the process that loads the graphs, so it is only meant for loaders without workers
+    With "shared", the graphs are instead loaded up front (in the order of the files until the budget is reached)
+    into shared-memory tensors, so that the DataLoader workers read them without any copy; the graphs that
+    do not fit are loaded from the disk at every access
+    The cached graphs are returned as shallow copies, so their tensors must not be modified in place
+    """
+
+    def __init__(self, path_graphs, max_bytes, shared=False):
+        super(CachedGraphDataset, self).__init__(path_graphs)
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.cache = OrderedDict()
+        self.num_bytes = 0
+        self.num_hits = 0
+        self.num_misses = 0
+
+        if shared:
+            for idx in range(len(self.all_graphs)):
+                data = torch.load(self.all_graphs[idx])
+                if self.num_bytes + get_graph_nbytes(data) > self.max_bytes:
+                    break
+                self._put(idx, data.share_memory_())
+            print(f'Cached graphs: {len(self.cache)} ({self.num_bytes / 2**20:.1f} MB in shared memory)')
+
+    def _put(self, idx, data):
+        nbytes = get_graph_nbytes(data)
+        if nbytes > self.max_bytes:
+            return
+
+        while self.num_bytes + nbytes > self.max_bytes:
+            _, (_, evicted_nbytes) = self.cache.popitem(last=False)
+            self.num_bytes -= evicted_nbytes
+        self.cache[idx] = (data, nbytes)
+        self.num_bytes += nbytes
+
+    def get(self, idx):
+        if idx in self.cache:
+            self.num_hits += 1
+            self.cache.move_to_end(idx)
+            return copy.copy(self.cache[idx][0])
+
+        self.num_misses += 1
+        data = torch.load(self.all_graphs[idx])
+        if not self.shared:
+            self._put(idx, data)
+        return data
+
+
+# Losses that ignore the labels of the halo nodes of the crops (HALO_LABEL, default ignore_index of CrossEntropyLoss)
+CROP_LOSSES = ('ce', 'ce_ref')
+
+
+class TemporalCropDataset(Dataset):
+    """
+    Training dataset of random temporal crops of the graphs of "dataset": every sample is the subgraph of
+    "crop_frames" consecutive frames (core) of a graph with the "halo" frames before and after them,
+    where the halo nodes are excluded from the losses (see crop_temporal_graph)
+    Every graph gives "crops_per_graph" samples per epoch, each cropped at a new random position when it is loaded
+    The graphs with at most "crop_frames" frames are used whole
+    Only for the frame-ordered temporal graphs (one node per frame and view, see get_node_frames) trained with
+    a cross-entropy loss, which ignores the halo labels; not for the spatial-temporal graphs (e.g. AVA)
+    """
+
+    def __init__(self, dataset, crop_frames, halo, crops_per_graph=1):
+        super(TemporalCropDataset, self).__init__()
+        self.dataset = dataset
+        self.crop_frames = crop_frames
+        self.halo = halo
+        self.crops_per_graph = crops_per_graph
+
+    def len(self):
+        return len(self.dataset) * self.crops_per_graph
+
+    def get(self, idx):
+        data = self.dataset[idx // self.crops_per_graph]
+        _, num_frame = get_node_frames(data)
+        if num_frame <= self.crop_frames:
+            return data
+
+        core_start = int(torch.randint(num_frame - self.crop_frames + 1, (1,)))
+        return crop_temporal_graph(data, core_start, core_start + self.crop_frames, self.halo)
+
+    def get_graph_sizes(self, key='num_nodes'):
+        # Size of the crops of every graph estimated from the share of its frames in a crop (exact bound for the nodes)
+        sizes = self.dataset.get_graph_sizes(key)
+        num_frames = np.array([metadata['num_frames'] for metadata in self.dataset.get_metadata()])
+        ratios = np.minimum(1, (self.crop_frames + 2 * self.halo) / np.maximum(num_frames, 1))
+        return np.repeat(np.ceil(sizes * ratios).astype(np.int64), self.crops_per_graph)
+
+
+def get_crop_dataset(dataset, cfg):
+    """
+    Get a TemporalCropDataset of the training graphs when cfg['crop_frames'] is set, "dataset" otherwise
+    (halo: cfg['crop_halo'], tauf by default | crops per graph: cfg['crops_per_graph'], 1 by default)
+    """
+
+    if not cfg.get('crop_frames'):
+        return dataset
+
+    # Only the cross-entropy losses ignore the labels of the halo nodes
+    if cfg['loss_name'] not in CROP_LOSSES:
+        raise ValueError(f'crop_frames requires a cross-entropy loss ({" | ".join(CROP_LOSSES)}), not {cfg["loss_name"]}')
+    if (cfg.get('batch_nodes') or cfg.get('batch_edges')) and not hasattr(dataset, 'get_metadata'):
+        raise ValueError(f'crop_frames with batch_nodes or batch_edges requires the sizes of the graphs, '
+                         f'which {type(dataset).__name__} does not provide (use pre-generated graphs)')
+
+    halo = cfg.get('crop_halo')
+    if halo is None:
+        halo = cfg.get('tauf')
+    if halo is None:
+        raise ValueError('crop_frames requires crop_halo or tauf in the configuration')
+
+    return TemporalCropDataset(dataset, cfg['crop_frames'], halo, crops_per_graph=cfg.get('crops_per_graph') or 1)
+
+
 class TestGraphDataset(Dataset):
     """
     General class for graph dataset
@@ -40,3 +199,172 @@ class TestGraphDataset(Dataset):
         data = torch.load(sample)
         return (take_name, data)
 
+
+class ShardGraphDataset(Dataset):
+    """
+    Graph dataset that reads the graphs from a packed shard directory (see data/convert_graphs_to_shards.py)
+    The graph tensors are memory-mapped views of the shard files, so no graph is unpickled at loading time
+    """
+
+    def __init__(self, path_shard):
+        super(ShardGraphDataset, self).__init__()
+        self.shard = GraphShard(path_shard)
+        print('Length of dataset: ', len(self.shard))
+
+    def len(self):
+        return len(self.shard)
+
+    def get(self, idx):
+        return self.shard.get(idx)
+
+    def get_metadata(self):
+        return self.shard.get_metadata()
+
+    def get_graph_sizes(self, key='num_nodes'):
+        return np.array([metadata[key] for metadata in self.get_metadata()], dtype=np.int64)
+
+
+def get_graph_dataset(path_graphs, cfg):
+    """
+    Get the dataset of the pre-generated graphs under "path_graphs" in the format given by cfg['graph_format']
+    (pt: one .pt file per video | shard: packed shard directory "<path_graphs>.shard")
+    With cfg['graph_cache_mb'], the .pt graphs are kept in memory up to that many megabytes per dataset
+    (in shared memory with cfg['graph_cache_shared'] or cfg['loader_workers'], see CachedGraphDataset)
+    """
+
+    graph_format = cfg.get('graph_format', 'pt')
+    if graph_format == 'shard':
+        return ShardGraphDataset(f'{os.path.normpath(path_graphs)}.shard')
+    elif graph_format == 'pt':
+        if cfg.get('graph_cache_mb'):
+            # The DataLoader workers share a single cache, as every worker may load any graph
+            shared = cfg.get('graph_cache_shared', False) or (cfg.get('loader_workers') or 0) > 0
+            return CachedGraphDataset(path_graphs, int(cfg['graph_cache_mb'] * 2**20), shared=shared)
+        return GraphDataset(path_graphs)
+    else:
+        raise ValueError(f'Unknown graph format: {graph_format}')
+
+
+class OnlineGraphDataset(Dataset):
+    """
+    Graph dataset that builds the temporal graphs from the raw features at loading time,
+    so the graph hyper-parameters (tauf, skip_factor, similarity_*) are part of the training configuration
+    The features are memory-mapped, and the labels are loaded once when the dataset is created
+    """
+
+    def __init__(self, path_features, cfg):
+        super(OnlineGraphDataset, self).__init__()
+        self.all_features = sorted(glob.glob(os.path.join(path_features, '*.npy')))
+        print('Length of dataset: ', len(self.all_features))
+
+        self.tauf = cfg['tauf']
+        # Same default as data/generate_temporal_graphs.py
+        self.skip_factor = cfg.get('skip_factor', 1000)
+        self.similarity_metric = cfg.get('similarity_metric')
+        self.similarity_threshold = cfg.get('similarity_threshold')
+        self.similarity_topk = cfg.get('similarity_topk')
+        if self.similarity_metric == 'None':
+            self.similarity_metric = None
+        if self.similarity_topk == 'None':
+            self.similarity_topk = None
+        self.sample_rate = cfg.get('sample_rate', 1)
+        self.compact_edges = cfg.get('compact_edges', False)
+        self.view_hub = cfg.get('view_hub', False)
+
+        # Build a mapping from action classes to action ids
+        root_data = cfg['root_data']
+        dataset = cfg['annotations_dataset']
+        actions = {}
+        with open(os.path.join(root_data, f'annotations/{dataset}/mapping.txt')) as f:
+            for line in f:
+                aid, cls = line.strip().split(' ')
+                actions[cls] = int(aid)
+        catalog = DatasetCatalog(root_data, dataset)
+
+        # Exo views are stored as <video_id>_<view>.npy under the "-exo" features, and are matched to
+        # the ego view <video_id>_0.npy by their exact video id, following the graph generation
+        multiview_data_files = {}
+        if cfg.get('add_multiview'):
+            path_split, sp = os.path.split(os.path.normpath(path_features))
+            path_root, split = os.path.split(path_split)
+            for multiview_data_file in sorted(glob.glob(os.path.join(f'{path_root}-exo', split, sp, '*.npy'))):
+                vid = '_'.join(os.path.basename(multiview_data_file).split('_')[:-1])
+                multiview_data_files.setdefault(vid, []).append(multiview_data_file)
+
+        self.all_multiview_features = []
+        self.all_labels = []
+        self.all_batch_idxs = []
+        self.all_g = []
+        for data_file in self.all_features:
+            take_name = os.path.splitext(os.path.basename(data_file))[0]
+            video_id = take_name
+            if not catalog.has_video(video_id):
+                video_id = take_name.rsplit('_', 1)[0]
+
+            list_multiview_data_files = multiview_data_files.get(take_name.rsplit('_', 1)[0], [])
+
+            # The features are memory-mapped, so only their headers are read to check their shapes
+            feature_shape = load_features(data_file).shape
+            for multiview_data_file in list_multiview_data_files:
+                multiview_shape = load_features(multiview_data_file).shape
+                if multiview_shape != feature_shape:
+                    raise ValueError(f'Shape of the features of {multiview_data_file} does not match {data_file}: '
+                                     f'{multiview_shape} | {feature_shape}')
+
+            label = load_labels(video_id=video_id, actions=actions, root_data=root_data, annotation_dataset=dataset)
+            if cfg.get('load_segmentwise', True) and feature_shape[0] != len(label):
+                raise ValueError(f'Length of feature and label does not match for {video_id}: {feature_shape[0]} | {len(label)}')
+            batch_idx_designation = 0
+            if not cfg.get('load_segmentwise', True):
+                untrimmed_batch_idxs = load_batch_indices(os.path.join(root_data, 'annotations', dataset, 'batch_idx'), video_id)
+                batch_idx_designation = [i for i in untrimmed_batch_idxs if i != -1]
+                label = reduce_segments(batch_idx_designation, label=label)[1].tolist()
+
+            self.all_multiview_features.append(list_multiview_data_files)
+            self.all_labels.append(np.array(label, dtype=np.int64)[::self.sample_rate])
+            self.all_batch_idxs.append(np.array(batch_idx_designation, dtype=np.int64))
+            self.all_g.append(catalog.get_global_id(video_id))
+
+    def len(self):
+        return len(self.all_features)
+
+    def get(self, idx):
+        feature = load_features(self.all_features[idx])
+        list_feature = [feature] + [load_features(f) for f in self.all_multiview_features[idx]]
+        num_view = len(list_feature)
+        num_frame = feature.shape[0]
+
+        node_source, node_target, edge_attr, _ = get_video_edges(feature, self.tauf, skip_factor=self.skip_factor, num_view=num_view,
+                                                                 similarity_metric=self.similarity_metric,
+                                                                 similarity_threshold=self.similarity_threshold,
+                                                                 similarity_topk=self.similarity_topk, view_hub=self.view_hub)
+
+        # Nodes are ordered view by view (followed by the view hubs), following the graph generation
+        num_hub = num_frame if self.view_hub and num_view > 1 else 0
+        x = assemble_features(list_feature, num_rows=num_view*num_frame + num_hub)
+        label = np.tile(self.all_labels[idx], num_view)
+        batch_idxs = self.all_batch_idxs[idx]
+        view_idxs = np.array([], dtype=np.int64)
+        if num_view > 1:
+            if batch_idxs.ndim:
+                batch_idxs = np.tile(batch_idxs, num_view)
+            view_idxs = np.repeat(np.arange(num_view), num_frame)
+
+            # View hub nodes come after all the views, following the graph generation
+            if self.view_hub:
+                x[num_view*num_frame:] = get_view_hub_features([x[i*num_frame:(i+1)*num_frame] for i in range(num_view)])
+                label = np.concatenate((label, np.full(len(self.all_labels[idx]), VIEW_HUB_LABEL, dtype=label.dtype)))
+                if batch_idxs.ndim:
+                    batch_idxs = np.concatenate((batch_idxs, self.all_batch_idxs[idx]))
+                view_idxs = np.repeat(np.arange(num_view+1), num_frame)
+
+        data = Data(x = torch.from_numpy(x),
+                    g = self.all_g[idx],
+                    edge_index = torch.from_numpy(np.stack((node_source, node_target))),
+                    edge_attr = torch.tensor(edge_attr),
+                    y = torch.from_numpy(label),
+                    batch_idxs = torch.from_numpy(batch_idxs),
+                    view_idxs = torch.from_numpy(view_idxs))
+        if self.compact_edges:
+            data = compact_edges(data)
+        return data
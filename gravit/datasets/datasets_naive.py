@@ -96,7 +96,7 @@ class EgoExoOmnivoreDataset(Dataset):
         #     video_id = video_id[0:-2] 
 
         # Load the features and labels
-        feature = load_features(data_file)
+        feature = load_features(data_file, dtype=np.float32)
         take_name = os.path.splitext(os.path.basename(data_file))[0]
         take_name = take_name.rsplit('_', 1)[0]
         actions = self.actions
@@ -0,0 +1,192 @@
+import copy
+import queue
+import torch
+import threading
+from torch_geometric.data import Batch, HeteroData
+from .sampler import get_batch_sampler
+
+
+# End of the batches of a DevicePrefetcher
+_END = object()
+
+
+def _is_same_tensor(a, b):
+    return a.data_ptr() == b.data_ptr() and a.dtype == b.dtype and a.shape == b.shape and a.stride() == b.stride()
+
+
+def get_shared_edge_types(data):
+    """
+    Get a mapping from every relation of a heterogeneous graph whose edge tensors are the ones of a previous relation
+    to that relation, if batching them gives the same result (the source and target node types have the same sizes)
+    """
+
+    aliases = {}
+    if not isinstance(data, HeteroData):
+        return aliases
+
+    edge_types = data.edge_types
+    for i, edge_type in enumerate(edge_types):
+        store = data[edge_type]
+        for canonical in edge_types[:i]:
+            if canonical in aliases:
+                continue
+
+            store_canonical = data[canonical]
+            if set(store.keys()) != set(store_canonical.keys()):
+                continue
+            if not all(_is_same_tensor(store[key], store_canonical[key]) for key in store.keys()):
+                continue
+            if data[edge_type[0]].num_nodes != data[canonical[0]].num_nodes or data[edge_type[2]].num_nodes != data[canonical[2]].num_nodes:
+                continue
+
+            aliases[edge_type] = canonical
+            break
+
+    return aliases
+
+
+def collate_shared_edges(data_list):
+    """
+    Batch a list of graphs, where the relations sharing their edge tensors in every graph are batched only once
+    and share the batched tensors
+    """
+
+    aliases = get_shared_edge_types(data_list[0])
+    for data in data_list[1:]:
+        aliases_data = get_shared_edge_types(data)
+        aliases = {alias: canonical for alias, canonical in aliases.items() if aliases_data.get(alias) == canonical}
+
+    if aliases:
+        data_list = [copy.copy(data) for data in data_list]
+        for data in data_list:
+            for edge_type in aliases:
+                del data[edge_type]
+
+    batch = Batch.from_data_list(data_list)
+    for alias, canonical in aliases.items():
+        for key, value in batch[canonical].items():
+            batch[alias][key] = value
+
+    return batch
+
+
+class SharedEdgeLoader(torch.utils.data.DataLoader):
+    """
+    Data loader of graphs that batches the edge tensors shared by several relations only once (see collate_shared_edges)
+    """
+
+    def __init__(self, dataset, batch_size=1, shuffle=False, **kwargs):
+        kwargs.pop('collate_fn', None)
+        super(SharedEdgeLoader, self).__init__(dataset, batch_size=batch_size, shuffle=shuffle, collate_fn=collate_shared_edges, **kwargs)
+
+
+def get_loader_kwargs(cfg, dataset=None):
+    """
+    Get the keyword arguments of the data loaders from the configuration
+    With the training "dataset", the batches are packed by get_batch_sampler (batch_nodes or batch_edges)
+    or hold cfg['batch_size'] shuffled graphs; otherwise, they hold single graphs in order
+        loader_workers:     number of worker processes loading the graphs (default: 0, in the main process)
+        persistent_workers: keep the workers alive between the epochs (default: True with workers)
+        prefetch_factor:    number of batches loaded in advance by every worker (default: 2)
+        pin_memory:         copy the batches into pinned memory for faster copies to the GPU (default: False)
+    """
+
+    kwargs = {'num_workers': cfg.get('loader_workers') or 0}
+    if dataset is not None:
+        batch_sampler = get_batch_sampler(dataset, cfg)
+        if batch_sampler is not None:
+            kwargs['batch_sampler'] = batch_sampler
+        else:
+            kwargs['batch_size'] = cfg['batch_size']
+            kwargs['shuffle'] = True
+    if kwargs['num_workers'] > 0:
+        kwargs['persistent_workers'] = cfg.get('persistent_workers', True)
+        kwargs['prefetch_factor'] = cfg.get('prefetch_factor') or 2
+    if cfg.get('pin_memory', False) and torch.cuda.is_available():
+        kwargs['pin_memory'] = True
+
+    return kwargs
+
+
+class DevicePrefetcher:
+    """
+    Iterate over a data loader while a background thread copies the next "num_prefetch" batches to the device,
+    so that loading and copying the next batch overlaps with the current step
+    On the GPU, the copies run on a separate CUDA stream (non-blocking from pinned memory)
+    """
+
+    def __init__(self, loader, device, num_prefetch=1):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.num_prefetch = num_prefetch
+
+    def __len__(self):
+        return len(self.loader)
+
+    def _to_device(self, batch, stream):
+        if stream is None:
+            return batch.to(self.device)
+
+        with torch.cuda.stream(stream):
+            batch = batch.to(self.device, non_blocking=True)
+        stream.synchronize()
+        return batch
+
+    def _produce(self, batches, stop, stream):
+        try:
+            for batch in self.loader:
+                batch = self._to_device(batch, stream)
+                while not stop.is_set():
+                    try:
+                        batches.put(batch, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            batches.put(_END)
+        except BaseException as e:
+            batches.put(e)
+
+    def __iter__(self):
+        stream = torch.cuda.Stream(self.device) if self.device.type == 'cuda' else None
+        batches = queue.Queue(maxsize=self.num_prefetch)
+        stop = threading.Event()
+        thread = threading.Thread(target=self._produce, args=(batches, stop, stream), daemon=True)
+        thread.start()
+
+        try:
+            while True:
+                batch = batches.get()
+                if batch is _END:
+                    break
+                if isinstance(batch, BaseException):
+                    raise batch
+                if stream is not None:
+                    # The tensors allocated on the copy stream are used on the current stream from now on
+                    for store in batch.stores:
+                        for value in store.values():
+                            if torch.is_tensor(value) and value.is_cuda:
+                                value.record_stream(torch.cuda.current_stream(self.device))
+                yield batch
+        finally:
+            stop.set()
+            # Unblock the thread if it is waiting for a free slot
+            while thread.is_alive():
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            thread.join()
+
+
+def get_device_loader(loader, device, cfg):
+    """
+    Wrap a data loader with a DevicePrefetcher when cfg['device_prefetch'] (number of batches staged on the device) is set
+    """
+
+    num_prefetch = cfg.get('device_prefetch') or 0
+    if num_prefetch <= 0:
+        return loader
+
+    return DevicePrefetcher(loader, device, num_prefetch)
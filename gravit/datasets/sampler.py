@@ -0,0 +1,81 @@
+import torch
+import numpy as np
+
+
+class NodeBudgetBatchSampler(torch.utils.data.Sampler):
+    """
+    Batch sampler that packs the graphs into batches of at most "max_size" in total (e.g. number of nodes or edges),
+    given the size of every graph, instead of a fixed number of graphs per batch
+    The graphs are sorted by size and split into "num_buckets" buckets of similar sizes; with "shuffle", the graphs
+    are shuffled within their bucket and the batches are shuffled across the buckets at every epoch
+    A graph larger than "max_size" forms a batch on its own
+    """
+
+    def __init__(self, sizes, max_size, num_buckets=10, shuffle=True, seed=0):
+        self.sizes = np.asarray(sizes, dtype=np.int64)
+        self.max_size = max_size
+        self.num_buckets = max(1, min(num_buckets, len(self.sizes)))
+        self.shuffle = shuffle
+        self.seed = seed
+        self.epoch = 0
+        self.batches = None
+
+    def _pack(self, indices):
+        batches = []
+        batch, size = [], 0
+        for idx in indices:
+            if batch and size + self.sizes[idx] > self.max_size:
+                batches.append(batch)
+                batch, size = [], 0
+            batch.append(int(idx))
+            size += self.sizes[idx]
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+    def _get_batches(self):
+        rng = np.random.default_rng((self.seed, self.epoch))
+        order = np.argsort(self.sizes, kind='stable')
+
+        batches = []
+        for bucket in np.array_split(order, self.num_buckets):
+            if self.shuffle:
+                bucket = rng.permutation(bucket)
+            batches.extend(self._pack(bucket))
+
+        if self.shuffle:
+            batches = [batches[i] for i in rng.permutation(len(batches))]
+
+        return batches
+
+    def __len__(self):
+        # The batches of the next epoch are packed in advance to know their number
+        if self.batches is None:
+            self.batches = self._get_batches()
+
+        return len(self.batches)
+
+    def __iter__(self):
+        if self.batches is None:
+            self.batches = self._get_batches()
+        batches, self.batches = self.batches, None
+        self.epoch += 1
+
+        return iter(batches)
+
+
+def get_batch_sampler(dataset, cfg):
+    """
+    Get a NodeBudgetBatchSampler of the training graphs when cfg['batch_nodes'] (maximum number of nodes per batch)
+    or cfg['batch_edges'] (maximum number of edges per batch) is set, None otherwise
+    cfg['num_buckets'] is the number of buckets of graphs of similar sizes (default: 10)
+    """
+
+    for key, size_key in (('batch_nodes', 'num_nodes'), ('batch_edges', 'num_edges')):
+        if cfg.get(key):
+            if not hasattr(dataset, 'get_graph_sizes'):
+                raise ValueError(f'{key} requires the sizes of the graphs, which {type(dataset).__name__} does not provide')
+            return NodeBudgetBatchSampler(dataset.get_graph_sizes(size_key), cfg[key], num_buckets=cfg.get('num_buckets') or 10)
+
+    return None
@@ -0,0 +1,238 @@
+import os
+import json
+import numpy as np
+
+
+CATALOG_VERSION = 2
+
+# Suffix of the files that mark an output that was not written (e.g. a video with no segments left
+# in gravit/utils/segmentwise_aggregation.py), which are not part of the dataset
+EMPTY_MARKER_SUFFIX = '.empty'
+
+
+def _count_lines(path):
+    with open(path) as f:
+        return sum(1 for _ in f)
+
+
+class DatasetCatalog:
+    """
+    Index of the annotations and features of a dataset under "root_data", scanned once and saved as JSON
+    (<root_data>/annotations/<dataset>/catalog.json by default):
+        videos:   video id (name of the groundTruth file) -> global id (position among the sorted video ids),
+                  groundTruth and batch_idx files, and number of frames (lines of the groundTruth file)
+        splits:   split -> training video ids (annotations/<dataset>/splits/train.<split>.bundle)
+        features: features name -> split -> train/val -> feature file name -> number of frames
+    The features are indexed the first time they are queried. A part of the index is scanned again
+    when one of its directories was modified (a file was added, removed or replaced) or one of the files
+    it was read from (splits, groundTruth and feature files) has another modification time or size
+    """
+
+    def __init__(self, root_data, dataset, path_catalog=None):
+        self.root_data = root_data
+        self.dataset = dataset
+        self.path_annts = os.path.join(root_data, f'annotations/{dataset}')
+        self.path_catalog = path_catalog or os.path.join(self.path_annts, 'catalog.json')
+
+        self.catalog = {}
+        if os.path.exists(self.path_catalog):
+            with open(self.path_catalog) as f:
+                self.catalog = json.load(f)
+        if self.catalog.get('version') != CATALOG_VERSION:
+            self.catalog = {'version': CATALOG_VERSION, 'annotations': None, 'features': {}}
+
+        if not self._is_valid(self.catalog['annotations']):
+            self.catalog['annotations'] = self._scan_annotations()
+            self.save()
+        self._global_ids = {video_id: video['g'] for video_id, video in self.catalog['annotations']['videos'].items()}
+        self.video_ids = sorted(self._global_ids, key=self._global_ids.get)
+
+    def _get_dir_mtimes(self, list_dirs):
+        return {os.path.relpath(d, self.root_data): os.stat(d).st_mtime_ns for d in list_dirs if os.path.isdir(d)}
+
+    def _get_file_stats(self, list_files):
+        """
+        Get the modification time and size of every file, to detect the files overwritten in place
+        """
+
+        stats = {}
+        for f in list_files:
+            stat = os.stat(f)
+            stats[os.path.relpath(f, self.root_data)] = [stat.st_mtime_ns, stat.st_size]
+
+        return stats
+
+    def _is_valid(self, entry):
+        if entry is None:
+            return False
+
+        for d, mtime in entry['dirs'].items():
+            path = os.path.join(self.root_data, d)
+            if not os.path.isdir(path) or os.stat(path).st_mtime_ns != mtime:
+                return False
+
+        for f, (mtime, size) in entry['files'].items():
+            path = os.path.join(self.root_data, f)
+            if not os.path.isfile(path):
+                return False
+            stat = os.stat(path)
+            if stat.st_mtime_ns != mtime or stat.st_size != size:
+                return False
+
+        return True
+
+    def _scan_annotations(self):
+        """
+        Scan groundTruth, batch_idx and splits of the annotations
+        """
+
+        path_labels = os.path.join(self.path_annts, 'groundTruth')
+        path_batch_idxs = os.path.join(self.path_annts, 'batch_idx')
+        path_splits = os.path.join(self.path_annts, 'splits')
+
+        batch_idx_files = set(os.listdir(path_batch_idxs)) if os.path.isdir(path_batch_idxs) else set()
+        videos = {}
+        list_label_files = [file_name for file_name in sorted(os.listdir(path_labels)) if not file_name.endswith(EMPTY_MARKER_SUFFIX)]
+        for g, file_name in enumerate(list_label_files):
+            video_id = os.path.splitext(file_name)[0]
+            videos[video_id] = {'g': g,
+                                'label': os.path.join('groundTruth', file_name),
+                                'batch_idx': os.path.join('batch_idx', f'{video_id}.txt') if f'{video_id}.txt' in batch_idx_files else None,
+                                'num_frames': _count_lines(os.path.join(path_labels, file_name))}
+
+        splits = {}
+        list_files = [os.path.join(self.path_annts, video['label']) for video in videos.values()]
+        if os.path.isdir(path_splits):
+            for file_name in sorted(os.listdir(path_splits)):
+                if file_name.startswith('train.') and file_name.endswith('.bundle'):
+                    list_files.append(os.path.join(path_splits, file_name))
+                    with open(list_files[-1]) as f:
+                        splits[file_name[len('train.'):-len('.bundle')]] = [os.path.splitext(line.strip())[0] for line in f]
+
+        return {'dirs': self._get_dir_mtimes([path_labels, path_batch_idxs, path_splits]), 'files': self._get_file_stats(list_files),
+                'videos': videos, 'splits': splits}
+
+    def _scan_features(self, features):
+        """
+        Scan the feature files of data/features/<features>/<split>/<train|val>/*.npy and read their number of frames
+        """
+
+        path_features = os.path.join(self.root_data, f'features/{features}')
+        if not os.path.isdir(path_features):
+            # Scanned again once the features are extracted
+            return {'dirs': self._get_dir_mtimes([os.path.dirname(path_features)]), 'files': {}, 'splits': {}}
+
+        list_dirs = [path_features]
+        list_files = []
+        splits = {}
+        for split in sorted(os.listdir(path_features)):
+            path_split = os.path.join(path_features, split)
+            if not os.path.isdir(path_split):
+                continue
+            list_dirs.append(path_split)
+            splits[split] = {}
+            for sp in sorted(os.listdir(path_split)):
+                path_sp = os.path.join(path_split, sp)
+                if not os.path.isdir(path_sp):
+                    continue
+                list_dirs.append(path_sp)
+                list_feature_files = [os.path.join(path_sp, file_name) for file_name in sorted(os.listdir(path_sp)) if file_name.endswith('.npy')]
+                splits[split][sp] = {os.path.basename(f): int(np.load(f, mmap_mode='r').shape[0]) for f in list_feature_files}
+                list_files.extend(list_feature_files)
+
+        return {'dirs': self._get_dir_mtimes(list_dirs), 'files': self._get_file_stats(list_files), 'splits': splits}
+
+    def _get_features(self, features):
+        entry = self.catalog['features'].get(features)
+        if not self._is_valid(entry):
+            entry = self._scan_features(features)
+            self.catalog['features'][features] = entry
+            self.save()
+
+        return entry['splits']
+
+    def save(self):
+        path_tmp = f'{self.path_catalog}.tmp{os.getpid()}'
+        with open(path_tmp, 'w') as f:
+            json.dump(self.catalog, f)
+        os.replace(path_tmp, self.path_catalog)
+
+    def has_video(self, video_id):
+        return video_id in self._global_ids
+
+    def get_global_id(self, video_id):
+        """
+        Get the global id of a video (its position among the sorted video ids)
+        """
+
+        if video_id not in self._global_ids:
+            raise ValueError(f'{video_id} is not in the annotations of {self.dataset}')
+
+        return self._global_ids[video_id]
+
+    def get_global_ids(self):
+        """
+        Get the mapping from every video id to its global id
+        """
+
+        return dict(self._global_ids)
+
+    def get_label_path(self, video_id):
+        return os.path.join(self.path_annts, self.catalog['annotations']['videos'][video_id]['label'])
+
+    def get_batch_idx_path(self, video_id):
+        batch_idx = self.catalog['annotations']['videos'][video_id]['batch_idx']
+        return None if batch_idx is None else os.path.join(self.path_annts, batch_idx)
+
+    def get_num_frames(self, video_id):
+        """
+        Get the number of frames of a video in its groundTruth file
+        """
+
+        return self.catalog['annotations']['videos'][video_id]['num_frames']
+
+    def get_train_ids(self, split):
+        """
+        Get the training video ids of a split
+        """
+
+        splits = self.catalog['annotations']['splits']
+        if split not in splits:
+            raise ValueError(f'train.{split}.bundle is not in the splits of {self.dataset}')
+
+        return list(splits[split])
+
+    def get_splits(self, features):
+        """
+        Get the splits of the features (the directories of data/features/<features>)
+        """
+
+        return sorted(self._get_features(features))
+
+    def get_feature_files(self, features, split, sp=None):
+        """
+        Get the sorted list of the feature files of a split (of its train or val subset if "sp" is given)
+        """
+
+        subsets = self._get_features(features).get(split, {})
+        list_sp = sorted(subsets) if sp is None else [sp]
+
+        return sorted(os.path.join(self.root_data, f'features/{features}/{split}/{s}/{file_name}')
+                      for s in list_sp for file_name in subsets.get(s, {}))
+
+    def get_feature_file(self, features, split, sp, file_name):
+        """
+        Get the path of a feature file, or None if it does not exist
+        """
+
+        if file_name not in self._get_features(features).get(split, {}).get(sp, {}):
+            return None
+
+        return os.path.join(self.root_data, f'features/{features}/{split}/{sp}/{file_name}')
+
+    def get_feature_length(self, features, split, sp, file_name):
+        """
+        Get the number of frames of a feature file
+        """
+
+        return self._get_features(features)[split][sp][file_name]
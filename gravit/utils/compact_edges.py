@@ -0,0 +1,65 @@
+import torch
+from torch_geometric.data import Data
+
+
+class CompactData(Data):
+    """
+    Graph with a compact edge encoding, sorted by source node:
+        edge_ptr:  int32 CSR row pointers without the leading 0 (edge_ptr[i] is the end of the edges of node i)
+        edge_col:  int32 target node of every edge
+        edge_type: int8 edge type (the value of edge_attr)
+    instead of the int64 edge_index and float32 edge_attr
+    Batching keeps the compact encoding (the offsets are shifted per graph), and expand_edges restores
+    edge_index and edge_attr on the batch
+    """
+
+    def __inc__(self, key, value, *args, **kwargs):
+        if key == 'edge_ptr':
+            return self.edge_col.numel()
+        if key == 'edge_col':
+            return self.num_nodes
+        return super().__inc__(key, value, *args, **kwargs)
+
+
+def compact_edges(data):
+    """
+    Convert a graph with edge_index and edge_attr (integer values only) into a CompactData
+    """
+
+    edge_attr = data.edge_attr.view(-1)
+    edge_type = edge_attr.to(torch.int8)
+    if not torch.equal(edge_type.to(edge_attr.dtype), edge_attr):
+        raise ValueError('Only integer edge attributes in the int8 range can be compacted')
+
+    num_nodes = data.num_nodes
+    order = torch.sort(data.edge_index[0], stable=True)[1]
+    source, target = data.edge_index[:, order]
+
+    compact = CompactData()
+    for key in data.keys():
+        if key not in ('edge_index', 'edge_attr'):
+            compact[key] = data[key]
+    compact.edge_ptr = torch.cumsum(torch.bincount(source, minlength=num_nodes), 0).to(torch.int32)
+    compact.edge_col = target.to(torch.int32)
+    compact.edge_type = edge_type[order]
+
+    return compact
+
+
+def expand_edges(data):
+    """
+    Restore edge_index (int64) and edge_attr (float32) of a CompactData (or a batch of them) in place,
+    on the device of the compact tensors; other graphs are returned unchanged
+    """
+
+    if 'edge_ptr' not in data.keys():
+        return data
+
+    edge_ptr = data.edge_ptr.long()
+    degree = torch.diff(edge_ptr, prepend=edge_ptr.new_zeros(1))
+    source = torch.repeat_interleave(torch.arange(edge_ptr.numel(), device=edge_ptr.device), degree)
+    data.edge_index = torch.stack((source, data.edge_col.long()))
+    data.edge_attr = data.edge_type.float()
+    del data.edge_ptr, data.edge_col, data.edge_type
+
+    return data
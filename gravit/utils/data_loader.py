@@ -12,17 +12,67 @@ ANNOTATIONS_PATH = os.path.join(CLI_OUTPUT_DIR, "annotations")
 def get_segment_labels_by_batch_idxs(label, batch_idx_designation):
     """ Returns the segmentwise labels and the corresponding batch indices for the given labels"""
     assert len(label) == len(batch_idx_designation), "Length of label and batch_idx_designation must be the same"
-    segment_labels = []
 
-    for idx in np.unique(batch_idx_designation):
-        if idx == -1:
-            continue
-        # select indices where batch_idx_designation is idx
-        labels_per_segment = [label[i] for i in range(len(label)) if batch_idx_designation[i] == idx]
-
-        segment_labels.append(labels_per_segment)
-
-    return segment_labels
+    # Group the frames by batch index in one stable sort instead of scanning the labels for every segment
+    batch_idx_designation = np.asarray(batch_idx_designation)
+    order = np.argsort(batch_idx_designation, kind='stable')
+    order = order[batch_idx_designation[order] != -1]
+    _, starts = np.unique(batch_idx_designation[order], return_index=True)
+
+    return [[label[i] for i in segment] for segment in np.split(order, starts[1:])] if len(order) else []
+
+
+def reduce_segments(batch_idx_designation, label=None, feature=None, ties='first'):
+    """
+    Reduce the framewise labels and features of a video to one value per segment (batch index, -1 being ignored)
+    with a single grouping of the frames: the mode of the labels and the mean of the features of every segment
+    The segments are in increasing order of their batch index, as with get_segment_labels_by_batch_idxs
+    A tie between the most frequent labels goes to the label seen first in the segment ("first", as statistics.mode)
+    or to the smallest label ("smallest", as np.argmax(np.bincount(...)))
+
+    Returns the batch index, the mode label (None without "label") and the mean feature (None without "feature")
+    of every segment as numpy arrays
+    """
+
+    if ties not in ('first', 'smallest'):
+        raise ValueError(f'Unknown tie-breaking rule: {ties}')
+
+    batch_idx_designation = np.asarray(batch_idx_designation)
+    valid = batch_idx_designation != -1
+    segment_ids, segment, counts = np.unique(batch_idx_designation[valid], return_inverse=True, return_counts=True)
+    num_segments = len(segment_ids)
+
+    segment_label = None
+    if label is not None:
+        assert len(label) == len(batch_idx_designation), "Length of label and batch_idx_designation must be the same"
+        values, code = np.unique(np.asarray(label)[valid], return_inverse=True)
+
+        # Count every (segment, label) pair and keep its first frame, then pick the best pair of each segment
+        pairs, first, pair_counts = np.unique(segment * len(values) + code, return_index=True, return_counts=True)
+        pair_segment, pair_code = np.divmod(pairs, len(values))
+        order = np.lexsort((first if ties == 'first' else pair_code, -pair_counts, pair_segment))
+        best = order[np.r_[True, pair_segment[order][1:] != pair_segment[order][:-1]]] if len(order) else order
+        segment_label = values[pair_code[best]]
+
+    segment_feature = None
+    if feature is not None:
+        assert len(feature) == len(batch_idx_designation), "Length of feature and batch_idx_designation must be the same"
+        if not isinstance(feature, np.ndarray):
+            feature = np.asarray(feature)
+
+        # Frames grouped by segment with a single stable sort (already grouped for sorted batch indices),
+        # so every segment is averaged over its own frames only; contiguous frames are read as slices without copies
+        frames = np.flatnonzero(valid)
+        if np.any(np.diff(segment) < 0):
+            frames = frames[np.argsort(segment, kind='stable')]
+        segment_feature = np.empty((num_segments,) + feature.shape[1:], dtype=feature.dtype)
+        for i, frames_segment in enumerate(np.split(frames, np.cumsum(counts)[:-1]) if num_segments else []):
+            if frames_segment[-1] - frames_segment[0] + 1 == len(frames_segment):
+                segment_feature[i] = np.mean(feature[frames_segment[0]:frames_segment[-1]+1], axis=0)
+            else:
+                segment_feature[i] = np.mean(feature[frames_segment], axis=0)
+
+    return segment_ids, segment_label, segment_feature
 
 
 def load_batch_indices(batch_idx_path, take_name):
@@ -32,8 +82,41 @@ def load_batch_indices(batch_idx_path, take_name):
     return loaded
 
 
-def load_features(data_file):
-    return np.load(data_file)
+def load_features(data_file, dtype=None):
+    """
+    Memory-map the features of a video (.npy), so that they are only read from the disk when they are used
+    The mapping is copy-on-write: writes to the features stay private and never modify the file
+    If "dtype" is given and the features are stored with another dtype (e.g. float16), they are converted in memory
+    """
+
+    feature = np.load(data_file, mmap_mode='c')
+    if dtype is not None and feature.dtype != dtype:
+        feature = feature.astype(dtype)
+
+    return feature
+
+
+def assemble_features(list_feature, num_rows=None, dtype=np.float32):
+    """
+    Stack the features of the views of a video (e.g. memory-mapped ego and exo features) along the nodes
+    by writing each view directly into a single preallocated array of "dtype", which also converts the features
+    stored with another dtype (e.g. float16) without intermediate copies
+    "num_rows" rows are allocated (the total number of rows of the views by default), so that additional nodes
+    can be written after the views
+    """
+
+    num_rows_views = sum(len(feature) for feature in list_feature)
+    if num_rows is None:
+        num_rows = num_rows_views
+    assert num_rows >= num_rows_views, f'{num_rows} rows cannot hold the {num_rows_views} rows of the views'
+
+    out = np.empty((num_rows,) + np.shape(list_feature[0])[1:], dtype=dtype)
+    start = 0
+    for feature in list_feature:
+        out[start:start+len(feature)] = feature
+        start += len(feature)
+
+    return out
 
 
 def load_labels(actions, root_data, annotation_dataset, video_id,  load_descriptions=False):
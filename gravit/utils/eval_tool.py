@@ -21,6 +21,7 @@ import heapq
 import h5py
 from .ava import object_detection_evaluation
 from .ava import standard_fields
+from .catalog import DatasetCatalog
 from mycolorpy import colorlist as mcp
 import os
 from sklearn.metrics import top_k_accuracy_score
@@ -952,9 +953,10 @@ def error_analysis(cfg, preds):
       # now for each class, get the counts of incorrect predictions for each other class
       incorrect_counts = np.zeros([len(actions), len(actions)])
       label_idx_map = actions
+      catalog = DatasetCatalog(cfg['root_data'], cfg['dataset'])
       for i, (video_id, pred) in enumerate(preds):
           
-          if (video_id + '.txt') not in os.listdir(os.path.join(path_annts, f'{cfg["dataset"]}/groundTruth')):
+          if not catalog.has_video(video_id):
               print(f'Skipping {video_id}')
               continue
           
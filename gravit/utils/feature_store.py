@@ -0,0 +1,98 @@
+import os
+import pickle  #nosec
+import numpy as np
+
+
+def get_columns(data):
+    """
+    Convert the per-video dictionary of an AVA feature pickle (frame_timestamp -> list of entities) into columns:
+        frame_timestamp: float64 [F]     every frame timestamp, in increasing order
+        timestamp:       float64 [N]     frame timestamp of every entity
+        feature:         float32 [N, D]
+        box:             float64 [N, 4]  person_box as x1, y1, x2, y2
+        label:           float32 [N] or [N, C]
+        person_id:       str [N]
+        global_id:       int64 [N]
+    The entities are ordered by frame timestamp, then in their order in the pickle
+    """
+
+    list_fts = sorted([float(frame_timestamp) for frame_timestamp in data.keys()])
+
+    timestamp, feature, box, label, person_id, global_id = [], [], [], [], [], []
+    for fts in list_fts:
+        for entity in data[f'{fts:g}']:
+            timestamp.append(fts)
+            feature.append(entity['feature'])
+            box.append([float(c) for c in entity['person_box'].split(',')])
+            label.append(entity['label'])
+            person_id.append(entity['person_id'])
+            global_id.append(entity['global_id'])
+
+    return {'frame_timestamp': np.array(list_fts, dtype=np.float64),
+            'timestamp': np.array(timestamp, dtype=np.float64),
+            'feature': np.array(feature, dtype=np.float32),
+            'box': np.array(box, dtype=np.float64).reshape(-1, 4),
+            'label': np.array(label, dtype=np.float32),
+            'person_id': np.array(person_id),
+            'global_id': np.array(global_id, dtype=np.int64)}
+
+
+def _get_timestamp_scale(timestamp):
+    """
+    Get the smallest scale that stores the timestamps exactly as integers (timestamp * scale)
+    """
+
+    for scale in (1, 10, 100, 1000, 10**4, 10**5, 10**6):
+        if np.array_equal(np.round(timestamp * scale) / scale, timestamp):
+            return scale
+
+    raise ValueError('Timestamps cannot be stored exactly as integers')
+
+
+def save_columns(columns, path_columns):
+    """
+    Save the columns of a video into an uncompressed .npz file, with the timestamps stored as integers
+    """
+
+    columns = dict(columns)
+    scale = _get_timestamp_scale(np.concatenate((columns['frame_timestamp'], columns['timestamp'])))
+    for key in ('frame_timestamp', 'timestamp'):
+        columns[key] = np.round(columns[key] * scale).astype(np.int64)
+    columns['timestamp_scale'] = np.array(scale, dtype=np.int64)
+
+    path_tmp = f'{path_columns}.tmp{os.getpid()}'
+    with open(path_tmp, 'wb') as f:
+        np.savez(f, **columns)
+    os.replace(path_tmp, path_columns)
+
+
+def get_columns_path(data_file):
+    """
+    Get the path of the columnar file of a feature pickle (<video_id>.npz next to <video_id>.pkl)
+    """
+
+    return f'{os.path.splitext(data_file)[0]}.npz'
+
+
+def load_columns(data_file, keys=None):
+    """
+    Load the columns ("keys", or all of them) of the video of a feature pickle
+    The columnar file written by data/convert_ava_features.py is read if it is up to date, and the pickle otherwise
+    """
+
+    path_columns = get_columns_path(data_file)
+    if not os.path.exists(path_columns) or os.path.getmtime(path_columns) < os.path.getmtime(data_file):
+        with open(data_file, 'rb') as f:
+            columns = get_columns(pickle.load(f))  #nosec
+        return columns if keys is None else {key: columns[key] for key in keys}
+
+    columns = {}
+    with np.load(path_columns) as f:
+        scale = f['timestamp_scale'].item()
+        for key in (f.files if keys is None else keys):
+            if key in ('frame_timestamp', 'timestamp'):
+                columns[key] = f[key] / scale
+            elif key != 'timestamp_scale':
+                columns[key] = f[key]
+
+    return columns
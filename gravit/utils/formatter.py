@@ -1,7 +1,8 @@
 import os
 import glob
 import torch
-import pickle  #nosec
+from gravit.utils.feature_store import load_columns
+from gravit.utils.catalog import DatasetCatalog
 
 
 def get_formatting_data_dict(cfg):
@@ -23,20 +24,14 @@ def get_formatting_data_dict(cfg):
         for data_file in list_data_files:
             video_id = os.path.splitext(os.path.basename(data_file))[0]
 
-            with open(data_file, 'rb') as f:
-                data = pickle.load(f) #nosec
-
-            # Get a list of frame_timestamps
-            list_fts = sorted([float(frame_timestamp) for frame_timestamp in data.keys()])
-
-            # Iterate over all the frame_timestamps and retrieve the required data for evaluation
-            for fts in list_fts:
-                frame_timestamp = f'{fts:g}'
-                for entity in data[frame_timestamp]:
-                    data_dict[entity['global_id']] = {'video_id': video_id,
-                                                      'frame_timestamp': frame_timestamp,
-                                                      'person_box': entity['person_box'],
-                                                      'person_id': entity['person_id']}
+            # Retrieve the required data for evaluation (the columnar file is used if it exists)
+            columns = load_columns(data_file, keys=('timestamp', 'box', 'person_id', 'global_id'))
+            for frame_timestamp, person_box, person_id, global_id in zip(columns['timestamp'].tolist(), columns['box'].tolist(),
+                                                                         columns['person_id'].tolist(), columns['global_id'].tolist()):
+                data_dict[global_id] = {'video_id': video_id,
+                                        'frame_timestamp': frame_timestamp,
+                                        'person_box': person_box,
+                                        'person_id': person_id}
     elif 'AS' in cfg['eval_type'] or 'KR' in cfg['eval_type']:
         # Build a mapping from action ids to action classes
         data_dict['actions'] = {}
@@ -46,7 +41,7 @@ def get_formatting_data_dict(cfg):
                 data_dict['actions'][int(aid)] = cls
 
         # Get a list of all video ids
-        data_dict['all_ids'] = sorted([os.path.splitext(v)[0] for v in os.listdir(os.path.join(root_data, f'annotations/{dataset}/groundTruth'))])
+        data_dict['all_ids'] = DatasetCatalog(root_data, dataset).video_ids
 
     return data_dict
 
@@ -66,8 +61,8 @@ def get_formatted_preds(cfg, logits, g, data_dict):
         for scores, global_id in zip(scores_all, g):
             data = data_dict[global_id]
             video_id = data['video_id']
-            frame_timestamp = float(data['frame_timestamp'])
-            x1, y1, x2, y2 = [float(c) for c in data['person_box'].split(',')]
+            frame_timestamp = data['frame_timestamp']
+            x1, y1, x2, y2 = data['person_box']
 
             if eval_type == 'AVA_ASD':
                 # Line formatted following Challenge #2: http://activity-net.org/challenges/2019/tasks/guest_ava.html
@@ -107,6 +102,40 @@ def get_formatted_preds(cfg, logits, g, data_dict):
     return preds
 
 
+def get_window_core_logits(cfg, logits, window):
+    """
+    Get the model output of the core frames of a window graph: the nodes of its first view without the halo frames
+    window: (start, end, core_start, core_end, num_frame) of the window in the frames of the video
+    """
+
+    start, _, core_start, core_end, _ = window
+    index = slice(core_start - start, core_end - start)
+
+    # The refinement stages are stacked before the nodes
+    if cfg['use_ref']:
+        return logits[:, index]
+
+    return logits[index]
+
+
+def stitch_window_logits(cfg, windows, g, window, logits):
+    """
+    Collect the core output of a window graph of the video "g" in "windows" (a dict shared by all the windows)
+    Once the core frames of the video are all collected, they are removed from "windows" and the model output
+    of the whole video is returned in the order of the frames; None is returned until then
+    """
+
+    cores = windows.setdefault(g, [])
+    cores.append((window[2], window[3], get_window_core_logits(cfg, logits, window)))
+    if sum(core_end - core_start for core_start, core_end, _ in cores) < window[4]:
+        return None
+
+    del windows[g]
+    cores = [core for _, _, core in sorted(cores, key=lambda core: core[0])]
+
+    return torch.cat(cores, dim=1 if cfg['use_ref'] else 0)
+
+
 def get_formatted_preds_egoexo_omnivore(cfg, logits, g, data_dict):
     """
     This data is handled differently because the downsampling is done with windows and not a clean downsampling rate.
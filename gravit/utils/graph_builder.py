@@ -0,0 +1,451 @@
+import os
+import numpy as np
+from functools import lru_cache
+
+
+def _get_frame_offsets(tauf, skip_factor):
+    """
+    Get the frame differences (i - j) of every temporal edge ij in a single view, sorted in descending order
+
+    e.g.
+    input:
+        tauf:           2
+        skip_factor:    3
+    output:
+        offsets:        [6, 3, 2, 1, 0, -1, -2, -3, -6]
+    """
+
+    offsets = np.arange(-tauf, tauf+1)
+
+    # Additional connections between non-adjacent nodes (multiples of skip_factor outside of the tauf band)
+    if skip_factor:
+        skip_offsets = np.arange(-skip_factor*tauf, skip_factor*tauf+1, skip_factor)
+        offsets = np.concatenate((offsets, skip_offsets[np.abs(skip_offsets) > tauf]))
+
+    return np.sort(offsets)[::-1]
+
+
+# Version of the edge construction, part of the name of the edge templates cached on disk,
+# to be incremented whenever get_temporal_edges changes the edges it returns
+BUILDER_VERSION = 1
+
+
+# Label of the view hub nodes, ignored by the cross-entropy losses (default ignore_index of CrossEntropyLoss)
+VIEW_HUB_LABEL = -100
+
+
+def get_temporal_edges(num_frame, tauf, skip_factor=0, num_view=1, add_exo_edges=True, view_hub=False):
+    """
+    Get the edge information of a temporal graph with "num_view" views of "num_frame" nodes each
+    Nodes are ordered view by view, so the i-th frame of the k-th view is the node i+num_frame*k
+
+    The edge ij connects the i-th node and j-th node of the same view if |i - j| <= tauf, or if i - j is
+    a multiple of skip_factor and |i - j| <= skip_factor*tauf
+    Positive edge_attr indicates that the edge ij is backward (negative: forward)
+    Nodes of the same frame in different views are connected from the ego view (k=0) to every exo view and,
+    if "add_exo_edges" is set, between every pair of exo views, with edge_attr -2
+    With "view_hub", the views are instead connected through a hub node per frame (the i-th frame hub is the node
+    i+num_frame*num_view, after all the views): every view is connected to and from its hub with edge_attr -2,
+    so the number of cross-view edges is linear in the number of views
+
+    Returns node_source, node_target and edge_attr as numpy arrays
+    """
+
+    # Temporal edges of a single view, ordered by source then target node
+    offsets = _get_frame_offsets(tauf, skip_factor)
+    source = np.repeat(np.arange(num_frame, dtype=np.int64), len(offsets))
+    frame_diff = np.tile(offsets, num_frame)
+    target = source - frame_diff
+    valid = (target >= 0) & (target < num_frame)
+    source, target, frame_diff = source[valid], target[valid], frame_diff[valid]
+
+    # Replicate the temporal edges for every view
+    view_offsets = np.arange(num_view, dtype=np.int64) * num_frame
+    node_source = [(source[None, :] + view_offsets[:, None]).ravel()]
+    node_target = [(target[None, :] + view_offsets[:, None]).ravel()]
+    edge_attr = [np.tile(np.sign(frame_diff), num_view).astype(np.float32)]
+
+    # Cross-view edges between the nodes of the same frame
+    if num_view > 1:
+        frames = np.arange(num_frame, dtype=np.int64)
+        exo_offsets = view_offsets[1:]
+
+        if view_hub:
+            # view -> hub and hub -> view
+            view_nodes = (frames[:, None] + view_offsets[None, :]).ravel()
+            hub_nodes = np.repeat(frames + num_frame*num_view, num_view)
+            node_source.extend((view_nodes, hub_nodes))
+            node_target.extend((hub_nodes, view_nodes))
+        else:
+            # ego -> exo
+            node_source.append(np.repeat(frames, num_view-1))
+            node_target.append((frames[:, None] + exo_offsets[None, :]).ravel())
+
+            # exo -> exo (every ordered pair of exo views, including k == l)
+            if add_exo_edges:
+                node_source.append(np.repeat(frames[:, None] + exo_offsets[None, :], num_view-1, axis=1).ravel())
+                node_target.append(np.tile(frames[:, None] + exo_offsets[None, :], num_view-1).ravel())
+
+        num_cross = sum(len(s) for s in node_source[1:])
+        edge_attr.append(np.full(num_cross, -2, dtype=np.float32))
+
+    return np.concatenate(node_source), np.concatenate(node_target), np.concatenate(edge_attr)
+
+
+def get_view_hub_features(list_feature):
+    """
+    Get the features of the view hub nodes of a video: the mean of the features of all the views at every frame
+    """
+
+    feature = np.array(list_feature[0], dtype=np.float32)
+    for feature_view in list_feature[1:]:
+        feature += feature_view
+
+    return feature / len(list_feature)
+
+
+@lru_cache(maxsize=32)
+def get_temporal_edges_cached(num_frame, tauf, skip_factor=0, num_view=1, add_exo_edges=True, path_cache=None, view_hub=False):
+    """
+    Same as get_temporal_edges, but the edge templates only depend on (num_frame, tauf, skip_factor, num_view, ...),
+    so they are cached in memory and, if "path_cache" is given, on disk to be reused for every video of the same length
+    The returned arrays are shared between the videos and are thus read-only
+    """
+
+    path_template = None
+    if path_cache is not None:
+        name_template = f'v{BUILDER_VERSION}_{num_frame}_{tauf}_{skip_factor}_{num_view}_{int(add_exo_edges)}'
+        if view_hub:
+            name_template += '_hub'
+        path_template = os.path.join(path_cache, f'{name_template}.npz')
+
+    if path_template is not None and os.path.exists(path_template):
+        with np.load(path_template) as template:
+            edges = (template['node_source'], template['node_target'], template['edge_attr'])
+    else:
+        edges = get_temporal_edges(num_frame, tauf, skip_factor, num_view, add_exo_edges, view_hub)
+        if path_template is not None:
+            os.makedirs(path_cache, exist_ok=True)
+            path_tmp = f'{path_template[:-4]}.tmp{os.getpid()}.npz'
+            np.savez(path_tmp, node_source=edges[0], node_target=edges[1], edge_attr=edges[2])
+            os.replace(path_tmp, path_template)
+
+    for edge in edges:
+        edge.flags.writeable = False
+
+    return edges
+
+
+def _gaussian_kernel(sq_dist, sigma=2):
+    return np.exp(-np.maximum(sq_dist, 0) / (2 * (sigma ** 2)))
+
+
+def _get_similarity_block(feature, start, end, metric, sq_norm=None):
+    """
+    Get the similarity between the nodes start:end and every node of the video
+    "feature" is expected to be already normalized when the metric is cosine
+    """
+
+    sim = feature[start:end] @ feature.T
+    if metric == 'gaussian':
+        sim = _gaussian_kernel(sq_norm[start:end, None] + sq_norm[None, :] - 2 * sim)
+
+    return sim
+
+
+def get_similarity_edges(feature, metric, threshold, max_bytes=2**28):
+    """
+    Get the similarity-based edges between every pair of distinct nodes whose similarity is greater than "threshold"
+    The similarities are computed block by block with matrix multiplies, where each block of
+    the similarity matrix takes at most "max_bytes" of memory
+
+    Supported metrics: cosine | gaussian | inner_product
+    Returns node_source, node_target and edge_attr as numpy arrays ordered by source then target node
+    """
+
+    if metric not in ('cosine', 'gaussian', 'inner_product'):
+        raise ValueError(f'Unknown similarity metric: {metric}')
+
+    feature = np.asarray(feature, dtype=np.float32)
+    num_frame = feature.shape[0]
+
+    # Normalize the features once instead of recomputing the norms for every pair
+    sq_norm = None
+    if metric == 'cosine':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            feature = feature / np.linalg.norm(feature, axis=1, keepdims=True)
+    elif metric == 'gaussian':
+        sq_norm = np.einsum('ij,ij->i', feature, feature)
+
+    block_size = max(1, max_bytes // max(1, num_frame * feature.itemsize))
+
+    node_source = []
+    node_target = []
+    for start in range(0, num_frame, block_size):
+        end = min(start + block_size, num_frame)
+        sim = _get_similarity_block(feature, start, end, metric, sq_norm)
+
+        # Exclude self-connections
+        sim[np.arange(end - start), np.arange(start, end)] = -np.inf
+        source, target = np.nonzero(sim > threshold)
+        node_source.append(source + start)
+        node_target.append(target)
+
+    node_source = np.concatenate(node_source).astype(np.int64) if node_source else np.zeros(0, dtype=np.int64)
+    node_target = np.concatenate(node_target).astype(np.int64) if node_target else np.zeros(0, dtype=np.int64)
+    edge_attr = np.sign(node_source - node_target).astype(np.float32)
+
+    return node_source, node_target, edge_attr
+
+
+def _get_topk_per_source(node_source, node_target, sim, k):
+    """
+    Keep the k candidate edges with the highest similarity for every source node
+    """
+
+    order = np.lexsort((-sim, node_source))
+    node_source, node_target, sim = node_source[order], node_target[order], sim[order]
+
+    # Rank of each candidate within its source node
+    group_start = np.flatnonzero(np.r_[True, node_source[1:] != node_source[:-1]])
+    rank = np.arange(len(node_source)) - np.repeat(group_start, np.diff(np.r_[group_start, len(node_source)]))
+    keep = rank < k
+
+    return node_source[keep], node_target[keep], sim[keep]
+
+
+def _get_lsh_candidates(feature, num_bits, window, rng):
+    """
+    Get candidate pairs of similar nodes from a single random-projection LSH table
+    The nodes are sorted by their hash code, and each node is paired with the next "window" nodes
+    sharing the same code, so the number of candidates is linear in the number of nodes
+    """
+
+    num_frame, feature_dim = feature.shape
+    planes = rng.standard_normal((feature_dim, num_bits)).astype(np.float32)
+    code = ((feature @ planes) > 0) @ (1 << np.arange(num_bits, dtype=np.int64))
+
+    # Break ties randomly so that large buckets do not always pair temporally close nodes
+    order = np.lexsort((rng.random(num_frame), code))
+    sorted_code = code[order]
+
+    node_source = [np.zeros(0, dtype=np.int64)]
+    node_target = [np.zeros(0, dtype=np.int64)]
+    for offset in range(1, min(window, num_frame-1) + 1):
+        same = sorted_code[offset:] == sorted_code[:-offset]
+        i, j = order[:-offset][same], order[offset:][same]
+        node_source.extend((i, j))
+        node_target.extend((j, i))
+
+    return np.concatenate(node_source), np.concatenate(node_target)
+
+
+def _get_pair_similarity(feature, node_source, node_target, metric, sq_norm=None, max_bytes=2**28):
+    """
+    Get the similarity of every (node_source, node_target) pair, computed in chunks of at most "max_bytes"
+    """
+
+    chunk_size = max(1, max_bytes // max(1, 2 * feature.shape[1] * feature.itemsize))
+    sim = np.empty(len(node_source), dtype=np.float32)
+    for start in range(0, len(node_source), chunk_size):
+        source, target = node_source[start:start+chunk_size], node_target[start:start+chunk_size]
+        sim[start:start+chunk_size] = np.einsum('ij,ij->i', feature[source], feature[target])
+        if metric == 'gaussian':
+            sim[start:start+chunk_size] = _gaussian_kernel(sq_norm[source] + sq_norm[target] - 2 * sim[start:start+chunk_size])
+
+    return sim
+
+
+def get_topk_similarity_edges(feature, metric, k, tauf=0, max_exact_frames=4096, max_bytes=2**28,
+                              num_tables=8, num_bits=None, window=16, seed=0):
+    """
+    Get the similarity-based edges that connect every node to its k most similar non-adjacent nodes (|i - j| > tauf)
+    Videos with up to "max_exact_frames" nodes use exact blocked similarities, and longer videos
+    use random-projection LSH to select the candidates, which keeps the cost linear in the number of nodes
+
+    Supported metrics: cosine | gaussian | inner_product
+    Returns node_source, node_target and edge_attr as numpy arrays ordered by source node
+    """
+
+    if metric not in ('cosine', 'gaussian', 'inner_product'):
+        raise ValueError(f'Unknown similarity metric: {metric}')
+
+    feature = np.asarray(feature, dtype=np.float32)
+    num_frame = feature.shape[0]
+
+    sq_norm = None
+    if metric == 'cosine':
+        with np.errstate(divide='ignore', invalid='ignore'):
+            feature = feature / np.linalg.norm(feature, axis=1, keepdims=True)
+        feature = np.nan_to_num(feature)
+    elif metric == 'gaussian':
+        sq_norm = np.einsum('ij,ij->i', feature, feature)
+
+    if num_frame <= max_exact_frames:
+        # Each block holds the similarities and the argpartition indices
+        block_size = max(1, max_bytes // max(1, num_frame * (feature.itemsize + 8)))
+        node_source = []
+        node_target = []
+        for start in range(0, num_frame, block_size):
+            end = min(start + block_size, num_frame)
+            sim = _get_similarity_block(feature, start, end, metric, sq_norm)
+
+            # Exclude the nodes already connected by the tauf band
+            rows = np.arange(start, end)
+            for frame_diff in range(-tauf, tauf+1):
+                valid = (rows - frame_diff >= 0) & (rows - frame_diff < num_frame)
+                sim[(rows - start)[valid], (rows - frame_diff)[valid]] = -np.inf
+
+            kk = min(k, num_frame)
+            target = np.argpartition(-sim, kk-1, axis=1)[:, :kk]
+            valid = np.isfinite(np.take_along_axis(sim, target, axis=1))
+            node_source.append(np.repeat(rows, kk)[valid.ravel()])
+            node_target.append(target[valid])
+
+        node_source = np.concatenate(node_source).astype(np.int64) if node_source else np.zeros(0, dtype=np.int64)
+        node_target = np.concatenate(node_target).astype(np.int64) if node_target else np.zeros(0, dtype=np.int64)
+    else:
+        # Hash codes of num_bits bits give buckets of about "window" nodes on average
+        if num_bits is None:
+            num_bits = max(1, int(np.ceil(np.log2(num_frame / window))))
+        rng = np.random.default_rng(seed)
+
+        # Merge the candidates of every table into the running top-k of each node
+        node_source = np.zeros(0, dtype=np.int64)
+        node_target = np.zeros(0, dtype=np.int64)
+        sim = np.zeros(0, dtype=np.float32)
+        for _ in range(num_tables):
+            source, target = _get_lsh_candidates(feature, num_bits, window, rng)
+            candidate = np.abs(source - target) > tauf
+            source, target = source[candidate], target[candidate]
+
+            node_source = np.concatenate((node_source, source))
+            node_target = np.concatenate((node_target, target))
+            sim = np.concatenate((sim, _get_pair_similarity(feature, source, target, metric, sq_norm, max_bytes)))
+
+            # Remove the duplicate pairs found by several tables
+            _, first = np.unique(node_source * num_frame + node_target, return_index=True)
+            node_source, node_target, sim = _get_topk_per_source(node_source[first], node_target[first], sim[first], k)
+
+    edge_attr = np.sign(node_source - node_target).astype(np.float32)
+
+    return node_source, node_target, edge_attr
+
+
+def get_video_edges(feature, tauf, skip_factor=0, num_view=1, similarity_metric=None, similarity_threshold=None,
+                    similarity_topk=None, add_exo_edges=True, path_cache=None, view_hub=False):
+    """
+    Get the edge information of the temporal graph of a single video, whose first view has the features "feature"
+    The temporal (and cross-view) edges come first, followed by the similarity-based edges between the nodes of the first view
+    If "similarity_topk" is given, every node is connected to its k most similar nodes instead of thresholding the similarities
+
+    Returns node_source, node_target, edge_attr and the number of similarity-based edges
+    """
+
+    num_frame = feature.shape[0]
+    node_source, node_target, edge_attr = get_temporal_edges_cached(num_frame, tauf, skip_factor, num_view, add_exo_edges, path_cache, view_hub)
+
+    # Add similarity-based connections
+    num_similarity_edges = 0
+    if similarity_metric is not None:
+        if similarity_topk is not None:
+            similarity_edges = get_topk_similarity_edges(feature, similarity_metric, similarity_topk, tauf=tauf)
+        else:
+            similarity_edges = get_similarity_edges(feature, similarity_metric, similarity_threshold)
+        node_source = np.concatenate((node_source, similarity_edges[0]))
+        node_target = np.concatenate((node_target, similarity_edges[1]))
+        edge_attr = np.concatenate((edge_attr, similarity_edges[2]))
+        num_similarity_edges = len(similarity_edges[0])
+
+    return node_source, node_target, edge_attr, num_similarity_edges
+
+
+def get_frame_aligned_edges(num_frames, source_offsets=None, target_offsets=None):
+    """
+    Get the edges between the nodes of the same frame of two node types (e.g. omnivore and text) for a batch of videos
+    The nodes of the i-th video start at source_offsets[i] and target_offsets[i] (consecutive videos by default),
+    and the j-th node of the source type is connected to the j-th node of the target type
+
+    Returns node_source and node_target
+    """
+
+    num_frames = np.asarray(num_frames, dtype=np.int64)
+    video_offsets = np.cumsum(num_frames) - num_frames
+    if source_offsets is None:
+        source_offsets = video_offsets
+    if target_offsets is None:
+        target_offsets = video_offsets
+
+    frame = np.arange(num_frames.sum(), dtype=np.int64) - np.repeat(video_offsets, num_frames)
+    node_source = np.repeat(np.asarray(source_offsets, dtype=np.int64), num_frames) + frame
+    node_target = np.repeat(np.asarray(target_offsets, dtype=np.int64), num_frames) + frame
+
+    return node_source, node_target
+
+
+def get_max_frame_offset(tauf, skip_factor=0):
+    """
+    Get the largest frame difference of the temporal edges (the span of the skip edges if any)
+    """
+
+    return int(np.abs(_get_frame_offsets(tauf, skip_factor)).max())
+
+
+def get_window_size(tauf, skip_factor=0, num_view=1, add_exo_edges=True, view_hub=False, max_nodes=None, max_edges=None, halo=None):
+    """
+    Get the number of core frames of the temporal windows whose graphs have at most "max_nodes" nodes and
+    "max_edges" temporal and cross-view edges (the similarity-based edges are not counted), given that every
+    window is extended by "halo" frames on both sides (default: the largest frame difference of the temporal edges,
+    see get_max_frame_offset)
+    """
+
+    if halo is None:
+        halo = get_max_frame_offset(tauf, skip_factor)
+
+    # Nodes and edges per frame in the middle of a video, which bound those of any window
+    nodes_per_frame = num_view
+    edges_per_frame = len(_get_frame_offsets(tauf, skip_factor)) * num_view
+    if num_view > 1:
+        if view_hub:
+            nodes_per_frame += 1
+            edges_per_frame += 2 * num_view
+        else:
+            edges_per_frame += (num_view-1) + ((num_view-1)**2 if add_exo_edges else 0)
+
+    list_sizes = []
+    if max_nodes is not None:
+        list_sizes.append(max_nodes // nodes_per_frame)
+    if max_edges is not None:
+        list_sizes.append(max_edges // edges_per_frame)
+    if not list_sizes:
+        raise ValueError('A node or edge budget is required to size the windows')
+
+    window_size = min(list_sizes) - 2*halo
+    if window_size < 1:
+        raise ValueError(f'The budget does not fit a single frame with halos of {halo} frames (the longest temporal edge with '
+                         f'tauf={tauf} and skip_factor={skip_factor}; {nodes_per_frame} nodes and {edges_per_frame} edges per frame)')
+
+    return window_size
+
+
+def get_temporal_windows(num_frame, window_size, halo):
+    """
+    Cut the frames of a video into windows of "window_size" core frames, each extended by "halo" frames on both sides
+    (within the video), so that the core frames have all their temporal neighbors within "halo" frames in the window
+    The core frames of the windows cover every frame of the video exactly once
+
+    e.g.
+    input:
+        num_frame:      10
+        window_size:    4
+        halo:           1
+    output:
+        windows:        [(0, 5, 0, 4), (3, 9, 4, 8), (7, 10, 8, 10)]   (start, end, core_start, core_end)
+    """
+
+    windows = []
+    for core_start in range(0, max(num_frame, 1), window_size):
+        core_end = min(core_start + window_size, num_frame)
+        windows.append((max(core_start - halo, 0), min(core_end + halo, num_frame), core_start, core_end))
+
+    return windows
@@ -0,0 +1,181 @@
+import os
+import json
+import torch
+from gravit.utils.manifest import atomic_save
+from gravit.utils.graph_builder import VIEW_HUB_LABEL
+from gravit.utils.temporal_crop import get_node_frames
+
+
+METADATA_VERSION = 3
+METADATA_FILE = 'metadata.json'
+
+
+def get_graph_nbytes(data):
+    """
+    Get the size of the tensors of a graph in bytes (a tensor shared by several attributes is counted once)
+    """
+
+    tensors = {}
+    for store in data.stores:
+        for value in store.values():
+            if torch.is_tensor(value):
+                tensors[value.data_ptr()] = value.numel() * value.element_size()
+
+    return sum(tensors.values())
+
+
+def _get_value_counts(values):
+    values, counts = torch.unique(values, return_counts=True)
+    return {str(int(v) if float(v).is_integer() else float(v)): int(c) for v, c in zip(values.tolist(), counts.tolist())}
+
+
+def _get_edge_type_counts(data):
+    """
+    Get the number of edges of every relation of a heterogeneous graph ("<source>__<relation>__<target>"),
+    or of every edge type (the value of edge_attr) of a homogeneous graph
+    """
+
+    if hasattr(data, 'edge_types'):
+        return {'__'.join(edge_type): int(data[edge_type].num_edges) for edge_type in data.edge_types}
+    if 'edge_type' in data.keys():
+        return _get_value_counts(data.edge_type)
+    if 'edge_attr' in data.keys() and data.edge_attr.dim() == 1:
+        return _get_value_counts(data.edge_attr)
+
+    return {'all': int(data.num_edges)}
+
+
+def _get_label_hist(data):
+    """
+    Get the number of nodes of every label (the sum of every column of multi-label targets)
+    """
+
+    hist = {}
+    for store in data.stores:
+        if 'y' not in store or not torch.is_tensor(store['y']):
+            continue
+
+        y = store['y']
+        counts = _get_value_counts(y) if y.dim() == 1 else {str(i): float(s) for i, s in enumerate(y.sum(0).tolist())}
+        for label, count in counts.items():
+            hist[label] = hist.get(label, 0) + count
+
+    return hist
+
+
+def get_graph_metadata(data):
+    """
+    Get the metadata of a graph:
+        num_nodes:          number of nodes
+        num_edges:          number of edges (of every relation for the heterogeneous graphs)
+        num_edges_per_type: number of edges of every edge type or relation
+        num_views:          number of views (the view hub nodes are not counted)
+        num_frames:         number of frames (nodes per view) of a homogeneous temporal graph (None for the heterogeneous graphs)
+        label_hist:         number of nodes of every label
+        nbytes:             size of the tensors in bytes
+        window:             [start, end, core_start, core_end, num_frames] of a window graph
+    """
+
+    if 'edge_col' in data.keys():
+        num_edges = data.edge_col.numel()
+    else:
+        num_edges = data.num_edges
+
+    num_views = 1
+    # The single-view graphs may have empty view_idxs
+    if 'view_idxs' in data.keys() and data.view_idxs.numel() > 0:
+        view_idxs = data.view_idxs
+        if 'y' in data.keys() and data.y.shape == view_idxs.shape:
+            view_idxs = view_idxs[data.y != VIEW_HUB_LABEL]
+        num_views = max(1, int(torch.unique(view_idxs).numel()))
+
+    num_frames = None if hasattr(data, 'edge_types') else get_node_frames(data)[1]
+    metadata = {'num_nodes': int(data.num_nodes), 'num_edges': int(num_edges), 'num_edges_per_type': _get_edge_type_counts(data),
+                'num_views': num_views, 'num_frames': num_frames, 'label_hist': _get_label_hist(data), 'nbytes': get_graph_nbytes(data)}
+    if 'window' in data.keys():
+        metadata['window'] = data.window.view(-1).tolist()
+
+    return metadata
+
+
+def _get_file_metadata(data, graph_file):
+    stat = os.stat(graph_file)
+    return {**get_graph_metadata(data), 'file_size': stat.st_size, 'mtime': stat.st_mtime_ns}
+
+
+def save_graph(data, path_graph):
+    """
+    Save a graph (atomically) and get its metadata along with the size and modification time of the file
+    Returns {path_graph: metadata}, to be added to the metadata table of its directory with update_graph_metadata
+    """
+
+    atomic_save(data, path_graph)
+
+    return {path_graph: _get_file_metadata(data, path_graph)}
+
+
+def _load_table(path_table):
+    if os.path.exists(path_table):
+        with open(path_table) as f:
+            table = json.load(f)
+        if table.get('version') == METADATA_VERSION:
+            return table
+
+    return {'version': METADATA_VERSION, 'graphs': {}}
+
+
+def _save_table(path_table, table):
+    # Drop the graphs that were removed
+    path_graphs = os.path.dirname(path_table)
+    table['graphs'] = {file_name: metadata for file_name, metadata in table['graphs'].items()
+                       if os.path.exists(os.path.join(path_graphs, file_name))}
+
+    path_tmp = f'{path_table}.tmp{os.getpid()}'
+    with open(path_tmp, 'w') as f:
+        json.dump(table, f)
+    os.replace(path_tmp, path_table)
+
+
+def update_graph_metadata(list_graph_metadata):
+    """
+    Add the metadata of the graphs saved by save_graph (a list of their results) to the tables of their directories
+    """
+
+    tables = {}
+    for graph_metadata in list_graph_metadata:
+        for graph_file, metadata in graph_metadata.items():
+            path_graphs, file_name = os.path.split(graph_file)
+            if path_graphs not in tables:
+                tables[path_graphs] = _load_table(os.path.join(path_graphs, METADATA_FILE))
+            tables[path_graphs]['graphs'][file_name] = metadata
+
+    for path_graphs, table in tables.items():
+        _save_table(os.path.join(path_graphs, METADATA_FILE), table)
+
+
+def load_graph_metadata(list_graph_files):
+    """
+    Get the metadata of every graph file from the table <directory>/metadata.json of its directory
+    (file name -> metadata, with the size and modification time of the file), written by the graph generators
+    The graphs that are missing from the table or were modified since are loaded once and added to it,
+    so the graph payloads are only read when the table is out of date
+    """
+
+    tables = {}
+    updated = set()
+    list_metadata = []
+    for graph_file in list_graph_files:
+        path_graphs, file_name = os.path.split(graph_file)
+        if path_graphs not in tables:
+            tables[path_graphs] = _load_table(os.path.join(path_graphs, METADATA_FILE))
+        graphs = tables[path_graphs]['graphs']
+
+        if file_name not in graphs or graphs[file_name]['mtime'] != os.stat(graph_file).st_mtime_ns:
+            graphs[file_name] = _get_file_metadata(torch.load(graph_file), graph_file)
+            updated.add(path_graphs)
+        list_metadata.append(graphs[file_name])
+
+    for path_graphs in updated:
+        _save_table(os.path.join(path_graphs, METADATA_FILE), tables[path_graphs])
+
+    return list_metadata
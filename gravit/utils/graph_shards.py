@@ -0,0 +1,127 @@
+import os
+import json
+import torch
+import numpy as np
+from torch_geometric.data import Data
+from gravit.utils.compact_edges import CompactData
+from gravit.utils.graph_metadata import get_graph_metadata
+
+
+class GraphShardWriter:
+    """
+    Pack graphs into a shard directory: every tensor attribute (x, edge_index, edge_attr, y, ...) of all the graphs
+    is stored contiguously in a single raw binary file <key>.bin, and index.json records the offset and shape
+    of each graph's tensor, along with its non-tensor attributes (e.g. g) and its metadata (see gravit.utils.graph_metadata)
+    """
+
+    def __init__(self, path_shard):
+        self.path_shard = path_shard
+        os.makedirs(path_shard, exist_ok=True)
+        self.names = []
+        self.attrs = []
+        self.metadata = []
+        self.fields = {}
+        self.files = {}
+
+    def append(self, name, data):
+        idx = len(self.names)
+        self.names.append(name)
+        self.metadata.append(get_graph_metadata(data))
+        attrs = {}
+        for key in data.keys():
+            value = data[key]
+            if not torch.is_tensor(value):
+                attrs[key] = value
+                continue
+
+            array = value.contiguous().numpy()
+            if key not in self.fields:
+                self.fields[key] = {'dtype': array.dtype.str, 'offsets': [], 'shapes': [], 'size': 0}
+                self.files[key] = open(os.path.join(self.path_shard, f'{key}.bin'), 'wb')
+            field = self.fields[key]
+            if array.dtype.str != field['dtype']:
+                raise ValueError(f'Graph {name}: dtype of "{key}" is {array.dtype.str}, expected {field["dtype"]}')
+
+            # Graphs without this attribute get a None offset
+            field['offsets'].extend([None] * (idx - len(field['offsets'])))
+            field['shapes'].extend([None] * (idx - len(field['shapes'])))
+            field['offsets'].append(field['size'])
+            field['shapes'].append(list(array.shape))
+            field['size'] += array.size
+            array.tofile(self.files[key])
+
+        self.attrs.append(attrs)
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+        num_graphs = len(self.names)
+        for field in self.fields.values():
+            field['offsets'].extend([None] * (num_graphs - len(field['offsets'])))
+            field['shapes'].extend([None] * (num_graphs - len(field['shapes'])))
+
+        path_tmp = os.path.join(self.path_shard, f'index.json.tmp{os.getpid()}')
+        with open(path_tmp, 'w') as f:
+            json.dump({'names': self.names, 'attrs': self.attrs, 'metadata': self.metadata, 'fields': self.fields}, f)
+        os.replace(path_tmp, os.path.join(self.path_shard, 'index.json'))
+
+
+class GraphShard:
+    """
+    Read the graphs of a shard directory written by GraphShardWriter
+    The binary files are memory-mapped (copy-on-write), so loading a graph does not copy or unpickle anything
+    """
+
+    def __init__(self, path_shard):
+        self.path_shard = path_shard
+        with open(os.path.join(path_shard, 'index.json')) as f:
+            index = json.load(f)
+        self.names = index['names']
+        self.attrs = index['attrs']
+        self.metadata = index.get('metadata')
+        self.fields = index['fields']
+        self.buffers = {}
+
+    def __len__(self):
+        return len(self.names)
+
+    def _get_buffer(self, key):
+        # Open the memory maps lazily so that each DataLoader worker maps the files itself
+        if key not in self.buffers:
+            field = self.fields[key]
+            if field['size'] == 0:
+                self.buffers[key] = np.zeros(0, dtype=np.dtype(field['dtype']))
+            else:
+                self.buffers[key] = np.memmap(os.path.join(self.path_shard, f'{key}.bin'), dtype=np.dtype(field['dtype']), mode='c')
+
+        return self.buffers[key]
+
+    def get(self, idx):
+        # Graphs with the compact edge encoding are restored as CompactData, so that they are batched correctly
+        compact = 'edge_ptr' in self.fields and self.fields['edge_ptr']['offsets'][idx] is not None
+        data = (CompactData if compact else Data)(**self.attrs[idx])
+        for key, field in self.fields.items():
+            offset, shape = field['offsets'][idx], field['shapes'][idx]
+            if offset is None:
+                continue
+
+            size = int(np.prod(shape))
+            data[key] = torch.from_numpy(self._get_buffer(key)[offset:offset+size].reshape(tuple(shape)))
+
+        return data
+
+    def get_metadata(self):
+        """
+        Get the metadata of every graph, computed from the memory-mapped graphs for the shards packed without it
+        """
+
+        if self.metadata is None:
+            self.metadata = [get_graph_metadata(self.get(idx)) for idx in range(len(self))]
+
+        return self.metadata
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['buffers'] = {}
+        return state
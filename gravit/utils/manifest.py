@@ -0,0 +1,118 @@
+import os
+import json
+import time
+import hashlib
+import torch
+
+
+def atomic_save(obj, path):
+    """
+    Save "obj" with torch.save so that "path" either holds the previous file or the complete new one
+    """
+
+    path_tmp = f'{path}.tmp{os.getpid()}'
+    torch.save(obj, path_tmp)
+    os.replace(path_tmp, path)
+
+
+def hash_file(path, chunk_size=2**20):
+    """
+    Get the sha1 hash of the content of a file
+    """
+
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+
+    return sha.hexdigest()
+
+
+class GraphManifest:
+    """
+    Manifest of the generated graphs under "path_graphs" (saved as manifest.json)
+    Each graph is recorded with a signature that hashes the content of its input files and the graph parameters,
+    so that only the graphs whose inputs or parameters changed are regenerated
+    The manifest is saved every "save_every" graphs or "save_interval" seconds, whichever comes first,
+    so save() has to be called once more when the generation ends (or is interrupted)
+    """
+
+    def __init__(self, path_graphs, params, save_every=100, save_interval=30):
+        self.path_manifest = os.path.join(path_graphs, 'manifest.json')
+        self.params = json.dumps(params, sort_keys=True, default=str)
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.num_unsaved = 0
+        self.time_saved = time.monotonic()
+        self.graphs = {}
+        self.files = {}
+        if os.path.exists(self.path_manifest):
+            with open(self.path_manifest) as f:
+                manifest = json.load(f)
+            self.graphs = manifest['graphs']
+            self.files = manifest['files']
+
+    def _hash_file(self, path):
+        # Reuse the stored hash when the size and modification time of the file did not change
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        if key in self.files and self.files[key][:2] == [stat.st_size, stat.st_mtime_ns]:
+            return self.files[key][2]
+
+        sha = hash_file(path)
+        self.files[key] = [stat.st_size, stat.st_mtime_ns, sha]
+        return sha
+
+    def get_signature(self, list_input_files, names=None):
+        """
+        Get the signature of a graph given the list of its input files
+        The files are identified by their absolute paths, or by "names" (one per file) when the signature
+        has to be independent of where the files are (e.g. the same video under different split directories)
+        """
+
+        if names is None:
+            names = [os.path.abspath(path) for path in list_input_files]
+
+        sha = hashlib.sha1(self.params.encode())
+        for name, path in sorted(set(zip(names, list_input_files))):
+            if os.path.exists(path):
+                sha.update(name.encode())
+                sha.update(self._hash_file(path).encode())
+
+        return sha.hexdigest()
+
+    def is_stale(self, key, signature):
+        """
+        Check whether the graph "key" has to be (re)generated
+        """
+
+        if key not in self.graphs:
+            return True
+
+        # The output is a single graph file, or the list of the window graphs of a video
+        graph = self.graphs[key]
+        outputs = graph['output'] if isinstance(graph['output'], list) else [graph['output']]
+        return graph['signature'] != signature or not all(os.path.exists(output) for output in outputs)
+
+    def update(self, key, signature, output):
+        """
+        Record a generated graph, saving the manifest periodically so that an interrupted run can resume
+        """
+
+        self.graphs[key] = {'signature': signature, 'output': output}
+        self.num_unsaved += 1
+        if self.num_unsaved >= self.save_every or time.monotonic() - self.time_saved >= self.save_interval:
+            self.save()
+
+    def save(self):
+        """
+        Save the manifest atomically, so that an interrupted save leaves the previous manifest
+        """
+
+        os.makedirs(os.path.dirname(self.path_manifest), exist_ok=True)
+        path_tmp = f'{self.path_manifest}.tmp{os.getpid()}'
+        with open(path_tmp, 'w') as f:
+            json.dump({'graphs': self.graphs, 'files': self.files}, f)
+        os.replace(path_tmp, self.path_manifest)
+        self.num_unsaved = 0
+        self.time_saved = time.monotonic()
@@ -0,0 +1,58 @@
+import os
+import time
+from multiprocessing import Pool
+
+
+def _run_job(job):
+    """
+    Run a single job and measure its processing time
+    """
+
+    func, data_file, kwargs = job
+    start = time.time()
+    result = func(data_file, **kwargs)
+
+    return data_file, time.time() - start, result
+
+
+def run_parallel(func, list_data_files, num_workers=1, job_kwargs=None, get_length=os.path.getsize):
+    """
+    Run func(data_file, **job_kwargs[data_file]) for every data file with a pool of "num_workers" processes
+    The videos are dispatched from the longest to the shortest ("get_length", the feature file size by default),
+    so that the longest videos do not end up running alone at the end of the pool
+
+    Yields (data_file, elapsed_time, result) as soon as each job is finished
+    """
+
+    if job_kwargs is None:
+        job_kwargs = {}
+
+    list_data_files = sorted(list_data_files, key=get_length, reverse=True)
+    jobs = [(func, data_file, job_kwargs.get(data_file, {})) for data_file in list_data_files]
+
+    if num_workers <= 1:
+        for job in jobs:
+            yield _run_job(job)
+    else:
+        with Pool(processes=num_workers) as pool:
+            yield from pool.imap_unordered(_run_job, jobs)
+
+
+def run_and_report(func, list_data_files, num_workers=1, job_kwargs=None, get_length=os.path.getsize, callback=None):
+    """
+    Run "func" on every data file with run_parallel and print the processing time of each video
+    If given, callback(data_file, result) is called in the main process as soon as each job is finished
+    Returns a list of the results in the order of completion
+    """
+
+    results = []
+    num_files = len(list_data_files)
+    start = time.time()
+    for i, (data_file, elapsed_time, result) in enumerate(run_parallel(func, list_data_files, num_workers, job_kwargs, get_length), 1):
+        print(f'[{i:04d}|{num_files:04d}] {os.path.basename(data_file)} processed in {elapsed_time:.2f}s')
+        if callback is not None:
+            callback(data_file, result)
+        results.append(result)
+
+    print(f'Processed {num_files} videos with {num_workers} workers in {time.time() - start:.2f}s')
+    return results
@@ -43,6 +43,8 @@ def get_args():
     parser.add_argument('--num_epoch',     type=int,   help='Total number of epochs')
     parser.add_argument('--sample_rate',   type=int,   help='Downsampling rate for the input')
     parser.add_argument('--split',         type=int,   help='Which fold to use for cross-validation')
+    parser.add_argument('--loader_workers', type=int,  help='Number of worker processes of the data loaders')
+    parser.add_argument('--device_prefetch', type=int, help='Number of batches copied to the device in advance')
 
     return parser.parse_args()
 
@@ -1,235 +1,211 @@
 import os
-import glob
-import numpy as np
 import argparse
-import sys
+import numpy as np
 import pandas as pd
-sys.path.append('/home/juro4948/gravit/data/egoexo4d')
-sys.path.append('/home/juro4948/segment_utils')
+from functools import partial
+from gravit.utils.data_loader import load_labels_raw, load_batch_indices, reduce_segments
+from gravit.utils.parallel import run_and_report
+from gravit.utils.parser import get_cfg
+from gravit.utils.catalog import DatasetCatalog, EMPTY_MARKER_SUFFIX
 
-from preprocess_utils import *
-from gravit.utils.data_loader import load_labels, load_labels_raw, get_segment_labels_by_batch_idxs, load_batch_indices #get_segments_and_batch_idxs
-from gravit.utils.parser import get_args, get_cfg
-from frame_to_segment import load_annotations, get_frames_for_segment, get_num_segments
 
-"""
-Script to convert framewise features and labels to segmentwise features and labels.
-"""
+def load_label_mapping(path_mapping):
+    """
+    Load the keystep classes to keep from label_mapping.csv (step_name, step_unique_id and label_id columns)
+    Returns the mapping from step_unique_id to class name (step name in lowercase with underscores)
+    and the mapping from label_id to class name (the content of mapping.txt)
+    """
 
+    df = pd.read_csv(path_mapping)
+    names = ['_'.join(w.lower() for w in name.split()) for name in df['step_name'].values]
+    step_ids = df['step_unique_id'].values.astype(str)
+    label_ids = df['label_id'].values.astype(str)
 
+    return dict(zip(step_ids, names)), dict(zip(label_ids, names))
 
-if __name__ == "__main__":
-    root_data = './data'
 
-    load_annotations()
+def _write_atomic(path, write, mode='w'):
+    """
+    Write "path" with write(f) so that it either holds the previous file or the complete new one
+    """
 
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    path_tmp = f'{path}.tmp{os.getpid()}'
+    with open(path_tmp, mode) as f:
+        write(f)
+    os.replace(path_tmp, path)
 
-    # Load non-segmented features and labels
-    # features = 'omnivore-trimmed-ego' #'egoexo-brp-level4' #'omnivore-ego' # name of the directory in data/features/ that are framewise
-    # output_features_dir = 'omnivore-segmentwise-ego' # name of the output directory in data/features/
-    # egocentric = True
-    
-    features = 'omnivore-trimmed-ego-exo'  #-exo
-    output_features_dir = 'omnivore-segmentwise-ego-exo' #-exo
-    egocentric = False
 
-    save_features = True
- 
- 
-    dataset =  'egoexo-regular-all-categories' #'egoexo-regular' #  name of corresponding annotation dataset in data/annotations/
-    output_annotations_dir = 'egoexo-segmentwise-all-categories' # name of the output directory in data/annotations/
-    save_labels = False
-    annotation_type =  'groundTruth' #'descriptions' #
+def get_empty_marker(path):
+    """
+    Get the path of the marker written instead of the output "path" of a video with no segments left
+    """
 
-    batch_idx_path = f"/local/juro4948/data/egoexo4d/gravit_data/data_new/annotations/{dataset}/batch_idx/"
+    return f'{path}{EMPTY_MARKER_SUFFIX}'
 
 
-    ##########################################
-        
+def _save_output(path, write, mode='w'):
+    """
+    Save an output of a video, or its empty marker when "write" is None, and remove the other one
+    """
 
-    output_dir_path = os.path.join(root_data, f'annotations/{output_annotations_dir}/')
-    if annotation_type == 'descriptions':
-        load_descriptions = True
+    if write is None:
+        _write_atomic(get_empty_marker(path), lambda f: None)
+        path_stale = path
     else:
-        load_descriptions = False
-
-
-    if not os.path.exists(output_dir_path):
-        print(f'Output directory does not exist: {output_dir_path}')
-        user_input = input(f"Create the output directory named {output_annotations_dir} and it must contain the splits/ and mapping.txt files. Is this done? (Y/N) ")
-        if user_input.lower() != 'y':
-            print('Exiting...')
-            exit()
-        if not os.path.exists(output_dir_path):
-            print(f'Output directory does not exist: {output_dir_path}')
-            print('Exiting...')
-            exit()
-        if not os.path.exists(os.path.join(output_dir_path, 'splits')):
-            print(f'Output directory does not contain splits/ directory: {output_dir_path}')
-            print('Exiting...')
-            exit()
-
-
-    if save_labels:
-        # make new directory if groundTruth folder already exist
-        if os.path.exists(os.path.join(output_dir_path, annotation_type)):
-            import shutil
-            shutil.rmtree(os.path.join(output_dir_path, annotation_type))
-            print(f'Removing existing {annotation_type} directory: os.path.join(output_dir_path, annotation_type)')
-        os.makedirs(os.path.join(output_dir_path, annotation_type))
-    
-
-        # load ground truth long-tailed classes
-        df = pd.read_csv('~/gravit/GraVi-T/data/annotations/label_mapping.csv')
-        step_names = df['step_name'].values
-        step_ids = df['step_unique_id'].values.astype(str)
-        converted_names = []
-        for name in step_names:
-            words = name.split()
-            converted_label = "_".join([w.lower() for w in words])
-            converted_names.append(converted_label)
-        label_ids = df['label_id'].values.astype(str)
-
-        mapping = dict(zip(step_ids, converted_names))
-        reverse_mapping = dict(zip(converted_names, step_ids))
-        reverse = dict(zip(step_ids, label_ids))
-        actions = dict(zip(label_ids, converted_names))
-
-        # save mapping
-        with open(os.path.join(output_dir_path, 'mapping.txt'), 'w') as f:
-            for k, v in actions.items():
-                f.write(f'{k} {v}\n')
-
-    if save_features:
-        # make new directory if groundTruth folder already exist
-        if os.path.exists(os.path.join(root_data, f'features/{output_features_dir}')):
-            import shutil
-            shutil.rmtree(os.path.join(root_data, f'features/{output_features_dir}'))
-            print(f'Removing existing {output_features_dir} directory: os.path.join(root_data, f"features/{output_features_dir}")')
-        os.makedirs(os.path.join(root_data, f'features/{output_features_dir}'))
-
-
-    # Get a list of all video ids
-    all_ids = sorted([os.path.splitext(v)[0] for v in os.listdir(os.path.join(root_data, f'annotations/{dataset}/{annotation_type}'))])
-    list_splits = sorted(os.listdir(os.path.join(root_data, f'features/{features}')))
+        _write_atomic(path, write, mode=mode)
+        path_stale = get_empty_marker(path)
 
-    for split in list_splits:
-        # Get a list of training video ids
-        print(f'Reading splits at {os.path.join(root_data, f"annotations/{dataset}/splits/train.{split}.bundle")}')
-        with open(os.path.join(root_data, f'annotations/{dataset}/splits/train.{split}.bundle')) as f:
-            train_ids = [os.path.splitext(line.strip())[0] for line in f]
+    if os.path.exists(path_stale):
+        os.remove(path_stale)
 
-        list_data_files = sorted(glob.glob(os.path.join(root_data, f'features/{features}/{split}/*/*.npy')))
-     
-        for data_file in list_data_files:
-            video_id = os.path.splitext(os.path.basename(data_file))[0]
 
-            # load the features
-            omnivore_data = load_features(data_file)
-            
-            # load the labels
-            if video_id not in all_ids:
-                video_id_label = '_'.join(video_id.split('_')[:-1])
-                if video_id_label not in all_ids:
-                    raise ValueError(f'Could not find {video_id_label} in annotations file"')
+def get_video_id_label(video_id, catalog):
+    """
+    Get the name of a video in the annotations (with or without its view suffix)
+    """
 
+    if catalog.has_video(video_id):
+        return video_id
 
-            # load unique step ids
-            label = load_labels_raw(video_id=video_id_label, root_data=root_data, annotation_dataset=dataset)  
+    video_id_label = video_id.rsplit('_', 1)[0]
+    if not catalog.has_video(video_id_label):
+        raise ValueError(f'Could not find {video_id} or {video_id_label} in the annotations')
 
-            assert len(label) == omnivore_data.shape[0], f'Feature-Label Length mismatch for {data_file}'
+    return video_id_label
 
-    
-            # Aggregate frame labels to segment labels by taking the mode
-            num_segments = get_num_segments(video_id_label)
 
-            batch_idx_designation = load_batch_indices(batch_idx_path, video_id_label)
-            labels = get_segment_labels_by_batch_idxs(label, batch_idx_designation)
+def aggregate_video(data_file, args, mapping, video_id_label, path_feature=None, path_label=None):
+    """
+    Convert the framewise features and labels of a single video to segmentwise ones:
+    the mean of the features and the mode of the labels of every segment (batch index)
+    The segments whose label is not in "mapping" (long-tailed classes) are removed; a video with no segments
+    left gets empty markers instead of its outputs (see get_empty_marker), so that it is not converted again
+    Returns the number of segments that are kept
+    """
 
-            # check that lengths align
-            assert len(np.unique(batch_idx_designation)) == num_segments, f'Batch Index Length mismatch for {data_file}'
-            assert len(labels) == num_segments, f'Label Length mismatch for {data_file}'
-            # print(f'Batch Index Length: {len(np.unique(batch_idx_designation))} | Num Segments: {num_segments} | Label Length: {len(labels)}')
+    feature = np.load(data_file, mmap_mode='r')
+    label = load_labels_raw(root_data=args.root_data, annotation_dataset=args.dataset, video_id=video_id_label)
+    assert len(label) == feature.shape[0], f'Feature-Label Length mismatch for {data_file}'
 
+    batch_idx_designation = load_batch_indices(args.batch_idx_path, video_id_label)
+    assert len(batch_idx_designation) == feature.shape[0], f'BatchIndex-Omnivore Feature Length mismatch for {data_file}'
 
-            label = []
-            for segment in labels:
-                # append mode of the segment
-                label.append(np.argmax(np.bincount(segment)))
+    # Mode of the labels (ties to the smallest step id) and mean of the features of every segment
+    _, label, feature = reduce_segments(batch_idx_designation, label=np.array(label, dtype=np.int64), feature=feature, ties='smallest')
+    assert len(label) == len(np.unique(batch_idx_designation)), f'Label Length mismatch for {data_file}'
 
+    # Remove the long-tailed classes
+    label = label.astype(str)
+    keep = np.isin(label, list(mapping))
+    if not keep.any():
+        print(f'No segments left after removing long-tailed classes for {os.path.basename(data_file)}')
 
-            assert len(batch_idx_designation) == omnivore_data.shape[0], f'BatchIndex-Omnivore Feature Length mismatch for {data_file}'
+    if path_feature is not None:
+        _save_output(path_feature, (lambda f: np.save(f, feature[keep])) if keep.any() else None, mode='wb')
+    if path_label is not None:
+        _save_output(path_label, (lambda f: f.writelines(f'{mapping[l]}\n' for l in label[keep])) if keep.any() else None)
 
-            batchwise_averages = []
-            for batch_idx in np.unique(batch_idx_designation):
-                batch_data = omnivore_data[batch_idx_designation == batch_idx]
-                batch_average = np.mean(batch_data, axis=0)
-                batchwise_averages.append(batch_average)
-            batchwise_averages = np.array(batchwise_averages)
+    return int(keep.sum())
 
 
-            assert batchwise_averages.shape[0] == num_segments, f'Number of segments and features do not match for {video_id}: {num_segments} vs {batchwise_averages.shape[0]}'
+def is_up_to_date(list_input_files, list_output_files):
+    """
+    Check whether every output file (or its empty marker) exists and is newer than every input file
+    """
 
+    list_output_files = [f if os.path.exists(f) else get_empty_marker(f) for f in list_output_files]
+    if not all(os.path.exists(f) for f in list_output_files):
+        return False
 
-            ### REMOVE LONG TAILED CLASSES ###
-            df = pd.read_csv('~/gravit/GraVi-T/data/annotations/label_mapping.csv')
-            step_ids = df['step_unique_id'].values.astype(str)
-            label = [str(l) for l in label]
+    mtime_output = min(os.path.getmtime(f) for f in list_output_files)
+    return all(os.path.getmtime(f) <= mtime_output for f in list_input_files if os.path.exists(f))
 
-            # batchwise_averages = batchwise_averages[~np.isin(label, step_ids)]
-            batchwise_averages = batchwise_averages[np.isin(label, step_ids)]
-            label = [l for l in label if l in step_ids]
-            num_segments = len(label)
-            if num_segments == 0:
-                print(f'No segments left after removing long-tailed classes for {video_id}')
-                continue
-            ############
 
+if __name__ == "__main__":
+    """
+    Convert the framewise features (data/features/<features>/<split>/<train|val>/<video_id>.npy) and labels
+    (data/annotations/<dataset>/groundTruth) into segmentwise ones, given the segment of every frame
+    (data/annotations/<dataset>/batch_idx): the features are saved under data/features/<output_features>
+    and, with --save_labels, the labels and mapping.txt under data/annotations/<output_dataset>
+    Only the videos whose outputs are missing or older than their inputs are converted
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root_data',       type=str,   help='Root directory to the data', default='./data')
+    parser.add_argument('--cfg',             type=str,   help='Path to a config file containing the arguments below', required=False)
+    parser.add_argument('--features',        type=str,   help='Name of the framewise features')
+    parser.add_argument('--output_features', type=str,   help='Name of the segmentwise features')
+    parser.add_argument('--dataset',         type=str,   help='Name of the framewise annotations (annotation dir)')
+    parser.add_argument('--output_dataset',  type=str,   help='Name of the segmentwise annotations (annotation dir)')
+    parser.add_argument('--label_mapping',   type=str,   help='Path to label_mapping.csv (default: <root_data>/annotations/label_mapping.csv)')
+    parser.add_argument('--batch_idx_path',  type=str,   help='Directory of the batch indices (default: <root_data>/annotations/<dataset>/batch_idx)')
+    parser.add_argument('--egocentric',      help='Save the features as <video_id>_0.npy after the take name', action="store_true", default=None)
+    parser.add_argument('--save_labels',     help='Save the segmentwise labels and mapping.txt', action="store_true", default=None)
+    parser.add_argument('--skip_features',   help='Do not save the segmentwise features', action="store_true", default=None)
+    parser.add_argument('--num_workers',     type=int,   help='Number of processes for the conversion', default=20)
+    parser.add_argument('--force',           help='Convert every video even if it is up to date', action="store_true")
+
+    args = parser.parse_args()
+    if args.cfg is not None:
+        args = argparse.Namespace(**get_cfg(args))
+    for k in ('features', 'output_features', 'dataset'):
+        if getattr(args, k, None) is None:
+            raise ValueError(f'--{k} is required')
+    if args.save_labels and getattr(args, 'output_dataset', None) is None:
+        raise ValueError('--output_dataset is required to save the labels')
+    if getattr(args, 'label_mapping', None) is None:
+        args.label_mapping = os.path.join(args.root_data, 'annotations/label_mapping.csv')
+    args.label_mapping = os.path.expanduser(args.label_mapping)
+    if getattr(args, 'batch_idx_path', None) is None:
+        args.batch_idx_path = os.path.join(args.root_data, 'annotations', args.dataset, 'batch_idx')
+    save_features = not args.skip_features
+    if not save_features and not args.save_labels:
+        raise ValueError('Nothing to save with --skip_features and without --save_labels')
+
+    # The label mapping is read once and shared by every video
+    mapping, actions = load_label_mapping(args.label_mapping)
+
+    path_labels = None
+    if args.save_labels:
+        path_output_dataset = os.path.join(args.root_data, f'annotations/{args.output_dataset}')
+        if not os.path.isdir(os.path.join(path_output_dataset, 'splits')):
+            raise ValueError(f'{path_output_dataset} must contain the splits/ directory of the segmentwise annotations')
+        _write_atomic(os.path.join(path_output_dataset, 'mapping.txt'), lambda f: f.writelines(f'{k} {v}\n' for k, v in actions.items()))
+        path_labels = os.path.join(path_output_dataset, 'groundTruth')
+
+    # Index of the video ids, splits and feature files
+    catalog = DatasetCatalog(args.root_data, args.dataset)
+    list_splits = catalog.get_splits(args.features)
+
+    for split in list_splits:
+        train_ids = set(catalog.get_train_ids(split))
+        list_data_files = catalog.get_feature_files(args.features, split)
+        num_files = len(list_data_files)
 
-            # save the segment features
+        job_kwargs = {}
+        for data_file in list_data_files:
+            video_id = os.path.splitext(os.path.basename(data_file))[0]
+            video_id_label = get_video_id_label(video_id, catalog)
+            kwargs = {'video_id_label': video_id_label}
             if save_features:
-                path = os.path.join(root_data, f'features/{output_features_dir}/{split}')
-                os.makedirs(os.path.join(path, 'train'), exist_ok=True)
-                os.makedirs(os.path.join(root_data, f'features/{output_features_dir}/{split}/val'), exist_ok=True)
-
-                if not egocentric:
-                    if video_id_label in train_ids:
-                        np.save(os.path.join(path, 'train', f'{video_id}.npy'), batchwise_averages)
-                        # print(f'Saving {video_id} to {os.path.join(path, "train", f"{video_id}.npy")}')
-                    else:
-                        np.save(os.path.join(path, 'val', f'{video_id}.npy'), batchwise_averages)
-                        # print(f'Saving {video_id} to {os.path.join(path, "val", f"{video_id}.npy")}')
-
-                else:
-                    if video_id_label in train_ids:
-                        np.save(os.path.join(path, 'train', f'{video_id_label}_0.npy'), batchwise_averages)
-                        # print(f'Saving {video_id} to {os.path.join(path, "train", f"{video_id_label}.npy")}')
-                    else:
-                        np.save(os.path.join(path, 'val', f'{video_id_label}_0.npy'), batchwise_averages)
-                        # print(f'Saving {video_id} to {os.path.join(path, "val", f"{video_id_label}.npy")}')
-
-
-            # save the segment labels
-            if save_labels:
-                save_folder = os.path.join(output_dir_path, annotation_type)
-                os.makedirs(os.path.join(save_folder), exist_ok=True)
-                # if os.path.exists(os.path.join(save_folder, f'{video_id_label}.txt')):
-                #     # continue
-                #     pass
-                # # else:
-                # print(reverse)
-                with open(os.path.join(save_folder, f'{video_id_label}.txt'), 'w') as f:
-                    for l in label:
-                        if annotation_type == 'groundTruth':
-                            # unique step id to label id
-                            l = mapping[str(l)]
-                        f.write(f'{l}\n')
-
-                # print(f'Saving {video_id} to {os.path.join(save_folder, f"{video_id_label}.txt")}')
-
-
-
-    
-
-            
-            
\ No newline at end of file
+                sp = 'train' if video_id_label in train_ids else 'val'
+                name = f'{video_id_label}_0' if args.egocentric else video_id
+                kwargs['path_feature'] = os.path.join(args.root_data, f'features/{args.output_features}/{split}/{sp}/{name}.npy')
+            if path_labels is not None:
+                kwargs['path_label'] = os.path.join(path_labels, f'{video_id_label}.txt')
+            job_kwargs[data_file] = kwargs
+
+        # Skip the videos whose outputs are newer than their features, labels, batch indices and the label mapping
+        if not args.force:
+            list_data_files = [data_file for data_file in list_data_files if not is_up_to_date(
+                [data_file, args.label_mapping,
+                 catalog.get_label_path(job_kwargs[data_file]['video_id_label']),
+                 os.path.join(args.batch_idx_path, f'{job_kwargs[data_file]["video_id_label"]}.txt')],
+                [path for key, path in job_kwargs[data_file].items() if key.startswith('path_')])]
+        print(f'Number of videos to convert for {split}: {len(list_data_files)} out of {num_files}')
+
+        num_segments = run_and_report(partial(aggregate_video, args=args, mapping=mapping), list_data_files,
+                                      num_workers=args.num_workers, job_kwargs=job_kwargs)
+
+        print(f'Conversion for {split} is finished (number of segments: {sum(num_segments)})')
@@ -0,0 +1,90 @@
+import copy
+import torch
+from torch_geometric.data import Data
+from gravit.utils.compact_edges import compact_edges, expand_edges
+
+
+# Label of the halo nodes of a crop, ignored by the cross-entropy losses (default ignore_index of CrossEntropyLoss)
+HALO_LABEL = -100
+
+
+def get_node_frames(data):
+    """
+    Get the frame of every node of a temporal graph and its number of frames
+    The nodes of a multiview graph are in blocks of the same number of frames, one per view (view_idxs),
+    followed by the block of the view hub nodes if any
+    """
+
+    num_nodes = data.num_nodes
+    if 'view_idxs' in data.keys() and data.view_idxs.numel() == num_nodes and num_nodes > 0:
+        view_idxs = data.view_idxs.long()
+        num_frame = num_nodes // (int(view_idxs.max()) + 1)
+        return torch.arange(num_nodes) - view_idxs * num_frame, num_frame
+
+    return torch.arange(num_nodes), num_nodes
+
+
+def mask_halo_labels(data, core_start, core_end):
+    """
+    Set the labels of the nodes out of the frames core_start:core_end of a temporal graph to HALO_LABEL (in place),
+    so that only the core nodes count in the losses
+    """
+
+    if 'y' not in data.keys():
+        return data
+    if data.y.is_floating_point():
+        raise ValueError('The halo labels can only be masked for integer class labels')
+
+    frames, _ = get_node_frames(data)
+    core_mask = (frames >= core_start) & (frames < core_end)
+    data.y = data.y.clone()
+    data.y[~core_mask] = HALO_LABEL
+
+    return data
+
+
+def crop_temporal_graph(data, core_start, core_end, halo):
+    """
+    Get the subgraph of the frames core_start:core_end of a temporal graph (of every view) with the "halo" frames
+    before and after them, and the edges between these nodes
+    The labels of the halo nodes are set to HALO_LABEL, so that only the core nodes count in the losses
+
+    e.g.
+    input:
+        frames of the nodes:    [0, 1, 2, 3, 4, 5]
+        core_start, core_end:   2, 4
+        halo:                   1
+    output:
+        frames of the nodes:    [1, 2, 3, 4]
+        labels:                 [HALO_LABEL, y2, y3, HALO_LABEL]
+    """
+
+    compact = 'edge_ptr' in data.keys()
+    if compact:
+        data = expand_edges(copy.copy(data))
+
+    frames, num_frame = get_node_frames(data)
+    start, end = max(0, core_start - halo), min(num_frame, core_end + halo)
+    node_mask = (frames >= start) & (frames < end)
+    node_map = torch.full((data.num_nodes,), -1, dtype=torch.long)
+    node_map[node_mask] = torch.arange(int(node_mask.sum()))
+    edge_mask = node_mask[data.edge_index[0]] & node_mask[data.edge_index[1]]
+
+    crop = Data()
+    for key in data.keys():
+        value = data[key]
+        if key == 'edge_index':
+            crop[key] = node_map[value[:, edge_mask]]
+        elif not torch.is_tensor(value) or value.dim() == 0:
+            crop[key] = value
+        elif key.startswith('edge_'):
+            crop[key] = value[edge_mask]
+        elif value.size(0) == data.num_nodes:
+            crop[key] = value[node_mask]
+        else:
+            crop[key] = value
+
+    # Frames of the crop from its first frame
+    mask_halo_labels(crop, core_start - start, core_end - start)
+
+    return compact_edges(crop) if compact else crop
@@ -0,0 +1,73 @@
+import os
+import numpy as np
+from gravit.utils.catalog import DatasetCatalog
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def _overwrite_in_place(path, write):
+    """
+    Overwrite a file in place with a new modification time, keeping the modification time of its directory
+    """
+
+    dir_stat = os.stat(os.path.dirname(path))
+    mtime_ns = os.stat(path).st_mtime_ns
+    write()
+    os.utime(path, ns=(mtime_ns + 10**9, mtime_ns + 10**9))
+    os.utime(os.path.dirname(path), ns=(dir_stat.st_atime_ns, dir_stat.st_mtime_ns))
+
+
+def _make_dataset(root):
+    _write(os.path.join(root, 'annotations/ds/groundTruth/take0.txt'), 'a\nb\nc\n')
+    _write(os.path.join(root, 'annotations/ds/groundTruth/take1.txt'), 'a\nb\n')
+    _write(os.path.join(root, 'annotations/ds/splits/train.split1.bundle'), 'take0.txt\n')
+    os.makedirs(os.path.join(root, 'features/feat/split1/train'))
+    np.save(os.path.join(root, 'features/feat/split1/train/take0_0.npy'), np.zeros((3, 4), dtype=np.float32))
+
+
+def test_catalog_is_loaded_from_json(tmp_path):
+    root = str(tmp_path)
+    _make_dataset(root)
+    catalog = DatasetCatalog(root, 'ds')
+    assert catalog.video_ids == ['take0', 'take1']
+    assert catalog.get_num_frames('take0') == 3
+    assert catalog.get_feature_length('feat', 'split1', 'train', 'take0_0.npy') == 3
+    assert os.path.exists(catalog.path_catalog)
+
+    catalog = DatasetCatalog(root, 'ds')
+    assert catalog.get_train_ids('split1') == ['take0']
+    assert catalog.get_global_id('take1') == 1
+
+
+def test_catalog_rebuilds_after_bundle_edited_in_place(tmp_path):
+    root = str(tmp_path)
+    _make_dataset(root)
+    assert DatasetCatalog(root, 'ds').get_train_ids('split1') == ['take0']
+
+    path_bundle = os.path.join(root, 'annotations/ds/splits/train.split1.bundle')
+    _overwrite_in_place(path_bundle, lambda: _write(path_bundle, 'take1.txt\n'))
+    assert DatasetCatalog(root, 'ds').get_train_ids('split1') == ['take1']
+
+
+def test_catalog_rebuilds_after_label_edited_in_place(tmp_path):
+    root = str(tmp_path)
+    _make_dataset(root)
+    assert DatasetCatalog(root, 'ds').get_num_frames('take1') == 2
+
+    path_label = os.path.join(root, 'annotations/ds/groundTruth/take1.txt')
+    _overwrite_in_place(path_label, lambda: _write(path_label, 'a\nb\nc\nd\n'))
+    assert DatasetCatalog(root, 'ds').get_num_frames('take1') == 4
+
+
+def test_catalog_rebuilds_after_features_saved_again(tmp_path):
+    root = str(tmp_path)
+    _make_dataset(root)
+    assert DatasetCatalog(root, 'ds').get_feature_length('feat', 'split1', 'train', 'take0_0.npy') == 3
+
+    path_feature = os.path.join(root, 'features/feat/split1/train/take0_0.npy')
+    _overwrite_in_place(path_feature, lambda: np.save(path_feature, np.zeros((5, 4), dtype=np.float32)))
+    assert DatasetCatalog(root, 'ds').get_feature_length('feat', 'split1', 'train', 'take0_0.npy') == 5
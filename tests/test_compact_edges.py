@@ -0,0 +1,57 @@
+import torch
+import numpy as np
+import pytest
+from torch_geometric.data import Data, Batch
+from gravit.utils.graph_builder import get_temporal_edges
+from gravit.utils.compact_edges import compact_edges, expand_edges
+
+
+def _make_graph(num_frame, num_view):
+    node_source, node_target, edge_attr = get_temporal_edges(num_frame, 2, 3, num_view)
+    # Shuffle the edges, which are sorted by source node when compacted
+    order = np.random.default_rng(num_frame).permutation(len(node_source))
+    return Data(x=torch.randn(num_frame * num_view, 4), y=torch.zeros(num_frame * num_view, dtype=torch.long),
+                edge_index=torch.from_numpy(np.stack((node_source[order], node_target[order]))),
+                edge_attr=torch.from_numpy(edge_attr[order]))
+
+
+def _get_edges(data):
+    return sorted(zip(data.edge_index.t().tolist(), data.edge_attr.tolist()))
+
+
+def test_compact_edges_round_trip():
+    data = _make_graph(10, 3)
+    compact = compact_edges(data)
+    assert compact.edge_ptr.dtype == torch.int32 and compact.edge_col.dtype == torch.int32
+    assert compact.edge_type.dtype == torch.int8
+    assert 'edge_index' not in compact.keys()
+
+    data_expanded = expand_edges(compact_edges(data))
+    assert data_expanded.edge_index.dtype == torch.long and data_expanded.edge_attr.dtype == torch.float32
+    assert _get_edges(data_expanded) == _get_edges(data)
+    assert torch.equal(data_expanded.x, data.x)
+
+
+def test_compact_edges_batch():
+    list_data = [_make_graph(num_frame, 2) for num_frame in (4, 9, 1, 6)]
+    batch = expand_edges(Batch.from_data_list([compact_edges(data) for data in list_data]))
+    batch_ref = Batch.from_data_list(list_data)
+
+    assert _get_edges(batch) == _get_edges(batch_ref)
+    assert torch.equal(batch.batch, batch_ref.batch)
+
+
+def test_compact_edges_with_isolated_nodes():
+    data = Data(x=torch.randn(5, 2), edge_index=torch.tensor([[3, 1, 3], [0, 4, 1]]), edge_attr=torch.tensor([1., -1., 2.]))
+    assert _get_edges(expand_edges(compact_edges(data))) == _get_edges(data)
+
+
+def test_expand_edges_keeps_other_graphs():
+    data = _make_graph(3, 1)
+    assert expand_edges(data) is data
+
+
+def test_compact_edges_requires_integer_attributes():
+    data = Data(x=torch.randn(2, 2), edge_index=torch.tensor([[0], [1]]), edge_attr=torch.tensor([0.5]))
+    with pytest.raises(ValueError):
+        compact_edges(data)
@@ -0,0 +1,31 @@
+import torch
+import pytest
+from gravit.utils.graph_builder import get_temporal_windows
+from gravit.utils.formatter import stitch_window_logits
+
+
+@pytest.mark.parametrize('use_ref', [False, True])
+def test_stitch_window_logits(use_ref):
+    cfg = {'use_ref': use_ref}
+    num_frame, num_classes, num_stages = 11, 3, 2
+    logits_video = {g: torch.randn(num_stages, num_frame, num_classes) for g in ('a', 'b')}
+
+    # Windows of two videos interleaved and out of order
+    list_windows = []
+    for g in ('a', 'b'):
+        for start, end, core_start, core_end in get_temporal_windows(num_frame, 4, 2):
+            logits = logits_video[g][:, start:end]
+            list_windows.append((g, (start, end, core_start, core_end, num_frame), logits if use_ref else logits[-1]))
+    list_windows = list_windows[::-1]
+
+    windows = {}
+    outputs = {}
+    for g, window, logits in list_windows:
+        output = stitch_window_logits(cfg, windows, g, window, logits)
+        if output is not None:
+            assert g not in outputs
+            outputs[g] = output
+
+    assert windows == {}
+    for g in ('a', 'b'):
+        assert torch.equal(outputs[g], logits_video[g] if use_ref else logits_video[g][-1])
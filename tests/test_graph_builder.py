@@ -0,0 +1,161 @@
+import os
+import numpy as np
+import pytest
+from gravit.utils.graph_builder import BUILDER_VERSION, get_temporal_edges, get_temporal_edges_cached, get_video_edges, \
+                                       get_similarity_edges, get_topk_similarity_edges, get_temporal_windows, get_max_frame_offset
+
+
+def _get_temporal_edges_ref(num_frame, tauf, skip_factor, num_view, add_exo_edges, view_hub):
+    """
+    Reference edges of a temporal graph, built pair by pair as (source, target, edge_attr)
+    """
+
+    edges = []
+    for k in range(num_view):
+        for i in range(num_frame):
+            for j in range(num_frame):
+                diff = i - j
+                connected = abs(diff) <= tauf
+                if skip_factor and diff % skip_factor == 0 and abs(diff) <= skip_factor*tauf:
+                    connected = True
+                if connected:
+                    edges.append((i + num_frame*k, j + num_frame*k, float(np.sign(diff))))
+
+    if num_view > 1:
+        for i in range(num_frame):
+            if view_hub:
+                hub = i + num_frame*num_view
+                for k in range(num_view):
+                    edges.append((i + num_frame*k, hub, -2.))
+                    edges.append((hub, i + num_frame*k, -2.))
+            else:
+                for k in range(1, num_view):
+                    edges.append((i, i + num_frame*k, -2.))
+                if add_exo_edges:
+                    for k in range(1, num_view):
+                        for l in range(1, num_view):
+                            edges.append((i + num_frame*k, i + num_frame*l, -2.))
+
+    return sorted(edges)
+
+
+def _to_edge_list(node_source, node_target, edge_attr):
+    return sorted(zip(node_source.tolist(), node_target.tolist(), edge_attr.tolist()))
+
+
+@pytest.mark.parametrize('num_frame, tauf, skip_factor, num_view', [
+    (1, 1, 0, 1), (7, 2, 0, 1), (20, 3, 4, 1), (20, 2, 3, 3), (9, 4, 2, 2), (5, 10, 1000, 4),
+])
+@pytest.mark.parametrize('add_exo_edges, view_hub', [(True, False), (False, False), (True, True)])
+def test_temporal_edges_match_reference(num_frame, tauf, skip_factor, num_view, add_exo_edges, view_hub):
+    edges = get_temporal_edges(num_frame, tauf, skip_factor, num_view, add_exo_edges, view_hub)
+    assert _to_edge_list(*edges) == _get_temporal_edges_ref(num_frame, tauf, skip_factor, num_view, add_exo_edges, view_hub)
+
+
+
+def test_temporal_edges_cached_on_disk(tmp_path):
+    path_cache = str(tmp_path / 'templates')
+    edges = get_temporal_edges_cached(13, 2, 3, 2, True, path_cache)
+    assert os.listdir(path_cache) == [f'v{BUILDER_VERSION}_13_2_3_2_1.npz']
+    assert not edges[0].flags.writeable
+
+    get_temporal_edges_cached.cache_clear()
+    edges_loaded = get_temporal_edges_cached(13, 2, 3, 2, True, path_cache)
+    assert _to_edge_list(*edges_loaded) == _to_edge_list(*get_temporal_edges(13, 2, 3, 2))
+
+
+@pytest.mark.parametrize('num_frame, tauf, skip_factor, num_view', [(12, 2, 3, 1), (12, 1, 0, 3)])
+def test_video_edges_match_reference(num_frame, tauf, skip_factor, num_view):
+    feature = np.random.default_rng(0).standard_normal((num_frame, 8)).astype(np.float32)
+    node_source, node_target, edge_attr, num_similarity_edges = get_video_edges(feature, tauf, skip_factor, num_view)
+    assert num_similarity_edges == 0
+    assert _to_edge_list(node_source, node_target, edge_attr) == _get_temporal_edges_ref(num_frame, tauf, skip_factor, num_view, True, False)
+
+    # The similarity-based edges come after the temporal ones
+    node_source, node_target, edge_attr, num_similarity_edges = get_video_edges(feature, tauf, skip_factor, num_view,
+                                                                                 similarity_metric='cosine', similarity_threshold=0.2)
+    num_temporal_edges = len(node_source) - num_similarity_edges
+    similarity_edges = get_similarity_edges(feature, 'cosine', 0.2)
+    assert num_similarity_edges == len(similarity_edges[0])
+    assert _to_edge_list(node_source[num_temporal_edges:], node_target[num_temporal_edges:], edge_attr[num_temporal_edges:]) == \
+           _to_edge_list(*similarity_edges)
+
+
+def _get_similarity_ref(feature, metric):
+    feature = feature.astype(np.float64)
+    if metric == 'cosine':
+        feature = feature / np.linalg.norm(feature, axis=1, keepdims=True)
+    sim = feature @ feature.T
+    if metric == 'gaussian':
+        sq_norm = (feature ** 2).sum(1)
+        sim = np.exp(-np.maximum(sq_norm[:, None] + sq_norm[None, :] - 2 * sim, 0) / 8)
+
+    return sim
+
+
+@pytest.mark.parametrize('metric, threshold', [('cosine', 0.1), ('gaussian', 0.02), ('inner_product', 1.0)])
+def test_similarity_edges_match_reference(metric, threshold):
+    feature = np.random.default_rng(1).standard_normal((30, 4)).astype(np.float32)
+    sim = _get_similarity_ref(feature, metric)
+
+    # Blocks of a few rows
+    edges = get_similarity_edges(feature, metric, threshold, max_bytes=30*4*7)
+    edges_ref = [(i, j, float(np.sign(i - j))) for i in range(30) for j in range(30) if i != j and sim[i, j] > threshold]
+    assert len(edges_ref) > 0
+    assert _to_edge_list(*edges) == sorted(edges_ref)
+
+
+@pytest.mark.parametrize('metric', ['cosine', 'gaussian', 'inner_product'])
+def test_topk_similarity_edges_match_reference(metric):
+    feature = np.random.default_rng(2).standard_normal((25, 4)).astype(np.float32)
+    sim = _get_similarity_ref(feature, metric)
+    k, tauf = 3, 2
+
+    edges = get_topk_similarity_edges(feature, metric, k, tauf=tauf, max_bytes=25*12*4)
+    edges_ref = []
+    for i in range(25):
+        candidates = [j for j in range(25) if abs(i - j) > tauf]
+        for j in sorted(candidates, key=lambda j: -sim[i, j])[:k]:
+            edges_ref.append((i, j, float(np.sign(i - j))))
+    assert _to_edge_list(*edges) == sorted(edges_ref)
+
+
+def test_topk_similarity_edges_lsh():
+    feature = np.random.default_rng(3).standard_normal((200, 8)).astype(np.float32)
+    k, tauf = 4, 2
+
+    node_source, node_target, _ = get_topk_similarity_edges(feature, 'cosine', k, tauf=tauf, max_exact_frames=100)
+    assert np.all(np.abs(node_source - node_target) > tauf)
+    assert np.all(np.bincount(node_source, minlength=200) <= k)
+    assert len(set(zip(node_source.tolist(), node_target.tolist()))) == len(node_source)
+
+
+def test_unknown_similarity_metric():
+    with pytest.raises(ValueError):
+        get_similarity_edges(np.zeros((3, 2)), 'l1', 0.5)
+
+
+@pytest.mark.parametrize('num_frame, window_size, halo', [(10, 4, 1), (10, 3, 0), (7, 10, 2), (1, 4, 3), (50, 7, 12)])
+def test_temporal_windows(num_frame, window_size, halo):
+    windows = get_temporal_windows(num_frame, window_size, halo)
+
+    # The core frames cover every frame exactly once, in order
+    assert windows[0][2] == 0 and windows[-1][3] == num_frame
+    for (_, _, _, core_end), (_, _, core_start, _) in zip(windows[:-1], windows[1:]):
+        assert core_end == core_start
+
+    for start, end, core_start, core_end in windows:
+        assert core_end - core_start <= window_size
+        assert start == max(core_start - halo, 0)
+        assert end == min(core_end + halo, num_frame)
+
+
+def test_temporal_windows_keep_the_neighbors_of_the_core_frames():
+    num_frame, tauf, skip_factor = 40, 2, 3
+    halo = get_max_frame_offset(tauf, skip_factor)
+    assert halo == 6
+
+    node_source, node_target, _ = get_temporal_edges(num_frame, tauf, skip_factor)
+    for start, end, core_start, core_end in get_temporal_windows(num_frame, 5, halo):
+        core = (node_source >= core_start) & (node_source < core_end)
+        assert np.all((node_target[core] >= start) & (node_target[core] < end))
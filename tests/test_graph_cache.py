@@ -0,0 +1,41 @@
+import os
+import torch
+from torch_geometric.data import Data
+from torch_geometric.loader import DataLoader
+from gravit.datasets import CachedGraphDataset, get_graph_dataset
+from gravit.utils.graph_metadata import get_graph_nbytes
+
+
+def _make_graphs(path_graphs, num_graphs):
+    os.makedirs(path_graphs)
+    for i in range(num_graphs):
+        data = Data(x=torch.full((10, 4), float(i)), edge_index=torch.zeros(2, 0, dtype=torch.long))
+        torch.save(data, os.path.join(path_graphs, f'video{i}.pt'))
+    return get_graph_nbytes(data)
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    path_graphs = str(tmp_path / 'graphs')
+    nbytes = _make_graphs(path_graphs, 4)
+    dataset = CachedGraphDataset(path_graphs, 2 * nbytes)
+
+    for idx in (0, 1, 0, 2):
+        assert float(dataset.get(idx).x[0, 0]) == idx
+    assert list(dataset.cache) == [0, 2]
+    assert dataset.num_bytes == 2 * nbytes
+    assert (dataset.num_hits, dataset.num_misses) == (1, 3)
+
+
+def test_shared_cache_is_used_by_every_worker(tmp_path):
+    path_graphs = str(tmp_path / 'graphs')
+    nbytes = _make_graphs(path_graphs, 6)
+    dataset = get_graph_dataset(path_graphs, {'graph_cache_mb': (6 * nbytes + 1) / 2**20, 'loader_workers': 2})
+    assert dataset.shared
+    assert list(dataset.cache) == list(range(6))
+
+    # Every graph is read from the shared cache, whichever worker loads it
+    for graph_file in dataset.all_graphs:
+        os.remove(graph_file)
+    for _ in range(2):
+        batches = list(DataLoader(dataset, batch_size=2, shuffle=True, num_workers=2))
+        assert sorted(int(x) for batch in batches for x in batch.x[::10, 0]) == list(range(6))
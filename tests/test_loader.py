@@ -0,0 +1,46 @@
+import torch
+from torch_geometric.data import Batch, HeteroData
+from gravit.datasets import collate_shared_edges
+
+
+def _make_hetero_graph(num_frame):
+    data = HeteroData()
+    data['omnivore'].x = torch.randn(num_frame, 4)
+    data['text'].x = torch.randn(num_frame, 2)
+    edge_index = torch.stack((torch.arange(num_frame), torch.arange(num_frame).flip(0)))
+    edge_attr = torch.ones(num_frame)
+    # Both relations share the same edge tensors
+    for relation in ('to', 'rev_to'):
+        data['omnivore', relation, 'text'].edge_index = edge_index
+        data['omnivore', relation, 'text'].edge_attr = edge_attr
+    data['text', 'to', 'text'].edge_index = torch.stack((torch.arange(num_frame), torch.arange(num_frame)))
+    return data
+
+
+def test_collate_shared_edges():
+    list_data = [_make_hetero_graph(num_frame) for num_frame in (3, 5, 2)]
+    batch = collate_shared_edges(list_data)
+    batch_ref = Batch.from_data_list(list_data)
+
+    assert set(batch.edge_types) == set(batch_ref.edge_types)
+    for edge_type in batch_ref.edge_types:
+        for key, value in batch_ref[edge_type].items():
+            assert torch.equal(batch[edge_type][key], value)
+    for node_type in batch_ref.node_types:
+        assert torch.equal(batch[node_type].x, batch_ref[node_type].x)
+
+    # The shared relations are batched once
+    assert batch['omnivore', 'rev_to', 'text'].edge_index is batch['omnivore', 'to', 'text'].edge_index
+    assert batch['text', 'to', 'text'].edge_index is not batch['omnivore', 'to', 'text'].edge_index
+
+    # The input graphs are left unchanged
+    assert ('omnivore', 'rev_to', 'text') in list_data[0].edge_types
+
+
+def test_collate_shared_edges_not_shared_in_every_graph():
+    list_data = [_make_hetero_graph(num_frame) for num_frame in (3, 4)]
+    list_data[1]['omnivore', 'rev_to', 'text'].edge_index = list_data[1]['omnivore', 'rev_to', 'text'].edge_index.clone()
+    batch = collate_shared_edges(list_data)
+
+    assert batch['omnivore', 'rev_to', 'text'].edge_index is not batch['omnivore', 'to', 'text'].edge_index
+    assert torch.equal(batch['omnivore', 'rev_to', 'text'].edge_index, Batch.from_data_list(list_data)['omnivore', 'rev_to', 'text'].edge_index)
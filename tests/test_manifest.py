@@ -0,0 +1,43 @@
+import os
+import json
+from gravit.utils.manifest import GraphManifest
+
+
+def _write(path, text):
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def test_manifest_is_saved_periodically(tmp_path):
+    path_graphs = str(tmp_path / 'graphs')
+    manifest = GraphManifest(path_graphs, {'tauf': 1}, save_every=3, save_interval=3600)
+    for i in range(4):
+        manifest.update(f'video{i}', 'sig', f'video{i}.pt')
+
+    # Saved after the third graph only
+    with open(manifest.path_manifest) as f:
+        assert sorted(json.load(f)['graphs']) == ['video0', 'video1', 'video2']
+
+    manifest.save()
+    assert sorted(GraphManifest(path_graphs, {'tauf': 1}).graphs) == ['video0', 'video1', 'video2', 'video3']
+    assert os.listdir(path_graphs) == ['manifest.json']
+
+
+def test_manifest_signature_and_staleness(tmp_path):
+    path_input = str(tmp_path / 'input.txt')
+    _write(path_input, 'a')
+    path_output = str(tmp_path / 'video.pt')
+    _write(path_output, '')
+
+    manifest = GraphManifest(str(tmp_path), {'tauf': 1})
+    signature = manifest.get_signature([path_input])
+    assert manifest.is_stale('video', signature)
+    manifest.update('video', signature, path_output)
+    manifest.save()
+
+    manifest = GraphManifest(str(tmp_path), {'tauf': 1})
+    assert not manifest.is_stale('video', manifest.get_signature([path_input]))
+    assert manifest.is_stale('video', GraphManifest(str(tmp_path), {'tauf': 2}).get_signature([path_input]))
+
+    _write(path_input, 'b')
+    assert manifest.is_stale('video', manifest.get_signature([path_input]))
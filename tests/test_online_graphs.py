@@ -0,0 +1,60 @@
+import os
+import numpy as np
+import pytest
+from gravit.datasets import OnlineGraphDataset
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def _save_features(path, num_frame):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.save(path, np.random.default_rng(num_frame).standard_normal((num_frame, 4)).astype(np.float32))
+
+
+def _make_dataset(root):
+    _write(os.path.join(root, 'annotations/ds/mapping.txt'), '0 a\n1 b\n')
+    _write(os.path.join(root, 'annotations/ds/groundTruth/take1.txt'), 'a\nb\nb\n')
+    _write(os.path.join(root, 'annotations/ds/groundTruth/take1_b.txt'), 'a\nb\nb\na\n')
+    _write(os.path.join(root, 'annotations/ds/splits/train.split1.bundle'), 'take1.txt\ntake1_b.txt\n')
+    _save_features(os.path.join(root, 'features/feat/split1/train/take1_0.npy'), 3)
+    _save_features(os.path.join(root, 'features/feat/split1/train/take1_b_0.npy'), 4)
+    for view in (1, 2):
+        _save_features(os.path.join(root, f'features/feat-exo/split1/train/take1_{view}.npy'), 3)
+    # Exo view of take1_b, whose name starts with take1_
+    _save_features(os.path.join(root, 'features/feat-exo/split1/train/take1_b_1.npy'), 4)
+
+
+def _get_cfg(root, **kwargs):
+    return {'root_data': root, 'annotations_dataset': 'ds', 'tauf': 1, 'skip_factor': 0, 'add_multiview': True, **kwargs}
+
+
+def test_exo_views_are_matched_by_video_id(tmp_path):
+    root = str(tmp_path)
+    _make_dataset(root)
+    dataset = OnlineGraphDataset(os.path.join(root, 'features/feat/split1/train'), _get_cfg(root))
+
+    assert [[os.path.basename(f) for f in files] for files in dataset.all_multiview_features] == \
+           [['take1_1.npy', 'take1_2.npy'], ['take1_b_1.npy']]
+    data = dataset.get(0)
+    assert data.num_nodes == 9
+    assert data.y.tolist() == [0, 1, 1] * 3
+
+
+def test_length_mismatch_between_features_and_labels(tmp_path):
+    root = str(tmp_path)
+    _make_dataset(root)
+    _write(os.path.join(root, 'annotations/ds/groundTruth/take1.txt'), 'a\nb\n')
+    with pytest.raises(ValueError, match='take1'):
+        OnlineGraphDataset(os.path.join(root, 'features/feat/split1/train'), _get_cfg(root))
+
+
+def test_shape_mismatch_between_views(tmp_path):
+    root = str(tmp_path)
+    _make_dataset(root)
+    _save_features(os.path.join(root, 'features/feat-exo/split1/train/take1_2.npy'), 5)
+    with pytest.raises(ValueError, match='take1_2.npy'):
+        OnlineGraphDataset(os.path.join(root, 'features/feat/split1/train'), _get_cfg(root))
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+from gravit.datasets import NodeBudgetBatchSampler
+
+
+@pytest.mark.parametrize('shuffle', [True, False])
+def test_node_budget_batch_sampler(shuffle):
+    sizes = np.random.default_rng(0).integers(1, 60, size=100)
+    sizes[7] = 250
+    max_size = 100
+    sampler = NodeBudgetBatchSampler(sizes, max_size, num_buckets=4, shuffle=shuffle)
+
+    for _ in range(3):
+        num_batches = len(sampler)
+        batches = list(sampler)
+        assert len(batches) == num_batches
+        assert sorted(idx for batch in batches for idx in batch) == list(range(100))
+        for batch in batches:
+            assert sizes[batch].sum() <= max_size or len(batch) == 1
+        assert [7] in batches
+
+
+def test_node_budget_batch_sampler_epochs():
+    sizes = np.random.default_rng(1).integers(1, 20, size=50)
+    sampler = NodeBudgetBatchSampler(sizes, 40, seed=3)
+    epoch0, epoch1 = list(sampler), list(sampler)
+    assert epoch0 != epoch1
+
+    # The batches only depend on the seed and the epoch
+    sampler = NodeBudgetBatchSampler(sizes, 40, seed=3)
+    assert list(sampler) == epoch0
+    assert list(sampler) == epoch1
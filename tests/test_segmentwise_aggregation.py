@@ -0,0 +1,56 @@
+import os
+import argparse
+import numpy as np
+from gravit.utils.catalog import DatasetCatalog
+from gravit.utils.segmentwise_aggregation import aggregate_video, is_up_to_date, get_empty_marker
+
+
+def _write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(text)
+
+
+def _make_video(root, video_id, labels):
+    _write(os.path.join(root, f'annotations/ds/groundTruth/{video_id}.txt'), ''.join(f'{l}\n' for l in labels))
+    _write(os.path.join(root, f'annotations/ds/batch_idx/{video_id}.txt'), ''.join(f'{i // 2}\n' for i in range(len(labels))))
+    data_file = os.path.join(root, f'features/feat/split1/train/{video_id}.npy')
+    os.makedirs(os.path.dirname(data_file), exist_ok=True)
+    np.save(data_file, np.arange(len(labels) * 2, dtype=np.float32).reshape(len(labels), 2))
+    return data_file
+
+
+def _convert(root, data_file, video_id, mapping):
+    args = argparse.Namespace(root_data=root, dataset='ds', batch_idx_path=os.path.join(root, 'annotations/ds/batch_idx'))
+    path_feature = os.path.join(root, f'features/seg/split1/train/{video_id}.npy')
+    path_label = os.path.join(root, f'annotations/seg/groundTruth/{video_id}.txt')
+    num_segments = aggregate_video(data_file, args, mapping, video_id, path_feature=path_feature, path_label=path_label)
+    return num_segments, [path_feature, path_label]
+
+
+def test_video_without_segments_is_up_to_date(tmp_path):
+    root = str(tmp_path)
+    data_file = _make_video(root, 'take0', [7, 7, 8, 8])
+
+    num_segments, list_outputs = _convert(root, data_file, 'take0', {'1': 'a'})
+    assert num_segments == 0
+    assert not any(os.path.exists(path) for path in list_outputs)
+    assert all(os.path.exists(get_empty_marker(path)) for path in list_outputs)
+    assert is_up_to_date([data_file], list_outputs)
+
+    # The markers are replaced by the outputs once some segments are kept
+    num_segments, list_outputs = _convert(root, data_file, 'take0', {'8': 'b'})
+    assert num_segments == 1
+    assert all(os.path.exists(path) for path in list_outputs)
+    assert not any(os.path.exists(get_empty_marker(path)) for path in list_outputs)
+    assert np.load(list_outputs[0]).tolist() == [[5., 6.]]
+    assert is_up_to_date([data_file], list_outputs)
+
+
+def test_empty_markers_are_not_videos(tmp_path):
+    root = str(tmp_path)
+    _make_video(root, 'take0', [7, 7])
+    _write(os.path.join(root, 'annotations/seg/groundTruth/take1.txt'), 'a\n')
+    _write(get_empty_marker(os.path.join(root, 'annotations/seg/groundTruth/take0.txt')), '')
+
+    assert DatasetCatalog(root, 'seg').video_ids == ['take1']
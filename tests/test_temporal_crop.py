@@ -0,0 +1,72 @@
+import torch
+import numpy as np
+import pytest
+from torch_geometric.data import Data
+from gravit.utils.graph_builder import get_temporal_edges
+from gravit.utils.compact_edges import compact_edges, expand_edges
+from gravit.utils.temporal_crop import HALO_LABEL, get_node_frames, crop_temporal_graph
+
+
+def _make_graph(num_frame, num_view, tauf=2, skip_factor=3):
+    node_source, node_target, edge_attr = get_temporal_edges(num_frame, tauf, skip_factor, num_view)
+    num_nodes = num_frame * num_view
+    return Data(x=torch.randn(num_nodes, 4),
+                y=torch.arange(num_nodes) % 5,
+                g=torch.tensor([7]),
+                edge_index=torch.from_numpy(np.stack((node_source, node_target))),
+                edge_attr=torch.from_numpy(edge_attr),
+                view_idxs=torch.arange(num_view).repeat_interleave(num_frame))
+
+
+def _get_crop_ref(data, core_start, core_end, halo):
+    """
+    Reference crop: the nodes kept in order, and the edges between them in the original node indices
+    """
+
+    frames, num_frame = get_node_frames(data)
+    start, end = max(0, core_start - halo), min(num_frame, core_end + halo)
+    nodes = [i for i in range(data.num_nodes) if start <= frames[i] < end]
+    edges = sorted((s, t, a) for (s, t), a in zip(data.edge_index.t().tolist(), data.edge_attr.tolist()) if s in nodes and t in nodes)
+    labels = [int(data.y[i]) if core_start <= frames[i] < core_end else HALO_LABEL for i in nodes]
+
+    return nodes, edges, labels
+
+
+@pytest.mark.parametrize('num_frame, num_view, core_start, core_end, halo', [
+    (12, 1, 4, 8, 2), (12, 3, 0, 5, 3), (12, 2, 9, 12, 6), (6, 2, 0, 6, 1),
+])
+def test_crop_matches_reference(num_frame, num_view, core_start, core_end, halo):
+    data = _make_graph(num_frame, num_view)
+    crop = crop_temporal_graph(data, core_start, core_end, halo)
+    nodes, edges, labels = _get_crop_ref(data, core_start, core_end, halo)
+
+    assert crop.num_nodes == len(nodes)
+    assert torch.equal(crop.x, data.x[nodes])
+    assert crop.y.tolist() == labels
+    assert torch.equal(crop.g, data.g)
+    crop_edges = [(nodes[s], nodes[t], a) for (s, t), a in zip(crop.edge_index.t().tolist(), crop.edge_attr.tolist())]
+    assert sorted(crop_edges) == edges
+
+    # The crop is still a temporal graph with the same views
+    frames, num_frame_crop = get_node_frames(crop)
+    assert num_frame_crop == min(num_frame, core_end + halo) - max(0, core_start - halo)
+    assert int(crop.view_idxs.max()) == num_view - 1
+    assert torch.equal(data.y, torch.arange(data.num_nodes) % 5)
+
+
+def test_crop_of_compact_graph():
+    data = _make_graph(15, 2)
+    crop = expand_edges(crop_temporal_graph(compact_edges(data), 3, 9, 2))
+    crop_ref = crop_temporal_graph(data, 3, 9, 2)
+
+    assert torch.equal(crop.y, crop_ref.y)
+    edges = sorted(zip(crop.edge_index.t().tolist(), crop.edge_attr.tolist()))
+    edges_ref = sorted(zip(crop_ref.edge_index.t().tolist(), crop_ref.edge_attr.tolist()))
+    assert edges == edges_ref
+
+
+def test_crop_requires_class_labels():
+    data = _make_graph(10, 1)
+    data.y = data.y.float()
+    with pytest.raises(ValueError):
+        crop_temporal_graph(data, 2, 5, 1)
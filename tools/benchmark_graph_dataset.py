@@ -0,0 +1,115 @@
+import os
+import time
+import torch
+import argparse
+import numpy as np
+import torch.optim as optim
+from gravit.utils.parser import get_cfg
+from gravit.models import build_model, get_loss_func
+from gravit.datasets import GraphDataset, CachedGraphDataset, OnlineGraphDataset, ShardGraphDataset
+from gravit.utils.compact_edges import expand_edges
+
+
+def _time_loading(dataset, num_samples, read_tensors=False):
+    """
+    Get the loading time of every sample (in seconds)
+    With "read_tensors", the time also includes reading every tensor of the sample once
+    (memory-mapped tensors are only paged in when they are read)
+    """
+
+    times = []
+    for idx in range(min(num_samples, len(dataset))):
+        start = time.perf_counter()
+        data = dataset[idx]
+        if read_tensors:
+            for key in data.keys():
+                if torch.is_tensor(data[key]):
+                    data[key].sum()
+        times.append(time.perf_counter() - start)
+
+    return np.array(times)
+
+
+def _time_training(dataset, cfg, device, num_samples):
+    """
+    Get the time of a single training step (forward, backward and optimizer step) on every sample (in seconds)
+    """
+
+    model = build_model(cfg, device)
+    model.train()
+    loss_func = get_loss_func(cfg)
+    optimizer = optim.Adam(model.parameters(), lr=cfg['lr'], weight_decay=cfg['wd'])
+
+    times = []
+    for idx in range(min(num_samples, len(dataset))):
+        data = expand_edges(dataset[idx].to(device))
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+
+        optimizer.zero_grad()
+        logits = model(data.x, data.edge_index, data.edge_attr, None)
+        loss = loss_func(logits, data.y)
+        loss.backward()
+        optimizer.step()
+
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        times.append(time.perf_counter() - start)
+
+    return np.array(times)
+
+
+def _summary(name, times):
+    return f'{name:<28} mean {times.mean()*1e3:9.2f} ms | median {np.median(times)*1e3:9.2f} ms | max {times.max()*1e3:9.2f} ms'
+
+
+if __name__ == "__main__":
+    """
+    Compare the per-sample cost of building the graphs at loading time (OnlineGraphDataset)
+    with loading the pre-generated graphs (GraphDataset, or ShardGraphDataset when the graphs were packed
+    with data/convert_graphs_to_shards.py) and with a single SPELL training step
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cfg',           type=str,   help='Path to the configuration file', required=True)
+    parser.add_argument('--root_data',     type=str,   help='Root directory to the data', default='./data')
+    parser.add_argument('--split',         type=int,   help='Which fold to use for cross-validation')
+    parser.add_argument('--sp',            type=str,   help='Subset of the split to benchmark (train | val)', default='train')
+    parser.add_argument('--num_samples',   type=int,   help='Number of samples to benchmark', default=50)
+
+    args = parser.parse_args()
+    num_samples = args.num_samples
+    sp = args.sp
+    delattr(args, 'num_samples')
+    delattr(args, 'sp')
+    cfg = get_cfg(args)
+
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    path_features = os.path.join(cfg['root_data'], f'features/{cfg["features_dataset"]}')
+    path_graphs = os.path.join(cfg['root_data'], f'graphs/{cfg["graph_name"]}')
+    if cfg['split'] is not None:
+        path_features = os.path.join(path_features, f'split{cfg["split"]}')
+        path_graphs = os.path.join(path_graphs, f'split{cfg["split"]}')
+
+    online_dataset = OnlineGraphDataset(os.path.join(path_features, sp), cfg)
+    results = [_summary('online graph construction', _time_loading(online_dataset, num_samples))]
+
+    if os.path.isdir(os.path.join(path_graphs, sp)):
+        graph_dataset = GraphDataset(os.path.join(path_graphs, sp))
+        results.append(_summary('torch.load of a graph', _time_loading(graph_dataset, num_samples)))
+        results.append(_summary('torch.load + read', _time_loading(graph_dataset, num_samples, read_tensors=True)))
+
+        # Second pass over the graphs kept in memory by the first one (1 GB unless graph_cache_mb is set)
+        cached_dataset = CachedGraphDataset(os.path.join(path_graphs, sp), int((cfg.get('graph_cache_mb') or 1024) * 2**20))
+        _time_loading(cached_dataset, num_samples)
+        results.append(_summary('graph cache (2nd pass)', _time_loading(cached_dataset, num_samples)))
+
+    if os.path.isdir(os.path.join(path_graphs, f'{sp}.shard')):
+        shard_dataset = ShardGraphDataset(os.path.join(path_graphs, f'{sp}.shard'))
+        results.append(_summary('shard memmap of a graph', _time_loading(shard_dataset, num_samples)))
+        results.append(_summary('shard memmap + read', _time_loading(shard_dataset, num_samples, read_tensors=True)))
+
+    results.append(_summary(f'training step ({device.type})', _time_training(online_dataset, cfg, device, num_samples)))
+
+    print('\n'.join(results))
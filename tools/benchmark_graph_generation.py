@@ -0,0 +1,339 @@
+import io
+import os
+import json
+import time
+import torch
+import pickle  #nosec
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import contextlib
+import numpy as np
+import importlib.util
+from collections import defaultdict
+import gravit.utils.graph_builder as graph_builder
+from gravit.utils.catalog import DatasetCatalog
+
+
+STAGES = ('load', 'edges', 'similarity', 'tensorize', 'save')
+
+
+class StageTimer:
+    """
+    Accumulate the time spent in the stages of the graph generation
+    Functions are wrapped with the stage they belong to; the time of a stage excludes the time of the stages
+    nested in it (e.g. the similarity edges computed while building the edges)
+    """
+
+    def __init__(self):
+        self.times = defaultdict(float)
+        self._stack = []
+
+    def wrap(self, stage, func):
+        def wrapped(*args, **kwargs):
+            self._stack.append(0.)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self.times[stage] += elapsed - self._stack.pop()
+                if self._stack:
+                    self._stack[-1] += elapsed
+
+        return wrapped
+
+
+@contextlib.contextmanager
+def _instrument(timer, patches):
+    """
+    Replace the functions (module, name, stage) of "patches" with their timed versions, and restore them afterwards
+    """
+
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, stage in patches:
+        setattr(module, name, timer.wrap(stage, getattr(module, name)))
+    try:
+        yield
+    finally:
+        for module, name, func in originals:
+            setattr(module, name, func)
+
+
+def _load_script(name):
+    """
+    Import a graph generation script of data/ as a module (its __main__ block is not run)
+    """
+
+    path_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', f'{name}.py')
+    spec = importlib.util.spec_from_file_location(name.replace('-', '_'), path_script)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    return module
+
+
+def make_synthetic_videos(root_data, args):
+    """
+    Write a synthetic dataset in the layout read by the temporal graph generators:
+        annotations/synth/{mapping.txt, groundTruth, batch_idx, splits/train.split1.bundle, text}
+        features/synthfeat/split1/<train|val>/<take>_0.npy and features/synthfeat-exo/split1/<train|val>/<take>_<view>.npy
+    The video lengths cycle through "num_frames", and half of the videos are in the training set
+    """
+
+    rng = np.random.default_rng(args.seed)
+    path_annts = os.path.join(root_data, 'annotations/synth')
+    for d in ('groundTruth', 'batch_idx', 'splits', 'text'):
+        os.makedirs(os.path.join(path_annts, d), exist_ok=True)
+    with open(os.path.join(path_annts, 'mapping.txt'), 'w') as f:
+        f.writelines(f'{i} action{i}\n' for i in range(args.num_classes))
+
+    list_takes = [f'take{i:04d}' for i in range(args.num_videos)]
+    train_ids = list_takes[:(args.num_videos+1)//2]
+    with open(os.path.join(path_annts, 'splits/train.split1.bundle'), 'w') as f:
+        f.writelines(f'{take}.txt\n' for take in train_ids)
+
+    for i, take in enumerate(list_takes):
+        num_frame = args.num_frames[i % len(args.num_frames)]
+        label = rng.integers(0, args.num_classes, num_frame // args.segment_length + 1).repeat(args.segment_length)[:num_frame]
+        with open(os.path.join(path_annts, f'groundTruth/{take}.txt'), 'w') as f:
+            f.writelines(f'action{l}\n' for l in label)
+        with open(os.path.join(path_annts, f'batch_idx/{take}.txt'), 'w') as f:
+            f.writelines(f'{frame // args.segment_length}\n' for frame in range(num_frame))
+        np.save(os.path.join(path_annts, f'text/{take}_0.npy'), rng.standard_normal((num_frame, args.text_dim), dtype=np.float32))
+
+        sp = 'train' if take in train_ids else 'val'
+        for view in range(args.num_views):
+            features = 'synthfeat' if view == 0 else 'synthfeat-exo'
+            os.makedirs(os.path.join(root_data, f'features/{features}/split1/{sp}'), exist_ok=True)
+            np.save(os.path.join(root_data, f'features/{features}/split1/{sp}/{take}_{view}.npy'),
+                    rng.standard_normal((num_frame, args.feature_dim), dtype=np.float32))
+
+
+def make_synthetic_ava(root_data, args):
+    """
+    Write synthetic AVA feature pickles (features/synthava/<train|val>/<video_id>.pkl) read by the spatial-temporal
+    graph generator: "num_frames" timestamps at 20 fps with "num_persons" persons each
+    """
+
+    rng = np.random.default_rng(args.seed)
+    global_id = 0
+    for i in range(args.num_videos):
+        sp = 'train' if i < (args.num_videos+1)//2 else 'val'
+        num_frame = args.num_frames[i % len(args.num_frames)]
+        data = {}
+        for frame in range(num_frame):
+            list_entities = []
+            for person in range(args.num_persons):
+                x1, y1 = rng.random(2) * 0.5
+                list_entities.append({'feature': rng.standard_normal(args.feature_dim, dtype=np.float32),
+                                      'person_box': f'{x1:.3f},{y1:.3f},{x1+0.3:.3f},{y1+0.4:.3f}',
+                                      'label': int(rng.integers(0, 2)),
+                                      'person_id': f'video{i:04d}:{person}',
+                                      'global_id': global_id})
+                global_id += 1
+            data[f'{900 + frame / 20:g}'] = list_entities
+
+        os.makedirs(os.path.join(root_data, f'features/synthava/{sp}'), exist_ok=True)
+        with open(os.path.join(root_data, f'features/synthava/{sp}/video{i:04d}.pkl'), 'wb') as f:
+            pickle.dump(data, f)
+
+
+def _run_generator(jobs, patches, save_patch, timer):
+    """
+    Run the jobs (func, kwargs) of a generator one after the other and time them
+    "save_patch" (module, name) is the function that saves the graphs, through which the saved graphs are counted
+    The tensorize stage gets the time that is not spent in any other stage (node features, labels and graph tensors)
+    Returns the time per stage, the total time and the number of graphs, nodes, edges and megabytes saved
+    """
+
+    graph_stats = np.zeros(4)
+
+    def counted(save_func):
+        def wrapped(graphs, path_graph):
+            result = save_func(graphs, path_graph)
+            graph_stats[:] += (1, graphs.num_nodes, graphs.num_edges, os.path.getsize(path_graph) / 2**20)
+            return result
+        return wrapped
+
+    timer.times.clear()
+    save_module, save_name = save_patch
+    with _instrument(timer, patches + [(save_module, save_name, 'save')]):
+        setattr(save_module, save_name, counted(getattr(save_module, save_name)))
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for func, kwargs in jobs:
+                func(**kwargs)
+        total = time.perf_counter() - start
+
+    stages = {stage: timer.times.get(stage, 0.) for stage in STAGES}
+    stages['tensorize'] = total - sum(stages.values())
+    num_graphs, num_nodes, num_edges, size = graph_stats
+
+    return stages, total, {'graphs': int(num_graphs), 'nodes': int(num_nodes), 'edges': int(num_edges), 'graph_mb': round(size, 3)}
+
+
+def get_temporal_jobs(module, root_data, args, heterogeneous=False):
+    """
+    Get the jobs of the temporal (or heterogeneous temporal) graph generator for every video of the synthetic dataset
+    """
+
+    gen_args = argparse.Namespace(root_data=root_data, dataset='synth', features='synthfeat', tauf=args.tauf, skip_factor=args.skip_factor,
+                                  sample_rate=1, add_multiview=args.num_views > 1, view_hub=args.view_hub, compact_edges=args.compact_edges,
+                                  similarity_metric=args.similarity_metric, similarity_threshold=args.similarity_threshold,
+                                  similarity_topk=args.similarity_topk, path_templates=None, window_nodes=None, window_edges=None,
+                                  add_text=heterogeneous, text_dir=os.path.join(root_data, 'annotations/synth/text'))
+    module.cfg = {'load_segmentwise': not args.framewise}
+
+    actions = {}
+    with open(os.path.join(root_data, 'annotations/synth/mapping.txt')) as f:
+        for line in f:
+            aid, cls = line.strip().split(' ')
+            actions[cls] = int(aid)
+
+    catalog = DatasetCatalog(root_data, 'synth')
+    train_ids = set(catalog.get_train_ids('split1'))
+    list_data_files = catalog.get_feature_files('synthfeat', 'split1')
+    path_graphs = os.path.join(root_data, f'graphs/bench_{"heterogeneous" if heterogeneous else "temporal"}/split1')
+    for sp in ('train', 'val'):
+        os.makedirs(os.path.join(path_graphs, sp), exist_ok=True)
+
+    jobs = []
+    for data_file in list_data_files:
+        take_name = os.path.splitext(os.path.basename(data_file))[0].rsplit('_', 1)[0]
+        sp = 'train' if take_name in train_ids else 'val'
+        list_multiview_data_files = [catalog.get_feature_file('synthfeat-exo', 'split1', sp, f'{take_name}_{view}.npy') for view in range(1, args.num_views)]
+        kwargs = {'data_file': data_file, 'args': gen_args, 'path_graphs': path_graphs, 'actions': actions, 'train_ids': train_ids,
+                  'global_ids': catalog.get_global_ids(), 'list_multiview_data_files': list_multiview_data_files}
+        if heterogeneous:
+            jobs.append((module.generate_heterogeneous_temporal_graph, kwargs))
+        else:
+            jobs.append((module.generate_temporal_graph, kwargs))
+
+    return jobs
+
+
+def get_spatial_temporal_jobs(module, root_data, args):
+    """
+    Get the jobs of the spatial-temporal graph generator for every video of the synthetic AVA features
+    """
+
+    gen_args = argparse.Namespace(ec_mode=args.ec_mode, time_span=args.time_span, tau=args.tau, compact_edges=args.compact_edges)
+
+    jobs = []
+    for sp in ('train', 'val'):
+        path_graphs = os.path.join(root_data, f'graphs/bench_spatial-temporal/{sp}')
+        os.makedirs(path_graphs, exist_ok=True)
+        path_features = os.path.join(root_data, f'features/synthava/{sp}')
+        for file_name in sorted(os.listdir(path_features)):
+            jobs.append((module.generate_graph, {'data_file': os.path.join(path_features, file_name), 'args': gen_args, 'path_graphs': path_graphs, 'sp': sp}))
+
+    return jobs
+
+
+def _get_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    """
+    Benchmark the graph generators on synthetic videos: data/generate_temporal_graphs.py,
+    data/generate_heterogeneous_temporal_graphs.py (with text features) and data/generate_spatial-temporal_graphs.py
+    (with AVA-like features of "num_persons" persons per frame)
+    The videos are generated one after the other in this process, and the time of every video is split into
+        load:       loading the features, labels and batch indices
+        edges:      building the temporal, cross-view and spatial edges
+        similarity: building the similarity-based edges
+        tensorize:  everything else (node features, labels and graph tensors)
+        save:       saving the graphs
+    Features are memory-mapped, so reading them is part of the tensorize stage where they are copied into the graph
+    The median over the repeats is reported as JSON (sorted keys) to be compared across commits
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--generators',    type=str,   help='Graph generators to benchmark', nargs='+',
+                        choices=['temporal', 'heterogeneous', 'spatial-temporal'], default=['temporal', 'heterogeneous', 'spatial-temporal'])
+    parser.add_argument('--root_data',     type=str,   help='Directory of the synthetic data (default: a temporary directory that is removed)')
+    parser.add_argument('--output',        type=str,   help='Path to the JSON results (default: printed)')
+    parser.add_argument('--num_videos',    type=int,   help='Number of synthetic videos', default=4)
+    parser.add_argument('--num_frames',    type=int,   help='Lengths of the synthetic videos (cycled through)', nargs='+', default=[2000])
+    parser.add_argument('--num_views',     type=int,   help='Number of views of every video (the ego view and num_views-1 exo views)', default=1)
+    parser.add_argument('--feature_dim',   type=int,   help='Dimension of the features', default=1536)
+    parser.add_argument('--text_dim',      type=int,   help='Dimension of the text features', default=768)
+    parser.add_argument('--num_classes',   type=int,   help='Number of action classes', default=20)
+    parser.add_argument('--segment_length', type=int,  help='Number of frames of every segment (batch index)', default=8)
+    parser.add_argument('--num_persons',   type=int,   help='Number of persons per frame of the AVA-like videos', default=3)
+    parser.add_argument('--framewise',     help='Build the graphs with a node per frame pooled by segment (load_segmentwise: False)', action="store_true")
+    parser.add_argument('--tauf',          type=int,   help='Maximum frame difference between neighboring nodes', default=10)
+    parser.add_argument('--skip_factor',   type=int,   help='Make additional connections between non-adjacent nodes', default=0)
+    parser.add_argument('--similarity_metric', type=str, help='Similarity metric of the similarity-based edges', default=None)
+    parser.add_argument('--similarity_threshold', type=float, help='Similarity threshold of the similarity-based edges', default=0.9)
+    parser.add_argument('--similarity_topk', type=int, help='Number of similarity-based edges per node (instead of the threshold)', default=None)
+    parser.add_argument('--view_hub',      help='Connect the views through a hub node per frame', action="store_true")
+    parser.add_argument('--compact_edges', help='Store the edges as int32 CSR with int8 edge types', action="store_true")
+    parser.add_argument('--ec_mode',       type=str,   help='Edge connection mode of the spatial-temporal graphs (csi | cdi)', default='csi')
+    parser.add_argument('--time_span',     type=float, help='Maximum time span of the spatial-temporal graphs in seconds', default=90)
+    parser.add_argument('--tau',           type=float, help='Maximum time difference between neighboring nodes in seconds', default=0.9)
+    parser.add_argument('--repeats',       type=int,   help='Number of runs of every generator', default=3)
+    parser.add_argument('--seed',          type=int,   help='Random seed of the synthetic data', default=0)
+
+    args = parser.parse_args()
+
+    root_data = args.root_data or tempfile.mkdtemp(prefix='gravit_bench_')
+    try:
+        if not os.path.exists(os.path.join(root_data, 'annotations/synth/mapping.txt')):
+            make_synthetic_videos(root_data, args)
+        if 'spatial-temporal' in args.generators and not os.path.isdir(os.path.join(root_data, 'features/synthava')):
+            make_synthetic_ava(root_data, args)
+
+        timer = StageTimer()
+        similarity_patches = [(graph_builder, 'get_similarity_edges', 'similarity'), (graph_builder, 'get_topk_similarity_edges', 'similarity')]
+        results = {}
+        for name in args.generators:
+            if name == 'spatial-temporal':
+                module = _load_script('generate_spatial-temporal_graphs')
+                jobs = get_spatial_temporal_jobs(module, root_data, args)
+                patches = [(module, 'load_columns', 'load'), (module, '_get_time_windows', 'edges'), (module, '_get_window_edges', 'edges')]
+            else:
+                heterogeneous = name == 'heterogeneous'
+                module = _load_script('generate_heterogeneous_temporal_graphs' if heterogeneous else 'generate_temporal_graphs')
+                jobs = get_temporal_jobs(module, root_data, args, heterogeneous=heterogeneous)
+                patches = [(module, func, 'load') for func in ('load_features', 'load_labels', 'load_labels_raw', 'load_batch_indices', 'reduce_segments')]
+                patches += [(module, 'get_video_edges', 'edges')] + similarity_patches
+                if heterogeneous:
+                    patches.append((module, 'get_frame_aligned_edges', 'edges'))
+
+            list_runs = []
+            for _ in range(args.repeats):
+                # The edge templates are built again in every run, as in a new generation process
+                graph_builder.get_temporal_edges_cached.cache_clear()
+                list_runs.append(_run_generator(jobs, patches, (module, 'save_graph'), timer))
+
+            stages = {stage: round(float(np.median([run[0][stage] for run in list_runs])), 4) for stage in STAGES}
+            total = float(np.median([run[1] for run in list_runs]))
+            results[name] = {'stages_s': stages, 'total_s': round(total, 4), 'ms_per_graph': round(total / max(list_runs[0][2]['graphs'], 1) * 1e3, 3),
+                             **list_runs[0][2]}
+
+            print(f'{name:<17} total {total:8.3f} s | ' + ' | '.join(f'{stage} {stages[stage]:7.3f} s' for stage in STAGES) +
+                  f' | {results[name]["graphs"]} graphs, {results[name]["nodes"]} nodes, {results[name]["edges"]} edges')
+    finally:
+        if args.root_data is None:
+            shutil.rmtree(root_data, ignore_errors=True)
+
+    params = {k: v for k, v in vars(args).items() if k not in ('root_data', 'output', 'generators')}
+    report = {'commit': _get_commit(),
+              'environment': {'python': platform.python_version(), 'numpy': np.__version__, 'torch': torch.__version__},
+              'params': params,
+              'results': results}
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        print(f'Results are saved at {args.output}')
+    else:
+        print(json.dumps(report, indent=2, sort_keys=True))
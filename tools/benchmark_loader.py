@@ -0,0 +1,80 @@
+import os
+import time
+import torch
+import argparse
+import torch.optim as optim
+from torch_geometric.loader import DataLoader
+from gravit.utils.parser import get_cfg
+from gravit.models import build_model, get_loss_func
+from gravit.datasets import get_graph_dataset, get_loader_kwargs, get_device_loader
+from gravit.utils.compact_edges import expand_edges
+
+
+def _time_steps(dataset, cfg, device, num_steps):
+    """
+    Get the number of training steps per second of the SPELL trainer (loading, forward, backward and optimizer step)
+    over at most "num_steps" batches, with the loaders configured by cfg; the first batch is used for warm-up
+    """
+
+    torch.manual_seed(0)
+    model = build_model(cfg, device)
+    model.train()
+    loss_func = get_loss_func(cfg)
+    optimizer = optim.Adam(model.parameters(), lr=cfg['lr'], weight_decay=cfg['wd'])
+    loader = get_device_loader(DataLoader(dataset, **get_loader_kwargs(cfg, dataset)), device, cfg)
+
+    num_done = 0
+    start = None
+    for data in loader:
+        optimizer.zero_grad()
+        data = expand_edges(data.to(device))
+        c = data.c if cfg['use_spf'] else None
+        logits = model(data.x, data.edge_index, data.edge_attr, c)
+        loss = loss_func(logits, data.y)
+        loss.backward()
+        optimizer.step()
+        loss.item()
+
+        if start is None:
+            start = time.perf_counter()
+            continue
+        num_done += 1
+        if num_done == num_steps:
+            break
+
+    return num_done / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    """
+    Compare the training steps per second of the SPELL trainer with the loaders of the configuration
+    (loader_workers, persistent_workers, prefetch_factor, pin_memory and device_prefetch)
+    with the default ones (graphs loaded in the main process, no device prefetching)
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cfg',             type=str,   help='Path to the configuration file', required=True)
+    parser.add_argument('--root_data',       type=str,   help='Root directory to the data', default='./data')
+    parser.add_argument('--split',           type=int,   help='Which fold to use for cross-validation')
+    parser.add_argument('--loader_workers',  type=int,   help='Number of worker processes of the data loaders (default: from the config)')
+    parser.add_argument('--device_prefetch', type=int,   help='Number of batches copied to the device in advance (default: from the config)')
+    parser.add_argument('--num_steps',       type=int,   help='Number of training steps to benchmark', default=100)
+
+    args = parser.parse_args()
+    num_steps = args.num_steps
+    delattr(args, 'num_steps')
+    cfg = get_cfg(args)
+
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    path_graphs = os.path.join(cfg['root_data'], f'graphs/{cfg["graph_name"]}')
+    if cfg['split'] is not None:
+        path_graphs = os.path.join(path_graphs, f'split{cfg["split"]}')
+    dataset = get_graph_dataset(os.path.join(path_graphs, 'train'), cfg)
+
+    cfg_default = {**cfg, 'loader_workers': 0, 'pin_memory': False, 'device_prefetch': 0}
+    steps_default = _time_steps(dataset, cfg_default, device, num_steps)
+    steps_loader = _time_steps(dataset, cfg, device, num_steps)
+
+    print(f'default loader ({device.type}):   {steps_default:8.2f} steps/s')
+    print(f'configured loader ({device.type}): {steps_loader:8.2f} steps/s '
+          f'(loader_workers {cfg["loader_workers"] or 0}, device_prefetch {cfg["device_prefetch"] or 0}, speedup {steps_loader / steps_default:.2f}x)')
@@ -0,0 +1,111 @@
+import time
+import torch
+import argparse
+import numpy as np
+import torch.optim as optim
+from torch_geometric.data import Data
+from gravit.utils.parser import get_cfg
+from gravit.models import build_model, get_loss_func
+from gravit.utils.graph_builder import get_video_edges, get_view_hub_features, VIEW_HUB_LABEL
+
+
+def get_synthetic_graph(num_frame, num_view, cfg, view_hub, rng):
+    """
+    Build the multiview temporal graph of a synthetic video with random features and labels,
+    with the exo-exo cross-view edges or the view hub nodes
+    """
+
+    list_feature = [rng.standard_normal((num_frame, cfg['input_dim'])).astype(np.float32) for _ in range(num_view)]
+    label = np.tile(rng.integers(0, cfg['final_dim'], num_frame), num_view)
+    node_source, node_target, edge_attr, _ = get_video_edges(list_feature[0], cfg['tauf'], skip_factor=cfg['skip_factor'],
+                                                             num_view=num_view, view_hub=view_hub)
+
+    x = np.concatenate(list_feature)
+    if view_hub and num_view > 1:
+        x = np.concatenate((x, get_view_hub_features(list_feature)))
+        label = np.concatenate((label, np.full(num_frame, VIEW_HUB_LABEL)))
+
+    return Data(x = torch.from_numpy(x),
+                edge_index = torch.from_numpy(np.stack((node_source, node_target))),
+                edge_attr = torch.tensor(edge_attr),
+                y = torch.from_numpy(label))
+
+
+def _time_epoch(list_graphs, cfg, device):
+    """
+    Get the time of a single training epoch over the graphs (in seconds) and the peak memory allocated on the GPU
+    (in bytes, 0 on the CPU); the first step is run once before for warm-up
+    """
+
+    model = build_model(cfg, device)
+    model.train()
+    loss_func = get_loss_func(cfg)
+    optimizer = optim.Adam(model.parameters(), lr=cfg['lr'], weight_decay=cfg['wd'])
+
+    def step(data):
+        optimizer.zero_grad()
+        logits = model(data.x, data.edge_index, data.edge_attr, None)
+        loss = loss_func(logits, data.y)
+        loss.backward()
+        optimizer.step()
+
+    step(list_graphs[0].to(device))
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+        torch.cuda.reset_peak_memory_stats()
+
+    start = time.perf_counter()
+    for data in list_graphs:
+        step(data.to(device))
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+
+    peak_memory = torch.cuda.max_memory_allocated() if device.type == 'cuda' else 0
+    return time.perf_counter() - start, peak_memory
+
+
+if __name__ == "__main__":
+    """
+    Compare the cross-view topologies of the multiview temporal graphs on synthetic videos:
+    exo-exo edges between every pair of views (default) and a view hub node per frame ("view_hub: True")
+    For every number of views, report the number of nodes and edges per graph, the memory of a graph,
+    and the time of a SPELL training epoch
+    """
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cfg',           type=str,   help='Path to the configuration file (model and graph parameters)', required=True)
+    parser.add_argument('--num_views',     type=int,   help='Numbers of views to benchmark', nargs='+', default=[1, 4, 8])
+    parser.add_argument('--num_frames',    type=int,   help='Number of frames of each synthetic video', default=1000)
+    parser.add_argument('--num_videos',    type=int,   help='Number of synthetic videos in an epoch', default=8)
+    parser.add_argument('--seed',          type=int,   help='Random seed of the synthetic videos', default=0)
+
+    args = parser.parse_args()
+    num_views = args.num_views
+    num_frames = args.num_frames
+    num_videos = args.num_videos
+    seed = args.seed
+    for k in ('num_views', 'num_frames', 'num_videos', 'seed'):
+        delattr(args, k)
+    cfg = get_cfg(args)
+    cfg.setdefault('skip_factor', 0)
+
+    device = torch.device('cuda:0' if torch.cuda.is_available() else 'cpu')
+    print(f'{num_videos} videos of {num_frames} frames | tauf: {cfg["tauf"]} | skip_factor: {cfg["skip_factor"]} | device: {device.type}')
+    print(f'{"views":>5} {"topology":>9} {"nodes":>8} {"edges":>10} {"cross-view":>11} {"edge MB":>8} {"graph MB":>9} {"epoch s":>8} {"peak GPU MB":>12}')
+
+    for num_view in num_views:
+        for view_hub in (False, True):
+            if view_hub and num_view == 1:
+                continue
+
+            rng = np.random.default_rng(seed)
+            list_graphs = [get_synthetic_graph(num_frames, num_view, cfg, view_hub, rng) for _ in range(num_videos)]
+            data = list_graphs[0]
+            num_cross = int((data.edge_attr == -2).sum())
+            edge_bytes = data.edge_index.nbytes + data.edge_attr.nbytes
+            graph_bytes = edge_bytes + data.x.nbytes + data.y.nbytes
+            epoch_time, peak_memory = _time_epoch(list_graphs, cfg, device)
+
+            topology = 'hub' if view_hub else 'exo-exo'
+            print(f'{num_view:>5} {topology:>9} {data.num_nodes:>8} {data.num_edges:>10} {num_cross:>11} {edge_bytes/2**20:>8.2f} '
+                  f'{graph_bytes/2**20:>9.2f} {epoch_time:>8.2f} {peak_memory/2**20:>12.1f}')
@@ -7,8 +7,9 @@ from torch_geometric.loader import DataLoader, DataListLoader
 from gravit.utils.parser import get_cfg
 from gravit.utils.logger import get_logger
 from gravit.models import build_model
-from gravit.datasets import GraphDataset
-from gravit.utils.formatter import get_formatting_data_dict, get_formatted_preds, get_formatted_preds_egoexo_omnivore, get_formatted_preds_framewise
+from gravit.datasets import GraphDataset, OnlineGraphDataset, get_graph_dataset
+from gravit.utils.compact_edges import expand_edges
+from gravit.utils.formatter import get_formatting_data_dict, get_formatted_preds, get_formatted_preds_egoexo_omnivore, get_formatted_preds_framewise, stitch_window_logits
 from gravit.utils.eval_tool import get_eval_score, plot_predictions, error_analysis
 from gravit.utils.formatter import get_formatting_data_dict, get_formatted_preds
 from gravit.utils.eval_tool import get_eval_score
@@ -52,7 +53,15 @@ def evaluate(cfg):
     # model = DataParallel(model, device_ids=[0, 1])
 
     print(f'Loading the data from {path_graphs}')
-    val_loader = DataLoader(GraphDataset(os.path.join(path_graphs, 'val')))
+    if cfg.get('online_graphs', False):
+        # Build the graphs from the features at loading time
+        # (single view when evaluating a multiview model, unless cfg['eval_multiview'] is set)
+        path_features = os.path.join(cfg['root_data'], f'features/{cfg["features_dataset"]}/split{cfg["split"]}')
+        cfg_eval = dict(cfg)
+        cfg_eval['add_multiview'] = cfg.get('eval_multiview', False)
+        val_loader = DataLoader(OnlineGraphDataset(os.path.join(path_features, 'val'), cfg_eval))
+    else:
+        val_loader = DataLoader(get_graph_dataset(os.path.join(path_graphs, 'val'), cfg))
     # val_loader = DataListLoader(GraphDataset(os.path.join(path_graphs, 'val')))
    
     num_val_graphs = len(val_loader)
@@ -71,11 +80,14 @@ def evaluate(cfg):
     logger.info('Evaluation process started')
 
     preds_all = []
+    # Core outputs of the window graphs of the videos that are not complete yet
+    windows = {}
     with torch.no_grad():
         print(f'Num batches: {len(val_loader)}')
         print(f'Batch size: {cfg["batch_size"]}')
         
         for i, data in enumerate(val_loader, 1):
+            data = expand_edges(data)
             g = data.g.tolist()
             x = data.x.to(device)
             y = data.y.to(device) 
@@ -99,13 +111,21 @@ def evaluate(cfg):
             logits = model(x, edge_index, edge_attr, c, batch=batch)
             # logits = model(data)
 
+            # Window graphs: only the core frames are kept, and the video is evaluated once all its windows are stitched
+            num_labels = len(y)
+            if 'window' in data.keys():
+                logits = stitch_window_logits(cfg, windows, g[0], data.window[0].tolist(), logits)
+                if logits is None:
+                    logger.info(f'[{i:04d}|{num_val_graphs:04d}] processed')
+                    continue
+                num_labels = int(data.window[0, 4])
 
             # Change the format of the model output
             preds = get_formatted_preds(cfg, logits, g, data_dict)
-            if len(preds[0][1]) != len(y):
+            if len(preds[0][1]) != num_labels:
                 print(len(preds[0]))
                 print(len(preds[0][1]))
-                print(f'Preds and labels are not the same length: {len(preds[0][1])} vs {len(y)}')
+                print(f'Preds and labels are not the same length: {len(preds[0][1])} vs {num_labels}')
 
             # plot_predictions(cfg, preds)
             preds_all.extend(preds)
@@ -7,7 +7,7 @@ from gravit.utils.parser import get_cfg
 from gravit.utils.logger import get_logger
 # from gravit.models import build_model
 from gravit.models.context_reasoning import SPELL_HETEROGENEOUS
-from gravit.datasets import GraphDataset
+from gravit.datasets import SharedEdgeLoader, get_graph_dataset
 from gravit.utils.formatter import get_formatting_data_dict, get_formatted_preds, get_formatted_preds_egoexo_omnivore, get_formatted_preds_framewise
 from gravit.utils.eval_tool import get_eval_score, plot_predictions, error_analysis
 
@@ -42,7 +42,7 @@ def evaluate_heterogeneous(cfg):
 
 
     print(f'Loading the data from {os.path.join(path_graphs, "val")}')
-    val_loader = DataLoader(GraphDataset(os.path.join(path_graphs, 'val')))
+    val_loader = SharedEdgeLoader(get_graph_dataset(os.path.join(path_graphs, 'val'), cfg))
    
     num_val_graphs = len(val_loader)
     print(f'Number of validation graphs: {num_val_graphs}')
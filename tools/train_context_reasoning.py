@@ -7,7 +7,8 @@ from torch_geometric.nn import pool
 from gravit.utils.parser import get_args, get_cfg
 from gravit.utils.logger import get_logger
 from gravit.models import build_model, get_loss_func
-from gravit.datasets import GraphDataset
+from gravit.datasets import OnlineGraphDataset, get_graph_dataset, get_crop_dataset, get_loader_kwargs, get_device_loader
+from gravit.utils.compact_edges import expand_edges
 
 from gravit.utils.formatter import get_formatting_data_dict, get_formatted_preds, get_formatted_preds_egoexo_omnivore, get_formatted_preds_framewise
 from gravit.utils.eval_tool import get_eval_score
@@ -52,8 +53,22 @@ def train(cfg):
     model.to(device)
 
 
-    train_loader = DataLoader(GraphDataset(os.path.join(path_graphs, 'train')), batch_size=cfg['batch_size'], shuffle=True)
-    val_loader = DataLoader(GraphDataset(os.path.join(path_graphs, 'val')))
+    if cfg.get('online_graphs', False):
+        # Build the graphs from the features at loading time with the graph parameters of the configuration
+        path_features = os.path.join(cfg['root_data'], f'features/{cfg["features_dataset"]}')
+        if cfg['split'] is not None:
+            path_features = os.path.join(path_features, f'split{cfg["split"]}')
+        train_dataset = OnlineGraphDataset(os.path.join(path_features, 'train'), cfg)
+        val_dataset = OnlineGraphDataset(os.path.join(path_features, 'val'), cfg)
+    else:
+        train_dataset = get_graph_dataset(os.path.join(path_graphs, 'train'), cfg)
+        val_dataset = get_graph_dataset(os.path.join(path_graphs, 'val'), cfg)
+
+    # Random temporal crops of the training graphs (the validation graphs are kept whole)
+    train_dataset = get_crop_dataset(train_dataset, cfg)
+
+    train_loader = get_device_loader(DataLoader(train_dataset, **get_loader_kwargs(cfg, train_dataset)), device, cfg)
+    val_loader = get_device_loader(DataLoader(val_dataset, **get_loader_kwargs(cfg)), device, cfg)
    
     # Prepare the experiment
     loss_func = get_loss_func(cfg)
@@ -76,7 +91,7 @@ def train(cfg):
         loss_sum = 0
         for data in train_loader:
             optimizer.zero_grad()
-            data = data.to(device)
+            data = expand_edges(data.to(device))
 
             x = data.x.to(device)
             y = data.y.to(device)
@@ -140,6 +155,7 @@ def val(val_loader, use_spf, model, device, loss_func):
     predictions = []
     with torch.no_grad():
         for data in val_loader:  
+            data = expand_edges(data.to(device))
             x, y = data.x.to(device), data.y.to(device)
             # y = torch.cat([dt.y for dt in data], 0).to(device)
             # x = torch.cat([dt.x for dt in data], 0).to(device)
@@ -7,7 +7,7 @@ from torch_geometric.nn import pool
 from gravit.utils.parser import get_args, get_cfg
 from gravit.utils.logger import get_logger
 from gravit.models import build_model, get_loss_func
-from gravit.datasets import GraphDataset
+from gravit.datasets import SharedEdgeLoader, get_graph_dataset, get_loader_kwargs, get_device_loader
 
 from gravit.utils.formatter import get_formatting_data_dict, get_formatted_preds, get_formatted_preds_egoexo_omnivore, get_formatted_preds_framewise
 from gravit.utils.eval_tool import get_eval_score
@@ -47,8 +47,9 @@ def train(cfg):
     model.to(device)
 
     print(f'Loading the data from {path_graphs}')
-    train_loader = DataLoader(GraphDataset(os.path.join(path_graphs, 'train')), batch_size=cfg['batch_size'], shuffle=True)
-    val_loader = DataLoader(GraphDataset(os.path.join(path_graphs, 'val')))
+    train_dataset = get_graph_dataset(os.path.join(path_graphs, 'train'), cfg)
+    train_loader = get_device_loader(SharedEdgeLoader(train_dataset, **get_loader_kwargs(cfg, train_dataset)), device, cfg)
+    val_loader = get_device_loader(SharedEdgeLoader(get_graph_dataset(os.path.join(path_graphs, 'val'), cfg), **get_loader_kwargs(cfg)), device, cfg)
    
     # Prepare the experiment
     loss_func = get_loss_func(cfg)